@@ -1,11 +1,10 @@
 import click
-import boto3
-import yaml
 import os
 from datetime import datetime
 
-from aws_dataflow_simulator import config, utils_dataset
-from aws_dataflow_simulator.dataflow import stream as dataflow_stream
+# only lightweight modules are imported here, the heavy ones (pandas, boto3)
+# are imported by the commands that need them to keep the CLI startup fast
+from aws_dataflow_simulator import config
 
 
 @click.group()
@@ -134,8 +133,11 @@ def configure(
         },
     }
 
-    with open("dataflow_config.yaml", "w") as file:
+    import yaml
+
+    with open(config.CONFIG_FILEPATH, "w") as file:
         yaml.dump(config_data, file)
+    config.aws_config.reload()
 
     click.echo("dataflow_config.yaml file generated successfully.")
 
@@ -146,13 +148,42 @@ def s3():
     pass
 
 
+def transfer_options(command):
+    """Part size and concurrency options shared by the S3 transfer commands."""
+    command = click.option(
+        "--force",
+        is_flag=True,
+        help="Transfer even if the size and ETag show the file is unchanged.",
+    )(command)
+    command = click.option(
+        "--concurrency",
+        type=int,
+        default=10,
+        show_default=True,
+        help="Number of parts transferred at a time.",
+    )(command)
+    command = click.option(
+        "--part-size-mb",
+        type=int,
+        default=8,
+        show_default=True,
+        help="Size of each multipart part in MB, at least 5.",
+    )(command)
+    return command
+
+
 @s3.command()
 @click.argument("file_path")
 @click.argument("s3_key")
 @click.argument("bucket_name")
 @click.option("--confirm", is_flag=True, help="Confirm before uploading")
-def upload(file_path, s3_key, bucket_name, confirm):
-    """Upload a file to S3."""
+@transfer_options
+def upload(file_path, s3_key, bucket_name, confirm, part_size_mb, concurrency, force):
+    """Upload a file to S3.
+
+    Large files are uploaded in parts concurrently. An interrupted upload
+    resumes from the parts already on S3 when the command is run again.
+    """
     if not os.path.isfile(file_path):
         click.echo(f"Error: File '{file_path}' does not exist.")
         return
@@ -163,9 +194,19 @@ def upload(file_path, s3_key, bucket_name, confirm):
         ):
             click.echo("Upload cancelled.")
             return
-    s3 = boto3.client("s3")
+    from aws_dataflow_simulator import utils_s3
+
+    transfer = utils_s3.S3Transfer(
+        part_size=part_size_mb * 1024 * 1024, concurrency=concurrency
+    )
+    progress = utils_s3.TransferProgress(os.path.getsize(file_path), label=file_path)
     try:
-        s3.upload_file(file_path, bucket_name, s3_key)
+        if not transfer.upload(
+            file_path, bucket_name, s3_key, force=force, progress=progress
+        ):
+            click.echo(f"File s3://{bucket_name}/{s3_key} is unchanged, skipping.")
+            return
+        progress.close()
         click.echo(f"File {file_path} uploaded to s3://{bucket_name}/{s3_key}")
     except Exception as e:
         click.echo(f"Error uploading file: {e}")
@@ -175,11 +216,24 @@ def upload(file_path, s3_key, bucket_name, confirm):
 @click.argument("s3_key")
 @click.argument("file_path")
 @click.argument("bucket_name")
-def download(s3_key, file_path, bucket_name):
+@transfer_options
+def download(s3_key, file_path, bucket_name, part_size_mb, concurrency, force):
     """Download a file from S3."""
-    s3 = boto3.client("s3")
+    from aws_dataflow_simulator import utils_s3
+
+    transfer = utils_s3.S3Transfer(
+        part_size=part_size_mb * 1024 * 1024, concurrency=concurrency
+    )
     try:
-        s3.download_file(bucket_name, s3_key, file_path)
+        progress = utils_s3.TransferProgress(
+            transfer.object_size(bucket_name, s3_key), label=s3_key
+        )
+        if not transfer.download(
+            bucket_name, s3_key, file_path, force=force, progress=progress
+        ):
+            click.echo(f"File {file_path} is unchanged, skipping.")
+            return
+        progress.close()
         click.echo(f"File s3://{bucket_name}/{s3_key} downloaded to {file_path}")
     except Exception as e:
         click.echo(f"Error downloading file: {e}")
@@ -192,13 +246,57 @@ def dataset():
 
 
 @dataset.command()
-def prepare():
+@click.option(
+    "--chunksize",
+    type=int,
+    default=None,
+    help="Process the dataset out-of-core, holding this many rows in memory at a time.",
+)
+@click.option(
+    "--tmp-dir",
+    default=None,
+    help="Directory for the sorted runs of an out-of-core prepare.",
+)
+@click.option(
+    "--output-format",
+    type=click.Choice(["csv", "parquet"]),
+    default="csv",
+    show_default=True,
+    help="File format of the processed dataset.",
+)
+@click.option(
+    "--index/--no-index",
+    default=True,
+    show_default=True,
+    help="Write the replay index next to the processed dataset, "
+    "used by the streamer to seek and split the replay without reading it.",
+)
+@click.option(
+    "--cache/--no-cache",
+    default=True,
+    show_default=True,
+    help="Skip the prepare if the dataset and its settings are unchanged, "
+    "and only prepare the rows appended to the dataset since the last run.",
+)
+def prepare(chunksize, tmp_dir, output_format, index, cache):
     """Preparing dataset for streaming."""
+    from aws_dataflow_simulator import utils_dataset
+    from aws_dataflow_simulator.dataflow.prepare_cache import (
+        APPEND,
+        FRESH,
+        PrepareCache,
+    )
+    from aws_dataflow_simulator.dataflow.replay_index import (
+        index_path,
+        write_replay_index,
+    )
+
     click.echo("Preparing dataset for streaming.")
     dataset_path = config.get_dataset_filepath(processed=False)
     apply_delay = config.get_apply_delay()
     delay_ms = config.get_delay_ms()
     timestamp_column_name = config.get_colname_dt()
+    timestamp_format = config.get_dt_format()
     start_datetime = config.get_first_event_dt()
 
     click.echo(f"Preparing dataset {dataset_path} for streaming.")
@@ -210,17 +308,146 @@ def prepare():
                 f"Calculating event delay using dt column {timestamp_column_name}"
             )
 
-    df_processed = utils_dataset.preprocess_dataset(
-        dataset_path=dataset_path,
-        start_datetime=start_datetime,
-        apply_delay=apply_delay,
-        delay_ms=delay_ms,
-        timestamp_column_name=timestamp_column_name,
-    )
-
     base_name, ext = os.path.splitext(dataset_path)
+    if output_format == "parquet":
+        ext = ".parquet"
     new_filepath = f"{base_name}_processed{ext}"
-    df_processed.to_csv(new_filepath, index=False)
+
+    prepare_cache = PrepareCache(
+        dataset_path,
+        new_filepath,
+        settings={
+            "apply_delay": apply_delay,
+            "delay_ms": delay_ms,
+            "colname_dt": timestamp_column_name,
+            "first_event_dt": start_datetime,
+            "dt_format": timestamp_format,
+        },
+    )
+    status = prepare_cache.status() if cache else None
+    rows = None
+    if status == FRESH:
+        click.echo(f"{new_filepath} is up to date, skipping.")
+        if index and not os.path.exists(index_path(new_filepath)):
+            index_filepath = write_replay_index(new_filepath, chunksize or 1_000_000)
+            click.echo(f"Wrote replay index to {index_filepath}.")
+        return
+    if status == APPEND:
+        appended = prepare_cache.append()
+        if appended is not None:
+            rows = prepare_cache.rows() + appended
+            click.echo(f"Appended {appended} new rows to {new_filepath}.")
+        else:
+            click.echo("The new rows cannot be appended, preparing the whole dataset.")
+
+    if rows is None and chunksize:
+        rows = utils_dataset.preprocess_dataset_chunked(
+            dataset_path=dataset_path,
+            output_path=new_filepath,
+            start_datetime=start_datetime,
+            apply_delay=apply_delay,
+            delay_ms=delay_ms,
+            timestamp_column_name=timestamp_column_name,
+            chunksize=chunksize,
+            tmp_dir=tmp_dir,
+            timestamp_format=timestamp_format,
+        )
+        click.echo(f"Wrote {rows} rows to {new_filepath}.")
+    elif rows is None:
+        df_processed = utils_dataset.preprocess_dataset(
+            dataset_path=dataset_path,
+            start_datetime=start_datetime,
+            apply_delay=apply_delay,
+            delay_ms=delay_ms,
+            timestamp_column_name=timestamp_column_name,
+            timestamp_format=timestamp_format,
+        )
+        utils_dataset.save_processed_dataset(df_processed, new_filepath)
+        rows = len(df_processed)
+        click.echo(f"Wrote {rows} rows to {new_filepath}.")
+    if cache:
+        prepare_cache.save(rows)
+
+    if index:
+        index_filepath = write_replay_index(new_filepath, chunksize or 1_000_000)
+        click.echo(f"Wrote replay index to {index_filepath}.")
+
+
+@dataset.command()
+@click.option("--rows", type=int, required=True, help="Number of rows to generate.")
+@click.option(
+    "--schema",
+    "schema_path",
+    default=None,
+    help="JSON schema of the columns, learned from the configured dataset if unset.",
+)
+@click.option(
+    "--from",
+    "source_path",
+    default=None,
+    help="Dataset to learn the schema from instead of the configured one.",
+)
+@click.option(
+    "--save-schema",
+    default=None,
+    help="Save the learned schema as JSON, e.g. to edit it for later runs.",
+)
+@click.option("--output-dir", default=None, help="Directory the shards are written to.")
+@click.option(
+    "--output-format",
+    type=click.Choice(["csv", "parquet"]),
+    default="csv",
+    show_default=True,
+    help="File format of the shards.",
+)
+@click.option("--shard-rows", type=int, default=None, help="Rows per shard.")
+@click.option(
+    "--processes",
+    type=int,
+    default=None,
+    help="Number of generating processes, one per CPU by default.",
+)
+@click.option("--seed", type=int, default=0, show_default=True)
+def synthesize(
+    rows,
+    schema_path,
+    source_path,
+    save_schema,
+    output_dir,
+    output_format,
+    shard_rows,
+    processes,
+    seed,
+):
+    """Generate a synthetic dataset shaped like the configured one."""
+    from aws_dataflow_simulator.dataflow import synthesize as synth
+
+    if schema_path:
+        schema = synth.load_schema(schema_path)
+    else:
+        source_path = source_path or config.get_dataset_filepath(processed=False)
+        click.echo(f"Learning schema from {source_path}.")
+        schema = synth.learn_schema(
+            str(source_path),
+            timestamp_column_name=config.get_colname_dt(),
+            sample_rows=config.get_synthesize_sample_rows(),
+            max_categories=config.get_synthesize_max_categories(),
+        )
+    if save_schema:
+        synth.save_schema(schema, save_schema)
+        click.echo(f"Saved schema to {save_schema}.")
+
+    output_dir = output_dir or config.get_synthesize_output_dir()
+    paths = synth.synthesize_dataset(
+        schema,
+        rows,
+        output_dir,
+        output_format=output_format,
+        shard_rows=shard_rows or config.get_synthesize_shard_rows(),
+        processes=processes or config.get_synthesize_processes(),
+        seed=seed,
+    )
+    click.echo(f"Wrote {rows} rows in {len(paths)} shards to {output_dir}.")
 
 
 @click.group()
@@ -230,15 +457,208 @@ def flow():
 
 
 @flow.command()
-def stream():
+@click.option(
+    "--batch/--no-batch",
+    default=None,
+    help="Group events into PutRecords calls. Defaults to stream.batch_mode in config.",
+)
+@click.option(
+    "--speed",
+    type=float,
+    default=None,
+    help="Replay speed multiplier, e.g. 10 for 10x. Defaults to stream.speed in config.",
+)
+@click.option(
+    "--checkpoint",
+    default=None,
+    help="Local file or s3:// URI of the replay checkpoint. "
+    "Defaults to stream.checkpoint_path in config.",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=None,
+    help="Resume from the checkpoint instead of the first row. "
+    "Defaults to stream.resume in config.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of workers splitting the replay. Without --worker-index, "
+    "runs them all as local processes. Defaults to stream.workers in config.",
+)
+@click.option(
+    "--worker-index",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Run only this worker of a partitioned replay. "
+    "Defaults to stream.worker_index in config.",
+)
+@click.option(
+    "--partition-by",
+    type=click.Choice(["key", "range"]),
+    default=None,
+    help="Split the replay by partition key or into contiguous slices. "
+    "Range slices follow each other on the shared clock, so only key "
+    "partitioning adds throughput. Defaults to stream.partition_by in config.",
+)
+@click.option(
+    "--start-at",
+    default=None,
+    help="Shared start of a partitioned replay, epoch seconds or ISO 8601. "
+    "Defaults to stream.start_at in config.",
+)
+@click.option(
+    "--start-from",
+    default=None,
+    help="Skip the events before this colname_dt timestamp, "
+    "using the replay index. Defaults to stream.start_from in config.",
+)
+@click.option(
+    "--source",
+    type=click.Choice(["s3", "local"]),
+    default=None,
+    help="Read the prepared dataset from S3 or memory-map the local file. "
+    "Defaults to stream.source in config.",
+)
+@click.option(
+    "--aggregate/--no-aggregate",
+    default=None,
+    help="Pack events into KPL aggregated records. "
+    "Defaults to stream.aggregate in config.",
+)
+@click.option(
+    "--amplify",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Send every row as this many events with their own partition keys. "
+    "Defaults to stream.amplify in config.",
+)
+def stream(
+    batch,
+    speed,
+    checkpoint,
+    resume,
+    workers,
+    worker_index,
+    partition_by,
+    start_at,
+    start_from,
+    source,
+    aggregate,
+    amplify,
+):
     """Preparing dataset for streaming."""
-    dataflow_stream.CSVtoStream().start_stream()
+    from aws_dataflow_simulator.dataflow import stream as dataflow_stream
+
+    stream_kwargs = dict(
+        batch_mode=batch,
+        speed=speed,
+        checkpoint_path=checkpoint,
+        resume=resume,
+        partition_by=partition_by,
+        start_from=start_from,
+        source=source,
+        aggregate=aggregate,
+        amplify=amplify,
+    )
+    workers = workers or config.get_stream_workers()
+    if worker_index is None:
+        worker_index = config.get_stream_worker_index()
+    if workers > 1 and worker_index is None:
+        dataflow_stream.run_workers(workers, start_at=start_at, **stream_kwargs)
+        return
+
+    dataflow_stream.CSVtoStream(
+        workers=workers, worker_index=worker_index, start_at=start_at, **stream_kwargs
+    ).start_stream()
 
 
 @flow.command()
-def batch():
-    """Preparing dataset for batch update."""
-    pass
+@click.option(
+    "--batch/--no-batch",
+    default=None,
+    help="Group events into PutRecords calls. Defaults to stream.batch_mode in config.",
+)
+@click.option(
+    "--speed",
+    type=float,
+    default=None,
+    help="Replay speed multiplier. Defaults to stream.speed in config.",
+)
+@click.option(
+    "--source",
+    type=click.Choice(["s3", "local"]),
+    default=None,
+    help="Read the prepared datasets from S3 or memory-map the local files. "
+    "Defaults to stream.source in config.",
+)
+def merge(batch, speed, source):
+    """Replay the stream.sources datasets merged by event time."""
+    from aws_dataflow_simulator.dataflow.merge import MergedStream
+
+    MergedStream(batch_mode=batch, speed=speed, source=source).start_stream()
+
+
+@flow.command()
+@click.option(
+    "--checkpoint-file",
+    default=None,
+    help="Local JSON file with the last sequence number per shard, used to resume.",
+)
+@click.option(
+    "--from-latest",
+    is_flag=True,
+    help="Start shards without a checkpoint at LATEST instead of TRIM_HORIZON.",
+)
+@click.option(
+    "--follow/--no-follow",
+    default=False,
+    help="Keep polling for new events instead of stopping once caught up.",
+)
+def consume(checkpoint_file, from_latest, follow):
+    """Read the events of the Kinesis stream from all shards in parallel."""
+    from aws_dataflow_simulator import utils_kinesis
+
+    utils_kinesis.KinesisConsumer(
+        stream_name=config.get_kinesis_stream_name(),
+        process_records=utils_kinesis.print_records,
+        checkpoint_path=checkpoint_file,
+        iterator_type="LATEST" if from_latest else "TRIM_HORIZON",
+        stop_at_latest=not follow,
+    ).run()
+
+
+@flow.command()
+@click.option(
+    "--window",
+    type=click.Choice(["hour", "day"]),
+    default=None,
+    help="Length of the time windows dropped as batches. Defaults to batch.window in config.",
+)
+@click.option(
+    "--speed",
+    type=float,
+    default=None,
+    help="Replay speed multiplier, e.g. 8760 lays down a year in an hour. Defaults to batch.speed in config.",
+)
+@click.option(
+    "--s3-prefix",
+    default=None,
+    help="S3 prefix of the partitioned objects. Defaults to batch.s3_prefix in config.",
+)
+@click.option(
+    "--tmp-dir",
+    default=None,
+    help="Directory where the windows are staged before upload.",
+)
+def batch(window, speed, s3_prefix, tmp_dir):
+    """Drop the dataset on S3 as hourly or daily batches along its timeline."""
+    from aws_dataflow_simulator.dataflow import batch as dataflow_batch
+
+    dataflow_batch.CSVtoBatch(
+        window=window, speed=speed, s3_prefix=s3_prefix
+    ).start_batch(tmp_dir=tmp_dir)
 
 
 # Add the s3 and dataset groups to the main CLI group
@@ -0,0 +1,46 @@
+"""Shared AWS clients, created on first use."""
+
+import threading
+from typing import Any, Dict, Tuple
+
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+
+_clients: Dict[Tuple[str, int], Any] = {}
+_lock = threading.Lock()
+
+
+def get_client(
+    service_name: str, max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS
+):
+    """Get the shared boto3 client of a service, creating it on first use.
+
+    boto3 is only imported when the first client is needed. Clients are
+    thread-safe once created, so every module and thread shares one client,
+    and its connection pool, per service and pool size.
+
+    Args:
+        service_name (str): AWS service, e.g. "s3" or "kinesis".
+        max_pool_connections (int): Size of the HTTP connection pool, raise it
+            when more threads than the default 10 use the client at once.
+    """
+    key = (service_name, max(max_pool_connections, DEFAULT_MAX_POOL_CONNECTIONS))
+    client = _clients.get(key)
+    if client is None:
+        # creating clients on the default boto3 session is not thread-safe
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                import boto3
+                from botocore.config import Config as BotoConfig
+
+                client = boto3.client(
+                    service_name, config=BotoConfig(max_pool_connections=key[1])
+                )
+                _clients[key] = client
+    return client
+
+
+def clear_clients() -> None:
+    """Drop the shared clients, e.g. after the AWS credentials changed."""
+    with _lock:
+        _clients.clear()
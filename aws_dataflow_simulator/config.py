@@ -1,12 +1,68 @@
 """Configuration."""
 
 import os
+import threading
 
+from collections.abc import MutableMapping
 from pathlib import Path
-import yaml
+from typing import Any, Iterator, List, Optional
 
-with open("dataflow_config.yaml", "r") as file:
-    aws_config = yaml.safe_load(file)
+CONFIG_FILEPATH = "dataflow_config.yaml"
+
+
+class LazyConfig(MutableMapping):
+    """dataflow_config.yaml, read and parsed on first access only.
+
+    Commands that do not need the config (e.g. --help or configure) never
+    pay for parsing it and do not fail when the file does not exist yet,
+    in which case the config is empty.
+    """
+
+    def __init__(self, filepath: str = CONFIG_FILEPATH):
+        self.filepath = filepath
+        self._data = None
+        self._lock = threading.Lock()
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = self._load()
+        return self._data
+
+    def _load(self) -> dict:
+        if not os.path.isfile(self.filepath):
+            return {}
+        import yaml
+
+        with open(self.filepath, "r") as file:
+            return yaml.safe_load(file) or {}
+
+    def reload(self) -> None:
+        """Read the file again on next access."""
+        self._data = None
+
+    def copy(self) -> dict:
+        return dict(self.data)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.data[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self.data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+aws_config = LazyConfig()
 
 
 def get_dataset_filepath(processed: bool = True) -> Path:
@@ -87,3 +143,220 @@ def get_colname_dt() -> int:
     if colname_dt == "":
         return None
     return colname_dt
+
+
+def get_dt_format() -> Optional[str]:
+    """Get format of the colname_dt timestamps, e.g. epoch_ms, None to infer it."""
+    return aws_config.get("dataset", {}).get("dt_format")
+
+
+def get_stream_batch_mode() -> bool:
+    """Get if events should be grouped into PutRecords calls."""
+    return aws_config.get("stream", {}).get("batch_mode", False)
+
+
+def get_stream_batch_linger_ms() -> float:
+    """Get how long events may wait in a batch before it is flushed."""
+    return aws_config.get("stream", {}).get("batch_linger_ms", 100)
+
+
+def get_stream_speed() -> float:
+    """Get replay speed multiplier, e.g. 10 replays the timeline 10x faster."""
+    return aws_config.get("stream", {}).get("speed", 1.0)
+
+
+def get_stream_lag_policy() -> str:
+    """Get how late events are handled, either catchup or shed."""
+    return aws_config.get("stream", {}).get("lag_policy", "catchup")
+
+
+def get_stream_max_lag_ms() -> float:
+    """Get lag in milliseconds above which events are dropped by the shed policy."""
+    return aws_config.get("stream", {}).get("max_lag_ms", 1000)
+
+
+def get_stream_concurrency() -> Optional[int]:
+    """Get number of concurrent sender lanes, None means one lane per shard."""
+    return aws_config.get("stream", {}).get("concurrency")
+
+
+def get_stream_queue_size() -> int:
+    """Get maximum number of events queued for each sender lane."""
+    return aws_config.get("stream", {}).get("queue_size", 10000)
+
+
+def get_stream_serialize_batch_size() -> int:
+    """Get number of rows read and serialized into events at a time."""
+    return aws_config.get("stream", {}).get("serialize_batch_size", 1000)
+
+
+def get_stream_checkpoint_path() -> Optional[str]:
+    """Get local path or s3:// URI of the replay checkpoint, None to disable it."""
+    return aws_config.get("stream", {}).get("checkpoint_path")
+
+
+def get_stream_checkpoint_interval_s() -> float:
+    """Get number of seconds between replay checkpoints."""
+    return aws_config.get("stream", {}).get("checkpoint_interval_s", 10)
+
+
+def get_stream_resume() -> bool:
+    """Get if a replay resumes from its checkpoint instead of the first row."""
+    return aws_config.get("stream", {}).get("resume", True)
+
+
+def get_stream_workers() -> int:
+    """Get number of workers replaying disjoint parts of the dataset."""
+    # set per task by the StreamingStack
+    workers = os.getenv("WORKER_COUNT")
+    if workers:
+        return int(workers)
+    return aws_config.get("stream", {}).get("workers", 1)
+
+
+def get_stream_worker_index() -> Optional[int]:
+    """Get index of this worker, None to run all workers as local processes."""
+    worker_index = os.getenv("WORKER_INDEX")
+    if worker_index:
+        return int(worker_index)
+    return aws_config.get("stream", {}).get("worker_index")
+
+
+def get_stream_partition_by() -> str:
+    """Get how the dataset is split between workers, either key or range."""
+    return aws_config.get("stream", {}).get("partition_by", "key")
+
+
+def get_stream_start_at() -> Optional[str]:
+    """Get shared start of the replay, ISO 8601 datetime or epoch seconds."""
+    return os.getenv("REPLAY_START_AT") or aws_config.get("stream", {}).get("start_at")
+
+
+def get_stream_start_from() -> Optional[str]:
+    """Get dataset timestamp (colname_dt) to start the replay from."""
+    return aws_config.get("stream", {}).get("start_from")
+
+
+def get_stream_source() -> str:
+    """Get where the dataset is streamed from, "s3" or a memory-mapped "local" file."""
+    return aws_config.get("stream", {}).get("source", "s3")
+
+
+def get_stream_aggregate() -> bool:
+    """Get if events are packed into KPL aggregated records."""
+    return aws_config.get("stream", {}).get("aggregate", False)
+
+
+def get_stream_aggregation_max_bytes() -> int:
+    """Get maximum size in bytes of an aggregated record."""
+    return aws_config.get("stream", {}).get("aggregation_max_bytes", 51200)
+
+
+def get_stream_amplify() -> int:
+    """Get number of events sent for every dataset row, 1 disables amplification."""
+    return aws_config.get("stream", {}).get("amplify", 1)
+
+
+def get_stream_amplify_jitter_ms() -> Optional[float]:
+    """Get largest offset of an amplified event, None spreads up to the next row."""
+    return aws_config.get("stream", {}).get("amplify_jitter_ms")
+
+
+def get_stream_sources() -> List[dict]:
+    """Get prepared datasets merged by event time in a merged replay."""
+    return aws_config.get("stream", {}).get("sources") or []
+
+
+def get_stream_rate_limit() -> bool:
+    """Get if writes are paced to the per-shard Kinesis write limits."""
+    return aws_config.get("stream", {}).get("rate_limit", True)
+
+
+def get_stream_shard_records_per_s() -> int:
+    """Get number of records per second each shard accepts."""
+    return aws_config.get("stream", {}).get("shard_records_per_s", 1000)
+
+
+def get_stream_shard_bytes_per_s() -> int:
+    """Get number of bytes per second each shard accepts."""
+    return aws_config.get("stream", {}).get("shard_bytes_per_s", 1048576)
+
+
+def get_batch_window() -> str:
+    """Get length of the time windows dropped as batches, either hour or day."""
+    return aws_config.get("batch", {}).get("window", "hour")
+
+
+def get_batch_speed() -> float:
+    """Get replay speed multiplier for releasing batch windows."""
+    return aws_config.get("batch", {}).get("speed", 1.0)
+
+
+def get_batch_s3_prefix() -> str:
+    """Get S3 prefix under which the batch windows are written."""
+    return aws_config.get("batch", {}).get("s3_prefix", "batch")
+
+
+def get_batch_processes() -> Optional[int]:
+    """Get number of partitioning processes, None means one per CPU."""
+    return aws_config.get("batch", {}).get("processes")
+
+
+def get_batch_upload_concurrency() -> int:
+    """Get number of part files uploaded to S3 at a time."""
+    return aws_config.get("batch", {}).get("upload_concurrency", 8)
+
+
+def get_batch_chunksize() -> int:
+    """Get number of dataset rows partitioned per task."""
+    return aws_config.get("batch", {}).get("chunksize", 1_000_000)
+
+
+def get_synthesize_output_dir() -> str:
+    """Get directory the synthetic dataset shards are written to."""
+    return aws_config.get("synthesize", {}).get("output_dir", "data/synthetic")
+
+
+def get_synthesize_shard_rows() -> int:
+    """Get number of rows of every synthetic dataset shard."""
+    return aws_config.get("synthesize", {}).get("shard_rows", 1_000_000)
+
+
+def get_synthesize_processes() -> Optional[int]:
+    """Get number of generating processes, None means one per CPU."""
+    return aws_config.get("synthesize", {}).get("processes")
+
+
+def get_synthesize_sample_rows() -> int:
+    """Get number of dataset rows read to learn a synthetic schema."""
+    return aws_config.get("synthesize", {}).get("sample_rows", 100_000)
+
+
+def get_synthesize_max_categories() -> int:
+    """Get most distinct values of a string column sampled as categories."""
+    return aws_config.get("synthesize", {}).get("max_categories", 1000)
+
+
+def get_metrics_interval_s() -> float:
+    """Get how often producer metrics are exported, in seconds."""
+    return aws_config.get("metrics", {}).get("interval_s", 10)
+
+
+def get_metrics_jsonl_path() -> Optional[str]:
+    """Get file to append metric snapshots to as JSON lines, None disables it."""
+    return aws_config.get("metrics", {}).get("jsonl_path")
+
+
+def get_metrics_prometheus_port() -> Optional[int]:
+    """Get port serving metrics in Prometheus text format, None disables it."""
+    return aws_config.get("metrics", {}).get("prometheus_port")
+
+
+def get_metrics_emf() -> bool:
+    """Get if metrics are printed as CloudWatch Embedded Metric Format logs."""
+    return aws_config.get("metrics", {}).get("emf", False)
+
+
+def get_metrics_namespace() -> str:
+    """Get CloudWatch namespace of the EMF metrics."""
+    return aws_config.get("metrics", {}).get("namespace", "DataflowSimulator")
@@ -0,0 +1,212 @@
+"""KPL aggregated records: many user records packed into one Kinesis record.
+
+An aggregated record is the KPL magic number, an AggregatedRecord protobuf
+message and the MD5 digest of that message:
+
+    message AggregatedRecord {
+        repeated string partition_key_table = 1;
+        repeated string explicit_hash_key_table = 2;
+        repeated Record records = 3;
+    }
+    message Record {
+        required uint64 partition_key_index = 1;
+        optional uint64 explicit_hash_key_index = 2;
+        required bytes data = 3;
+        repeated Tag tags = 4;
+    }
+
+The protobuf wire format is written and read by hand, it only takes varints
+and length-delimited fields, so no protobuf dependency is needed. Records
+written here are read by the KCL and the aws-kinesis-agg deaggregators.
+"""
+
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+MAGIC = b"\xf3\x89\x9a\xc2"
+DIGEST_SIZE = 16
+
+# default maximum size of an aggregated record, the KPL AggregationMaxSize
+DEFAULT_MAX_BYTES = 51200
+
+# protobuf wire types
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH_DELIMITED = 2
+_FIXED32 = 5
+
+# tags, (field number << 3) | wire type
+_PARTITION_KEY_TABLE = b"\x0a"
+_RECORDS = b"\x1a"
+_PARTITION_KEY_INDEX = b"\x08"
+_DATA = b"\x1a"
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _varint_size(value: int) -> int:
+    return max(1, (value.bit_length() + 6) // 7)
+
+
+def _field_size(payload_size: int) -> int:
+    """Size of a length-delimited field with a one byte tag."""
+    return 1 + _varint_size(payload_size) + payload_size
+
+
+class RecordAggregator:
+    """Pack user records into one KPL aggregated record.
+
+    Keeps the exact size of the aggregated record as records are added, so
+    a caller can send it before the next record would take it over a limit.
+    Partition keys are stored once in the key table and referenced by index.
+    """
+
+    def __init__(self):
+        self._keys: Dict[str, int] = {}
+        self._key_fields: List[bytes] = []
+        self._record_fields: List[bytes] = []
+        self.size = len(MAGIC) + DIGEST_SIZE
+
+    def __len__(self) -> int:
+        return len(self._record_fields)
+
+    @property
+    def partition_key(self) -> Optional[str]:
+        """Partition key of the first record, the key to send the aggregate with."""
+        return next(iter(self._keys), None)
+
+    def size_with(self, data: bytes, partition_key: str) -> int:
+        """Size of the aggregated record after adding a record."""
+        key_index = self._keys.get(partition_key)
+        size = self.size
+        if key_index is None:
+            key_index = len(self._keys)
+            size += _field_size(len(partition_key.encode("utf-8")))
+        return size + _field_size(self._record_size(key_index, data))
+
+    def add(self, data: bytes, partition_key: str) -> None:
+        key_index = self._keys.get(partition_key)
+        if key_index is None:
+            key_index = self._keys[partition_key] = len(self._keys)
+            key = partition_key.encode("utf-8")
+            field = _PARTITION_KEY_TABLE + _varint(len(key)) + key
+            self._key_fields.append(field)
+            self.size += len(field)
+
+        record = (
+            _PARTITION_KEY_INDEX
+            + _varint(key_index)
+            + _DATA
+            + _varint(len(data))
+            + data
+        )
+        field = _RECORDS + _varint(len(record)) + record
+        self._record_fields.append(field)
+        self.size += len(field)
+
+    def serialize(self) -> Tuple[bytes, str]:
+        """Encode the aggregated record and start a new one.
+
+        Returns:
+            Tuple[bytes, str]: The record data and its partition key.
+        """
+        message = b"".join(self._key_fields + self._record_fields)
+        partition_key = self.partition_key
+        self.__init__()
+        return MAGIC + message + hashlib.md5(message).digest(), partition_key
+
+    @staticmethod
+    def _record_size(key_index: int, data: bytes) -> int:
+        return 1 + _varint_size(key_index) + _field_size(len(data))
+
+
+def _read_varint(buffer: memoryview, position: int) -> Tuple[int, int]:
+    value, shift = 0, 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+
+
+def _iter_fields(buffer: memoryview):
+    """Yield the field number and value of every field of a protobuf message."""
+    position = 0
+    while position < len(buffer):
+        tag, position = _read_varint(buffer, position)
+        field_number, wire_type = tag >> 3, tag & 0x07
+        if wire_type == _VARINT:
+            value, position = _read_varint(buffer, position)
+        elif wire_type == _LENGTH_DELIMITED:
+            size, position = _read_varint(buffer, position)
+            value = buffer[position : position + size]
+            position += size
+        elif wire_type == _FIXED64:
+            value, position = buffer[position : position + 8], position + 8
+        elif wire_type == _FIXED32:
+            value, position = buffer[position : position + 4], position + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}.")
+        if position > len(buffer):
+            raise ValueError("Truncated protobuf message.")
+        yield field_number, value
+
+
+def is_aggregated(data: bytes) -> bool:
+    """Check the magic number and digest of a KPL aggregated record."""
+    if len(data) < len(MAGIC) + DIGEST_SIZE or not data.startswith(MAGIC):
+        return False
+    message = data[len(MAGIC) : -DIGEST_SIZE]
+    return hashlib.md5(message).digest() == data[-DIGEST_SIZE:]
+
+
+def deaggregate(data: bytes) -> List[Tuple[str, Optional[str], bytes]]:
+    """Unpack a KPL aggregated record.
+
+    Returns:
+        List[Tuple[str, Optional[str], bytes]]: Partition key, explicit hash
+            key and data of every user record.
+
+    Raises:
+        ValueError: The data is not a valid aggregated record.
+    """
+    if not is_aggregated(data):
+        raise ValueError("Not a KPL aggregated record.")
+    message = memoryview(data)[len(MAGIC) : -DIGEST_SIZE]
+    partition_keys, explicit_hash_keys, records = [], [], []
+    for field_number, value in _iter_fields(message):
+        if field_number == 1:
+            partition_keys.append(str(value, "utf-8"))
+        elif field_number == 2:
+            explicit_hash_keys.append(str(value, "utf-8"))
+        elif field_number == 3:
+            records.append(value)
+
+    user_records = []
+    for record in records:
+        key_index, hash_key_index, record_data = None, None, b""
+        for field_number, value in _iter_fields(record):
+            if field_number == 1:
+                key_index = value
+            elif field_number == 2:
+                hash_key_index = value
+            elif field_number == 3:
+                record_data = bytes(value)
+        if key_index is None or key_index >= len(partition_keys):
+            raise ValueError("Aggregated record with an invalid partition key index.")
+        explicit_hash_key = (
+            explicit_hash_keys[hash_key_index]
+            if hash_key_index is not None and hash_key_index < len(explicit_hash_keys)
+            else None
+        )
+        user_records.append((partition_keys[key_index], explicit_hash_key, record_data))
+    return user_records
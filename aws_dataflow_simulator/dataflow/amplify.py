@@ -0,0 +1,127 @@
+"""Amplify a replay: send every dataset row as several events with their own keys."""
+
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from aws_dataflow_simulator.dataflow.serialization import DELAY_COLUMN
+
+# separator between the original partition key and the variant number
+KEY_SEPARATOR = "#"
+
+
+def variant_key(partition_key: str, variant: int) -> str:
+    """Partition key of a variant, the original key for the first one."""
+    return f"{partition_key}{KEY_SEPARATOR}{variant}" if variant else partition_key
+
+
+def variant_offsets(
+    delays_ms: np.ndarray,
+    factor: int,
+    jitter_ms: Optional[float],
+    rng: np.random.Generator,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Offsets and delays of the `factor` variants of every row.
+
+    The first variant is the original event. The others are placed at random
+    within `jitter_ms` after it, never beyond the next row's event, so the
+    variants of consecutive rows do not interleave and the delays of a row's
+    variants add up to its original delay.
+
+    Args:
+        delays_ms (np.ndarray): time_till_next_event_ms of every row.
+        factor (int): Number of events per row.
+        jitter_ms (Optional[float]): Largest offset of a variant from the
+            original event, None to spread them up to the next event.
+        rng (np.random.Generator): Source of the offsets.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Offset from the original event and
+            delay to the next event of every variant, of shape (rows, factor).
+    """
+    delays_ms = np.maximum(np.asarray(delays_ms, dtype=float), 0)
+    spread_ms = delays_ms if jitter_ms is None else np.minimum(delays_ms, jitter_ms)
+    offsets_ms = np.zeros((len(delays_ms), factor))
+    offsets_ms[:, 1:] = np.sort(
+        rng.random((len(delays_ms), factor - 1)) * spread_ms[:, None], axis=1
+    )
+    variant_delays_ms = np.diff(
+        np.concatenate([offsets_ms, delays_ms[:, None]], axis=1), axis=1
+    )
+    return offsets_ms, variant_delays_ms
+
+
+def amplify_rows(
+    rows: List[dict],
+    factor: int,
+    jitter_ms: Optional[float],
+    rng: np.random.Generator,
+    timestamp_column_name: Optional[str] = None,
+    key_column: Optional[str] = None,
+) -> List[dict]:
+    """Fan CSV rows out into `factor` variants each.
+
+    Variants get the partition key, key_column or by default the first
+    column, suffixed with their number, their delay and, if the rows have
+    `timestamp_column_name`, a timestamp shifted by their offset.
+    """
+    if factor <= 1 or not rows:
+        return rows
+    offsets_ms, delays_ms = variant_offsets(
+        [float(row.get(DELAY_COLUMN) or 0) for row in rows], factor, jitter_ms, rng
+    )
+    key_column = key_column or next(iter(rows[0]))
+    variants = []
+    for row, row_offsets_ms, row_delays_ms in zip(
+        rows, offsets_ms.tolist(), delays_ms.tolist()
+    ):
+        timestamp = None
+        if timestamp_column_name and row.get(timestamp_column_name):
+            timestamp = datetime.fromisoformat(str(row[timestamp_column_name]))
+        for variant, (offset_ms, delay_ms) in enumerate(
+            zip(row_offsets_ms, row_delays_ms)
+        ):
+            event = dict(row)
+            event[key_column] = variant_key(str(row[key_column]), variant)
+            if timestamp is not None and variant:
+                event[timestamp_column_name] = str(
+                    timestamp + timedelta(milliseconds=offset_ms)
+                )
+            event[DELAY_COLUMN] = delay_ms
+            variants.append(event)
+    return variants
+
+
+def amplify_frame(
+    df,
+    factor: int,
+    jitter_ms: Optional[float],
+    rng: np.random.Generator,
+    timestamp_column_name: Optional[str] = None,
+    key_column: Optional[str] = None,
+):
+    """Fan the rows of a DataFrame out into `factor` variants each, like amplify_rows."""
+    if factor <= 1 or not len(df):
+        return df
+    import pandas as pd
+
+    if DELAY_COLUMN in df.columns:
+        delays_ms = df[DELAY_COLUMN].fillna(0).astype(float).to_numpy()
+    else:
+        delays_ms = np.zeros(len(df))
+    offsets_ms, variant_delays_ms = variant_offsets(delays_ms, factor, jitter_ms, rng)
+
+    variants = df.iloc[np.repeat(np.arange(len(df)), factor)].reset_index(drop=True)
+    numbers = np.tile(np.arange(factor), len(df))
+    key_column = key_column or variants.columns[0]
+    keys = variants[key_column].astype(str)
+    suffixed = keys + KEY_SEPARATOR + pd.Series(numbers.astype(str))
+    variants[key_column] = keys.where(numbers == 0, suffixed)
+    if timestamp_column_name in variants.columns:
+        timestamps = pd.to_datetime(variants[timestamp_column_name], format="ISO8601")
+        variants[timestamp_column_name] = timestamps + pd.to_timedelta(
+            offsets_ms.ravel(), unit="ms"
+        )
+    variants[DELAY_COLUMN] = variant_delays_ms.ravel()
+    return variants
@@ -0,0 +1,275 @@
+import logging
+import os
+import shutil
+import tempfile
+from collections import defaultdict
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from boto3.s3.transfer import TransferConfig
+
+import aws_dataflow_simulator.config as config
+from aws_dataflow_simulator.clients import get_client
+from aws_dataflow_simulator.dataflow.scheduler import EventScheduler
+from aws_dataflow_simulator.exceptions import CouldNotUploadFileToS3
+from aws_dataflow_simulator.utils_dataset import is_parquet
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# pandas offset alias of each window length
+WINDOWS = {"hour": "h", "day": "D"}
+
+# multipart settings of every window upload
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+MULTIPART_CONCURRENCY = 4
+
+
+def partition_key(window_start: pd.Timestamp, window: str) -> str:
+    """Hive-style partition path of a window, e.g. dt=2024-08-19/hour=15."""
+    if window == "hour":
+        return f"dt={window_start:%Y-%m-%d}/hour={window_start:%H}"
+    return f"dt={window_start:%Y-%m-%d}"
+
+
+def partition_chunk(
+    chunk_index: int,
+    df: pd.DataFrame,
+    colname_dt: str,
+    window: str,
+    staging_dir: str,
+    parquet: bool,
+) -> Dict[pd.Timestamp, str]:
+    """Split one chunk of the dataset into one part file per time window.
+
+    Runs in a worker process. Every window of the chunk is written to
+    `<staging_dir>/<partition>/part-<chunk_index>.<ext>`.
+
+    Returns:
+        Dict[pd.Timestamp, str]: Path of the part file of every window.
+    """
+    timestamps = pd.to_datetime(df[colname_dt], format="ISO8601")
+    parts = {}
+    for window_start, window_df in df.groupby(
+        timestamps.dt.floor(WINDOWS[window]), sort=False
+    ):
+        window_dir = os.path.join(staging_dir, partition_key(window_start, window))
+        os.makedirs(window_dir, exist_ok=True)
+        if parquet:
+            path = os.path.join(window_dir, f"part-{chunk_index:05d}.parquet")
+            window_df.to_parquet(path, index=False)
+        else:
+            path = os.path.join(window_dir, f"part-{chunk_index:05d}.csv")
+            window_df.to_csv(path, index=False)
+        parts[window_start] = path
+    return parts
+
+
+class CSVtoBatch:
+    """Lay down the prepared dataset on S3 as time partitioned batch drops.
+
+    The dataset is split into hourly or daily windows by `colname_dt` in a
+    process pool, one chunk of rows per task. Each window is then uploaded
+    to `s3://<bucket>/<prefix>/dt=<date>[/hour=<hour>]/` once its end is
+    reached on the dataset timeline, replayed `speed` times faster than real
+    time, so the bucket fills up the way a daily or hourly batch export
+    would. Part files are uploaded concurrently, each as a multipart upload.
+    """
+
+    def __init__(
+        self,
+        window: Optional[str] = None,
+        speed: Optional[float] = None,
+        s3_prefix: Optional[str] = None,
+    ):
+        """Read the environmental variables."""
+        self.bucket_name: str = config.get_s3_bucket_name()
+        self.dataset_filepath: str = config.get_dataset_filepath(processed=True)
+        self.colname_dt: Optional[str] = config.get_colname_dt()
+        self.window: str = window or config.get_batch_window()
+        self.speed: float = config.get_batch_speed() if speed is None else speed
+        self.s3_prefix: str = (
+            config.get_batch_s3_prefix() if s3_prefix is None else s3_prefix
+        ).strip("/")
+        self.processes: Optional[int] = config.get_batch_processes()
+        self.upload_concurrency: int = config.get_batch_upload_concurrency()
+        self.chunksize: int = config.get_batch_chunksize()
+
+        if not self.colname_dt:
+            raise ValueError("colname_dt must be set in dataflow_config.yaml.")
+        if self.window not in WINDOWS:
+            raise ValueError(f"window must be one of {tuple(WINDOWS)}.")
+
+        # every upload thread runs several multipart requests at a time
+        self._transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_CHUNKSIZE,
+            max_concurrency=MULTIPART_CONCURRENCY,
+        )
+        self._s3_client = get_client(
+            "s3", max_pool_connections=self.upload_concurrency * MULTIPART_CONCURRENCY
+        )
+
+    @property
+    def window_length(self) -> pd.Timedelta:
+        return pd.Timedelta(1, unit=WINDOWS[self.window])
+
+    def iter_chunks(self) -> Iterator[pd.DataFrame]:
+        """Read the prepared dataset `chunksize` rows at a time."""
+        if is_parquet(self.dataset_filepath):
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError(
+                    "Reading Parquet datasets requires pyarrow, "
+                    "install aws-dataflow-simulator with the parquet extra."
+                )
+            parquet_file = pq.ParquetFile(self.dataset_filepath)
+            for record_batch in parquet_file.iter_batches(batch_size=self.chunksize):
+                yield record_batch.to_pandas()
+        else:
+            yield from pd.read_csv(self.dataset_filepath, chunksize=self.chunksize)
+
+    def partition(self, staging_dir: str) -> Dict[pd.Timestamp, List[str]]:
+        """Split the dataset into part files per window with a process pool.
+
+        At most two chunks per worker are in flight, so memory stays bounded
+        by the chunk size however large the dataset is.
+
+        Returns:
+            Dict[pd.Timestamp, List[str]]: Part files of every window.
+        """
+        windows = defaultdict(list)
+        parquet = is_parquet(self.dataset_filepath)
+        workers = self.processes or os.cpu_count() or 1
+        max_pending = 2 * workers
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for chunk_index, df in enumerate(self.iter_chunks()):
+                df.columns = [col.lower() for col in df.columns]
+                if self.colname_dt not in df.columns:
+                    raise ValueError(
+                        f"The column '{self.colname_dt}' was not found in the dataset."
+                    )
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._collect_parts(done, windows)
+                pending.add(
+                    pool.submit(
+                        partition_chunk,
+                        chunk_index,
+                        df,
+                        self.colname_dt,
+                        self.window,
+                        staging_dir,
+                        parquet,
+                    )
+                )
+            self._collect_parts(wait(pending).done, windows)
+
+        for parts in windows.values():
+            parts.sort()
+        return dict(sorted(windows.items()))
+
+    @staticmethod
+    def _collect_parts(futures, windows: Dict[pd.Timestamp, List[str]]) -> None:
+        for future in futures:
+            for window_start, path in future.result().items():
+                windows[window_start].append(path)
+
+    def get_scheduler(self) -> EventScheduler:
+        """Create the scheduler that releases windows along the dataset timeline."""
+        return EventScheduler(speed=self.speed)
+
+    def upload_part(self, path: str, staging_dir: str) -> Tuple[str, int]:
+        """Upload one part file, returning its S3 key and size."""
+        key = "/".join(
+            filter(None, [self.s3_prefix, os.path.relpath(path, staging_dir)])
+        ).replace(os.sep, "/")
+        try:
+            self._s3_client.upload_file(
+                path, self.bucket_name, key, Config=self._transfer_config
+            )
+        except Exception as e:
+            raise CouldNotUploadFileToS3(
+                f"Failed to upload {path} to s3://{self.bucket_name}/{key}: {e}"
+            )
+        return key, os.path.getsize(path)
+
+    def release(
+        self, windows: Dict[pd.Timestamp, List[str]], staging_dir: str
+    ) -> Tuple[int, int]:
+        """Upload every window once its end is reached on the replay clock.
+
+        Returns:
+            Tuple[int, int]: Number of objects and bytes uploaded.
+        """
+        scheduler = self.get_scheduler()
+        first_window = next(iter(windows), None)
+
+        scheduler.start()
+        with ThreadPoolExecutor(
+            max_workers=self.upload_concurrency, thread_name_prefix="s3-upload"
+        ) as pool:
+            futures = []
+            for window_start, parts in windows.items():
+                window_end = window_start + self.window_length
+                offset_ms = (window_end - first_window).total_seconds() * 1000
+                lag_ms = scheduler.sleep_until(offset_ms)
+                # uploads run in the background while waiting for the next window
+                futures.extend(
+                    pool.submit(self.upload_part, path, staging_dir) for path in parts
+                )
+                logging.info(
+                    {
+                        "message": "Released batch window",
+                        "partition": partition_key(window_start, self.window),
+                        "parts": len(parts),
+                        "lag_ms": round(lag_ms, 3),
+                    }
+                )
+            sizes = [future.result()[1] for future in futures]
+        return len(sizes), sum(sizes)
+
+    def start_batch(self, tmp_dir: Optional[str] = None) -> dict:
+        """Split the dataset into time windows and drop them on AWS S3."""
+        logging.info(
+            {
+                "message": "Starting batch drops",
+                "dataset_filepath": self.dataset_filepath,
+                "s3_bucket": self.bucket_name,
+                "s3_prefix": self.s3_prefix,
+                "window": self.window,
+                "speed": self.speed,
+            }
+        )
+        staging_dir = tempfile.mkdtemp(prefix="dataflowsim-batch-", dir=tmp_dir)
+        try:
+            windows = self.partition(staging_dir)
+            uploaded_objects, uploaded_bytes = self.release(windows, staging_dir)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+        logging.info(
+            {
+                "message": "Batch drops complete",
+                "s3_bucket": self.bucket_name,
+                "s3_prefix": self.s3_prefix,
+                "windows": len(windows),
+                "uploaded_objects": uploaded_objects,
+                "uploaded_bytes": uploaded_bytes,
+            }
+        )
+        return {"statusCode": 200, "body": "Finished batch drops."}
+
+
+if __name__ == "__main__":
+    CSVtoBatch().start_batch()
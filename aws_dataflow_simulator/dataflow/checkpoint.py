@@ -0,0 +1,135 @@
+"""Replay positions saved periodically to resume a stream after a restart."""
+
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional, Tuple
+
+from aws_dataflow_simulator.clients import get_client
+from aws_dataflow_simulator.exceptions import CouldNotLoadFileFromS3
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReplayPosition:
+    """Point of a replay up to which every event has been delivered.
+
+    Attributes:
+        row (int): Number of dataset rows already replayed, sent or shed.
+        byte_offset (int): Offset of the next CSV line in the dataset object,
+            0 for Parquet datasets, which are resumed by row.
+        offset_ms (float): Offset of the next event on the dataset timeline,
+            the logical clock the scheduler continues from.
+        finished (bool): The whole dataset has been replayed.
+    """
+
+    row: int = 0
+    byte_offset: int = 0
+    offset_ms: float = 0.0
+    finished: bool = False
+
+
+def parse_s3_uri(uri: str) -> Optional[Tuple[str, str]]:
+    """Split s3://bucket/key into bucket and key, None for local paths."""
+    if not uri.startswith("s3://"):
+        return None
+    bucket_name, _, key = uri[len("s3://") :].partition("/")
+    return bucket_name, key
+
+
+class ReplayCheckpoint:
+    """Save and load a replay position as JSON, locally or on S3.
+
+    The checkpoint records which dataset object it belongs to, by S3 URI and
+    ETag, so a checkpoint of another dataset or of a dataset that has been
+    overwritten since is ignored instead of seeking to a meaningless offset.
+
+    Args:
+        location (str): Local file path or s3://bucket/key of the checkpoint.
+        dataset (str): S3 URI of the replayed dataset.
+        etag (Optional[str]): ETag of the dataset object.
+    """
+
+    def __init__(self, location: str, dataset: str, etag: Optional[str] = None):
+        self.location = location
+        self.dataset = dataset
+        self.etag = etag
+        self._s3_location = parse_s3_uri(location)
+
+    def load(self) -> Optional[ReplayPosition]:
+        """Read the saved position, None if there is none for this dataset."""
+        data = self._read()
+        if data is None:
+            return None
+        if data.get("dataset") != self.dataset or data.get("etag") != self.etag:
+            logger.warning(
+                {
+                    "message": "Ignoring checkpoint of a different dataset",
+                    "checkpoint": self.location,
+                    "checkpoint_dataset": data.get("dataset"),
+                    "dataset": self.dataset,
+                }
+            )
+            return None
+        return ReplayPosition(**data["position"])
+
+    def save(self, position: ReplayPosition) -> None:
+        """Write the position, logging instead of raising if that fails.
+
+        A failed save only means a restart would resume from an older
+        position, so it does not stop the replay.
+        """
+        body = json.dumps(
+            {
+                "dataset": self.dataset,
+                "etag": self.etag,
+                "position": asdict(position),
+                "updated_at": time.time(),
+            },
+            indent=2,
+        )
+        try:
+            self._write(body)
+        except Exception as e:
+            logger.warning(
+                {
+                    "message": "Could not save replay checkpoint",
+                    "checkpoint": self.location,
+                    "error": str(e),
+                }
+            )
+
+    def _read(self) -> Optional[dict]:
+        if self._s3_location is None:
+            if not os.path.exists(self.location):
+                return None
+            with open(self.location) as file:
+                return json.load(file)
+
+        bucket_name, key = self._s3_location
+        s3_client = get_client("s3")
+        try:
+            response = s3_client.get_object(Bucket=bucket_name, Key=key)
+        except s3_client.exceptions.NoSuchKey:
+            return None
+        except Exception as e:
+            raise CouldNotLoadFileFromS3(
+                f"Could not load checkpoint {key} from bucket {bucket_name}: {str(e)}"
+            )
+        return json.loads(response["Body"].read())
+
+    def _write(self, body: str) -> None:
+        if self._s3_location is None:
+            tmp_filepath = f"{self.location}.tmp"
+            with open(tmp_filepath, "w") as file:
+                file.write(body)
+            os.replace(tmp_filepath, self.location)
+            return
+
+        bucket_name, key = self._s3_location
+        get_client("s3").put_object(
+            Bucket=bucket_name, Key=key, Body=body.encode("utf-8")
+        )
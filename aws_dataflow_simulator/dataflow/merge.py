@@ -0,0 +1,247 @@
+"""Replay several prepared datasets merged into one timeline by event time."""
+
+import heapq
+import logging
+import time
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import aws_dataflow_simulator.config as config
+from aws_dataflow_simulator.dataflow.metrics import ProducerMetrics
+from aws_dataflow_simulator.dataflow.stream import LAG_REPORT_INTERVAL_S, CSVtoStream
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReplaySource:
+    """One prepared dataset of a merged replay and where its events go.
+
+    Attributes:
+        name (str): Name of the source in logs, e.g. transactions.
+        filepath (str): S3 key, or local path, of the prepared dataset.
+        colname_dt (str): Column with the event time of the dataset.
+        kinesis_stream_name (Optional[str]): Stream the events are sent to,
+            the replay's stream if None.
+        partition_key (Optional[str]): Column sent as partition key, the
+            first column if None.
+        key_prefix (str): Prefix of every partition key, e.g. to keep the
+            keys of sources sharing a stream apart.
+    """
+
+    name: str
+    filepath: str
+    colname_dt: str
+    kinesis_stream_name: Optional[str] = None
+    partition_key: Optional[str] = None
+    key_prefix: str = ""
+
+
+def parse_sources(entries: List[dict]) -> List[ReplaySource]:
+    """Read the sources of a merged replay from their config entries.
+
+    Raises:
+        ValueError: An entry misses a field, has an unknown one, or two
+            sources have the same name.
+    """
+    sources = []
+    for entry in entries:
+        try:
+            sources.append(ReplaySource(**entry))
+        except TypeError as e:
+            raise ValueError(f"Invalid replay source {entry}: {e}")
+    names = [source.name for source in sources]
+    if len(set(names)) != len(names):
+        raise ValueError("Every replay source needs a unique name.")
+    return sources
+
+
+def merge_events(
+    event_iterators: List[Iterator[Tuple[float, bytes, str]]]
+) -> Iterator[Tuple[float, int, bytes, str]]:
+    """Merge time ordered events of several sources with a heap.
+
+    Only the next event of every source is held, so memory depends on the
+    number of sources, not on their lengths. Events at the same time are
+    taken in source order.
+
+    Yields:
+        Tuple[float, int, bytes, str]: Event time, index of the source,
+            payload and partition key of every event.
+    """
+
+    def tag(index: int, events: Iterator[Tuple[float, bytes, str]]):
+        for event_ms, event_data, partition_key in events:
+            yield event_ms, index, event_data, partition_key
+
+    return heapq.merge(
+        *(tag(index, events) for index, events in enumerate(event_iterators)),
+        key=itemgetter(0),
+    )
+
+
+class MergedStream:
+    """Replay several prepared datasets as one, interleaved by event time.
+
+    Every source is read lazily by its own CSVtoStream, the events are
+    merged on their colname_dt timestamps and paced on one clock starting at
+    the earliest event. Each event goes to its source's Kinesis stream with
+    its source's partition key scheme. Sources sharing a stream share its
+    sender, and so its rate limits.
+
+    Args:
+        sources (Optional[List[dict]]): Config entries of the sources,
+            stream.sources in config if None.
+        batch_mode (Optional[bool]): Group events into PutRecords calls.
+        speed (Optional[float]): Replay speed multiplier.
+        source (Optional[str]): Read the datasets from "s3" or "local" files.
+    """
+
+    def __init__(
+        self,
+        sources: Optional[List[dict]] = None,
+        batch_mode: Optional[bool] = None,
+        speed: Optional[float] = None,
+        source: Optional[str] = None,
+    ):
+        self.sources = parse_sources(
+            config.get_stream_sources() if sources is None else sources
+        )
+        if not self.sources:
+            raise ValueError("A merged replay needs at least one source.")
+        self.metrics = ProducerMetrics()
+        self.streams = [
+            self._get_source_stream(replay_source, batch_mode, speed, source)
+            for replay_source in self.sources
+        ]
+
+    def _get_source_stream(
+        self,
+        replay_source: ReplaySource,
+        batch_mode: Optional[bool],
+        speed: Optional[float],
+        source: Optional[str],
+    ) -> CSVtoStream:
+        """Create the replay reading one source, without checkpoints or workers."""
+        stream = CSVtoStream(
+            batch_mode=batch_mode,
+            speed=speed,
+            checkpoint_path="",
+            workers=1,
+            worker_index=0,
+            source=source,
+        )
+        stream.dataset_filepath = replay_source.filepath
+        stream.colname_dt = replay_source.colname_dt
+        stream.kinesis_stream_name = (
+            replay_source.kinesis_stream_name or stream.kinesis_stream_name
+        )
+        stream.partition_key_column = replay_source.partition_key
+        stream.metrics = self.metrics
+        return stream
+
+    def get_senders(self) -> Dict[str, object]:
+        """Create one sender per Kinesis stream, by stream name."""
+        senders = {}
+        for stream in self.streams:
+            if stream.kinesis_stream_name not in senders:
+                senders[stream.kinesis_stream_name] = stream.get_sender()
+        return senders
+
+    def iter_events(self) -> Iterator[Tuple[float, int, bytes, str]]:
+        """Events of all sources in event time order, see merge_events."""
+        return merge_events([stream.iter_timed_events() for stream in self.streams])
+
+    def start_stream(self) -> dict:
+        """Send the merged events of all sources along their shared timeline."""
+        primary = self.streams[0]
+        logging.info(
+            {
+                "message": "Starting merged Kinesis stream",
+                "sources": [
+                    {
+                        "name": replay_source.name,
+                        "dataset_filepath": replay_source.filepath,
+                        "kinesis_stream_name": stream.kinesis_stream_name,
+                    }
+                    for replay_source, stream in zip(self.sources, self.streams)
+                ],
+            }
+        )
+        senders = self.get_senders()
+        source_senders = [
+            senders[stream.kinesis_stream_name] for stream in self.streams
+        ]
+        key_prefixes = [replay_source.key_prefix for replay_source in self.sources]
+        scheduler = primary.get_scheduler()
+        reporter = primary.get_metrics_reporter().start()
+        sent_events = [0] * len(self.sources)
+        sent_bytes = 0
+        first_event_ms = None
+        pending_since_ms = None
+        buffered = any(stream.batch_mode or stream.aggregate for stream in self.streams)
+        linger_ms = primary.batch_linger_ms * primary.speed
+        next_report = time.monotonic() + LAG_REPORT_INTERVAL_S
+
+        scheduler.start()
+        try:
+            for event_ms, index, event_data, partition_key in self.iter_events():
+                if first_event_ms is None:
+                    first_event_ms = event_ms
+                offset_ms = event_ms - first_event_ms
+
+                # send buffered events at most batch_linger_ms late
+                if pending_since_ms is not None:
+                    if pending_since_ms + linger_ms <= offset_ms:
+                        scheduler.sleep_until(pending_since_ms + linger_ms)
+                        for sender in senders.values():
+                            sender.flush()
+                        pending_since_ms = None
+
+                if not scheduler.admit(offset_ms):
+                    continue
+                source_senders[index].put(
+                    event_data, partition_key=key_prefixes[index] + partition_key
+                )
+                sent_events[index] += 1
+                sent_bytes += len(event_data)
+                if buffered and pending_since_ms is None:
+                    pending_since_ms = offset_ms
+
+                if time.monotonic() >= next_report:
+                    next_report += LAG_REPORT_INTERVAL_S
+                    self._log_progress(scheduler, sent_events)
+        finally:
+            try:
+                for sender in senders.values():
+                    sender.close()
+            finally:
+                self.metrics.inc("events_sent", sum(sent_events))
+                self.metrics.inc("bytes_sent", sent_bytes)
+                self.metrics.inc("events_shed", scheduler.shed_events)
+                reporter.close()
+        self._log_progress(scheduler, sent_events)
+
+        logging.info(
+            {
+                "message": "Merged streaming to Kinesis complete",
+                "sent_events": sum(sent_events),
+            }
+        )
+        return {"statusCode": 200, "body": "Finished streaming data."}
+
+    def _log_progress(self, scheduler, sent_events: List[int]) -> None:
+        logging.info(
+            {
+                "message": "Merged stream progress",
+                "sent_events": {
+                    replay_source.name: count
+                    for replay_source, count in zip(self.sources, sent_events)
+                },
+                "lag_ms": round(scheduler.lag_ms, 3),
+                "shed_events": scheduler.shed_events,
+            }
+        )
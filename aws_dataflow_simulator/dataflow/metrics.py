@@ -0,0 +1,337 @@
+"""In-memory producer metrics and their periodic export."""
+
+import json
+import logging
+import math
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, TextIO
+
+logger = logging.getLogger(__name__)
+
+# Kinesis error code of records rejected by the per-shard write limits
+THROTTLE_ERROR_CODE = "ProvisionedThroughputExceededException"
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class Counter:
+    """Monotonically increasing, thread-safe count."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Log-linear histogram with a bounded relative error, like HdrHistogram.
+
+    Every power of two is split into `sub_buckets` linear buckets, so a
+    recorded value is off by at most 1/sub_buckets (about 3% with the
+    default) whatever its magnitude, while memory only grows with the
+    number of distinct buckets hit. Values at or below `lowest` share the
+    first bucket, reported as the smallest recorded value.
+    """
+
+    def __init__(self, sub_buckets: int = 32, lowest: float = 1e-3):
+        self.sub_buckets = sub_buckets
+        self.lowest = lowest
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def _index(self, value: float) -> int:
+        if value <= self.lowest:
+            return -(2**31)
+        mantissa, exponent = math.frexp(value)
+        # mantissa is in [0.5, 1), spread it over the sub buckets of its octave
+        return exponent * self.sub_buckets + int((mantissa * 2 - 1) * self.sub_buckets)
+
+    def _upper_bound(self, index: int) -> float:
+        if index == -(2**31):
+            return min(self.min, self.lowest)
+        exponent, sub_bucket = divmod(index, self.sub_buckets)
+        return math.ldexp(1 + (sub_bucket + 1) / self.sub_buckets, exponent - 1)
+
+    def record(self, value: float) -> None:
+        index = self._index(value)
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.sum += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+
+    def record_many(self, values: List[float]) -> None:
+        """Record a list of values, taking the lock once."""
+        if not values:
+            return
+        counts = {}
+        for value in values:
+            index = self._index(value)
+            counts[index] = counts.get(index, 0) + 1
+        with self._lock:
+            for index, count in counts.items():
+                self.counts[index] = self.counts.get(index, 0) + count
+            self.count += len(values)
+            self.sum += sum(values)
+            self.min = min(self.min, min(values))
+            self.max = max(self.max, max(values))
+
+    def percentile(self, percent: float) -> float:
+        """Upper bound of the bucket holding the given percentile, 0 if empty."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = max(1, math.ceil(self.count * percent / 100.0))
+            seen = 0
+            for index in sorted(self.counts):
+                seen += self.counts[index]
+                if seen >= rank:
+                    return min(self._upper_bound(index), self.max)
+            return self.max
+
+    def snapshot(self) -> dict:
+        snapshot = {f"p{p:g}": self.percentile(p) for p in PERCENTILES}
+        with self._lock:
+            snapshot.update(
+                count=self.count,
+                sum=self.sum,
+                min=self.min if self.count else 0.0,
+                max=self.max,
+            )
+        return snapshot
+
+
+class ProducerMetrics:
+    """Counters and histograms of a replay, shared by all sender lanes.
+
+    Recording only updates memory, exporters read snapshots periodically,
+    so the per-event cost does not depend on how metrics are published.
+    schedule_lag_ms holds samples of the lag, not one value per event.
+    """
+
+    COUNTERS = (
+        "events_sent",
+        "events_shed",
+        "bytes_sent",
+        "put_requests",
+        "retried_records",
+        "failed_records",
+        "throttled_records",
+    )
+    HISTOGRAMS = ("send_latency_ms", "batch_size", "schedule_lag_ms")
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.started = clock()
+        self.counters = {name: Counter() for name in self.COUNTERS}
+        self.histograms = {name: Histogram() for name in self.HISTOGRAMS}
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        self.counters[name].inc(amount)
+
+    def observe(self, name: str, value: float) -> None:
+        self.histograms[name].record(value)
+
+    def observe_many(self, name: str, values: List[float]) -> None:
+        self.histograms[name].record_many(values)
+
+    def snapshot(self) -> dict:
+        elapsed_s = self._clock() - self.started
+        counters = {name: counter.value for name, counter in self.counters.items()}
+        return {
+            "timestamp": time.time(),
+            "elapsed_s": elapsed_s,
+            "events_per_s": counters["events_sent"] / elapsed_s if elapsed_s else 0.0,
+            "counters": counters,
+            "histograms": {
+                name: histogram.snapshot()
+                for name, histogram in self.histograms.items()
+            },
+        }
+
+
+def to_prometheus(snapshot: dict, prefix: str = "dataflowsim") -> str:
+    """Render a snapshot in the Prometheus text exposition format."""
+    lines = []
+    for name, value in snapshot["counters"].items():
+        lines += [f"# TYPE {prefix}_{name} counter", f"{prefix}_{name} {value}"]
+    for name, histogram in snapshot["histograms"].items():
+        metric = f"{prefix}_{name}"
+        lines.append(f"# TYPE {metric} summary")
+        for percentile in PERCENTILES:
+            value = histogram[f"p{percentile:g}"]
+            lines.append(f'{metric}{{quantile="{percentile / 100:g}"}} {value}')
+        lines += [
+            f"{metric}_sum {histogram['sum']}",
+            f"{metric}_count {histogram['count']}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def to_emf(snapshot: dict, namespace: str, dimensions: Dict[str, str]) -> dict:
+    """Render a snapshot as a CloudWatch Embedded Metric Format log event."""
+    metrics, values = [], {}
+    for name, value in snapshot["counters"].items():
+        metrics.append({"Name": name, "Unit": "Count"})
+        values[name] = value
+    metrics.append({"Name": "events_per_s", "Unit": "Count/Second"})
+    values["events_per_s"] = snapshot["events_per_s"]
+    for name, histogram in snapshot["histograms"].items():
+        unit = "Milliseconds" if name.endswith("_ms") else "Count"
+        for stat in ("p50", "p99", "max"):
+            metrics.append({"Name": f"{name}_{stat}", "Unit": unit})
+            values[f"{name}_{stat}"] = histogram[stat]
+    return {
+        "_aws": {
+            "Timestamp": int(snapshot["timestamp"] * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": namespace,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": metrics,
+                }
+            ],
+        },
+        **dimensions,
+        **values,
+    }
+
+
+class JsonLinesExporter:
+    """Append every snapshot as one JSON line to a file."""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+
+    def export(self, snapshot: dict) -> None:
+        with open(self.filepath, "a") as file:
+            file.write(json.dumps(snapshot) + "\n")
+
+    def close(self) -> None:
+        pass
+
+
+class EmfExporter:
+    """Print snapshots to stdout in CloudWatch Embedded Metric Format.
+
+    The awslogs driver of the Fargate task ships stdout to CloudWatch Logs,
+    which extracts the metrics without any PutMetricData calls.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        dimensions: Optional[Dict[str, str]] = None,
+        stream: Optional[TextIO] = None,
+    ):
+        self.namespace = namespace
+        self.dimensions = dimensions or {}
+        self._stream = stream or sys.stdout
+
+    def export(self, snapshot: dict) -> None:
+        self._stream.write(
+            json.dumps(to_emf(snapshot, self.namespace, self.dimensions)) + "\n"
+        )
+        self._stream.flush()
+
+    def close(self) -> None:
+        pass
+
+
+class PrometheusExporter:
+    """Serve the latest snapshot as Prometheus text on http://<host>:<port>/metrics."""
+
+    def __init__(self, port: int, host: str = ""):
+        exporter = self
+        self._body = b""
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = exporter._body
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self._server.server_address[1]
+        # a short poll interval keeps close() from delaying the end of a replay
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={"poll_interval": 0.05},
+            name="metrics-http",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def export(self, snapshot: dict) -> None:
+        self._body = to_prometheus(snapshot).encode("utf-8")
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class MetricsReporter:
+    """Export snapshots of the metrics every `interval_s` from a background thread."""
+
+    def __init__(
+        self, metrics: ProducerMetrics, exporters: List, interval_s: float = 10.0
+    ):
+        self.metrics = metrics
+        self.exporters = exporters
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="metrics-reporter", daemon=True
+        )
+
+    def start(self) -> "MetricsReporter":
+        if self.exporters:
+            self._thread.start()
+        return self
+
+    def export(self) -> None:
+        snapshot = self.metrics.snapshot()
+        for exporter in self.exporters:
+            try:
+                exporter.export(snapshot)
+            except Exception as e:
+                logger.warning(
+                    {
+                        "message": "Could not export metrics",
+                        "exporter": type(exporter).__name__,
+                        "error": str(e),
+                    }
+                )
+
+    def close(self) -> None:
+        """Stop the thread, export the final values and release the exporters."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.export()
+        for exporter in self.exporters:
+            exporter.close()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self.export()
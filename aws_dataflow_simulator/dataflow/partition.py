@@ -0,0 +1,109 @@
+"""Split a replay across workers that each send a disjoint part of the dataset."""
+
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from aws_dataflow_simulator.dataflow.serialization import DELAY_COLUMN
+
+# key: every worker reads the whole timeline and sends the keys it owns
+# range: every worker reads and sends one contiguous slice of the dataset
+PARTITION_MODES = ("key", "range")
+
+
+def worker_of(partition_key: str, workers: int) -> int:
+    """Index of the worker owning a partition key, the same in every process."""
+    return zlib.crc32(partition_key.encode("utf-8")) % workers
+
+
+def fold_delays(
+    delays_ms: Sequence[float], keep: Sequence[bool]
+) -> Tuple[float, np.ndarray]:
+    """Delays between the kept rows of a batch, keeping their timeline offsets.
+
+    The delay of every dropped row is added to the kept row before it, so the
+    events a worker sends stay at their offsets on the shared timeline.
+
+    Returns:
+        Tuple[float, np.ndarray]: Time from the start of the batch to its
+            first kept row, and the delay after each kept row. Without kept
+            rows, the lead time is the length of the whole batch.
+    """
+    delays = np.asarray(delays_ms, dtype=float)
+    offsets = np.cumsum(delays) - delays
+    kept = offsets[np.asarray(keep, dtype=bool)]
+    total = float(delays.sum())
+    if not len(kept):
+        return total, kept
+    return float(kept[0]), np.diff(np.append(kept, total))
+
+
+def select_rows(
+    rows: List[dict], worker_index: int, workers: int
+) -> Tuple[List[dict], float]:
+    """Keep the CSV rows whose partition key, the first column, a worker owns.
+
+    Returns:
+        Tuple[List[dict], float]: The kept rows with folded delays and the
+            time from the start of the batch to the first of them.
+    """
+    keep = [
+        worker_of(str(row[next(iter(row))]), workers) == worker_index for row in rows
+    ]
+    lead_ms, delays_ms = fold_delays(
+        [float(row.get(DELAY_COLUMN) or 0) for row in rows], keep
+    )
+    kept_rows = [row for row, kept in zip(rows, keep) if kept]
+    for row, delay_ms in zip(kept_rows, delays_ms.tolist()):
+        row[DELAY_COLUMN] = delay_ms
+    return kept_rows, lead_ms
+
+
+def select_frame(df, worker_index: int, workers: int):
+    """Keep the DataFrame rows whose partition key, the first column, a worker owns.
+
+    Returns:
+        Tuple[pd.DataFrame, float]: The kept rows with folded delays and the
+            time from the start of the batch to the first of them.
+    """
+    keep = np.fromiter(
+        (worker_of(key, workers) == worker_index for key in df.iloc[:, 0].astype(str)),
+        dtype=bool,
+        count=len(df),
+    )
+    if DELAY_COLUMN in df.columns:
+        delays_ms = df[DELAY_COLUMN].fillna(0).astype(float).to_numpy()
+    else:
+        delays_ms = np.zeros(len(df))
+    lead_ms, kept_delays_ms = fold_delays(delays_ms, keep)
+    return df[keep].assign(**{DELAY_COLUMN: kept_delays_ms}), lead_ms
+
+
+def slice_bounds(size: int, worker_index: int, workers: int) -> Tuple[int, int]:
+    """Start and end of a worker's share of `size` bytes or rows."""
+    return size * worker_index // workers, size * (worker_index + 1) // workers
+
+
+def parse_start_at(value: Union[str, float, int, None]) -> Optional[float]:
+    """Parse the shared replay start, epoch seconds or ISO 8601 (UTC if naive)."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    start_at = datetime.fromisoformat(str(value))
+    if start_at.tzinfo is None:
+        start_at = start_at.replace(tzinfo=timezone.utc)
+    return start_at.timestamp()
+
+
+def shared_clock_offset_ms(start_at: float, speed: float) -> float:
+    """Current offset on the dataset timeline of a replay started at `start_at`.
+
+    Negative until `start_at`, so workers wait for the shared start.
+    """
+    return (time.time() - start_at) * 1000.0 * speed
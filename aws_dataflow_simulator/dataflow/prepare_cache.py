@@ -0,0 +1,274 @@
+"""Skip or shorten `dataset prepare` when its input and settings are unchanged."""
+
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+from typing import Optional, Tuple
+
+from aws_dataflow_simulator.dataflow.serialization import DELAY_COLUMN
+from aws_dataflow_simulator.utils_dataset import (
+    DATE_FORMAT,
+    is_parquet,
+    parse_timestamps,
+)
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_SUFFIX = ".prepare.json"
+
+# what a prepare run has to do, see PrepareCache.status
+FRESH = "fresh"
+APPEND = "append"
+STALE = "stale"
+
+_HASH_BLOCK_SIZE = 8 * 1024 * 1024
+# bytes read from the end of the output at a time to find its last line
+_TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def manifest_path(output_path: str) -> str:
+    """Path of the prepare manifest of a processed dataset, next to it."""
+    return f"{output_path}{MANIFEST_SUFFIX}"
+
+
+def hash_file(
+    path: str, prefix_size: Optional[int] = None
+) -> Tuple[str, Optional[str]]:
+    """SHA-256 of a file and, in the same read, of its first prefix_size bytes.
+
+    Returns:
+        Tuple[str, Optional[str]]: Digest of the file and of the prefix, None
+            if the file is shorter than the prefix or no prefix is asked for.
+    """
+    digest, prefix_digest, position = hashlib.sha256(), None, 0
+    with open(path, "rb") as file:
+        while True:
+            size = _HASH_BLOCK_SIZE
+            if prefix_size is not None and position < prefix_size:
+                size = min(size, prefix_size - position)
+            block = file.read(size)
+            if not block:
+                break
+            digest.update(block)
+            position += len(block)
+            if position == prefix_size:
+                prefix_digest = digest.copy().hexdigest()
+    return digest.hexdigest(), prefix_digest
+
+
+class PrepareCache:
+    """Manifest of the last prepare run of a dataset, saved next to its output.
+
+    The manifest records the SHA-256 of the raw dataset, the settings the
+    output was prepared with (apply_delay, delay_ms, colname_dt,
+    first_event_dt and dt_format) and the size of the output. A run with the same input
+    and settings is a no-op. If the raw dataset only grew by rows appended
+    at its end, only those rows are prepared and appended to a CSV output,
+    as long as they do not go back in time.
+
+    Args:
+        input_path (str): Path of the raw dataset.
+        output_path (str): Path of the processed dataset.
+        settings (dict): Dataset settings the output depends on.
+    """
+
+    def __init__(self, input_path: str, output_path: str, settings: dict):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.settings = settings
+        self.manifest_path = manifest_path(output_path)
+        self._input_sha256: Optional[str] = None
+
+    def load(self) -> Optional[dict]:
+        if not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path) as file:
+                return json.load(file)
+        except ValueError:
+            return None
+
+    def status(self) -> str:
+        """Check what a prepare run has to do: nothing, append or everything.
+
+        Returns:
+            str: FRESH if the output is up to date, APPEND if only rows
+                appended to the raw dataset need preparing, STALE otherwise.
+        """
+        manifest = self.load()
+        if (
+            manifest is None
+            or manifest.get("settings") != self.settings
+            or manifest.get("output") != self._file_state(self.output_path)
+        ):
+            return STALE
+
+        old_input = manifest["input"]
+        stat = os.stat(self.input_path)
+        if (stat.st_size, stat.st_mtime_ns) == (
+            old_input["size"],
+            old_input["mtime_ns"],
+        ):
+            self._input_sha256 = old_input["sha256"]
+            return FRESH
+
+        self._input_sha256, prefix_sha256 = hash_file(
+            self.input_path, prefix_size=old_input["size"]
+        )
+        if self._input_sha256 == old_input["sha256"]:
+            return FRESH
+        if (
+            prefix_sha256 == old_input["sha256"]
+            and old_input.get("ends_with_newline")
+            and not is_parquet(self.output_path)
+        ):
+            return APPEND
+        return STALE
+
+    def save(self, rows: int) -> None:
+        """Record the current input and output after a prepare run."""
+        if self._input_sha256 is None:
+            self._input_sha256, _ = hash_file(self.input_path)
+        stat = os.stat(self.input_path)
+        manifest = {
+            "settings": self.settings,
+            "input": {
+                "path": os.path.abspath(self.input_path),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": self._input_sha256,
+                "ends_with_newline": _ends_with_newline(self.input_path),
+            },
+            "output": self._file_state(self.output_path),
+            "rows": rows,
+        }
+        tmp_filepath = f"{self.manifest_path}.tmp"
+        with open(tmp_filepath, "w") as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(tmp_filepath, self.manifest_path)
+
+    def rows(self) -> int:
+        manifest = self.load()
+        return manifest.get("rows", 0) if manifest else 0
+
+    def append(self) -> Optional[int]:
+        """Prepare the rows appended to the raw dataset since the last run.
+
+        The appended rows are read from the end of the raw dataset only. With
+        timestamp delays they are sorted, and the delay of the last row of
+        the output, 0 so far, becomes the time until the first of them.
+
+        Returns:
+            Optional[int]: Number of rows appended, None if the appended
+                rows cannot be added to the output, e.g. because they are
+                older than its last row, and it must be prepared again.
+        """
+        import pandas as pd
+
+        manifest = self.load()
+        with open(self.input_path, "rb") as file:
+            header = file.readline()
+            file.seek(manifest["input"]["size"])
+            tail = file.read()
+        df = pd.read_csv(io.BytesIO(header + tail))
+        df.columns = [col.lower() for col in df.columns]
+        if not len(df):
+            return 0
+
+        with open(self.output_path, newline="") as file:
+            columns = next(csv.reader(file), [])
+        apply_delay = self.settings["apply_delay"]
+        delay_ms = self.settings["delay_ms"]
+        colname_dt = self.settings["colname_dt"]
+        last_line_offset, last_row = None, None
+
+        if apply_delay and delay_ms:
+            df[DELAY_COLUMN] = delay_ms
+        elif apply_delay:
+            if colname_dt not in df.columns or columns[-1:] != [DELAY_COLUMN]:
+                return None
+            last_line_offset = _last_line_offset(self.output_path)
+            with open(self.output_path, "rb") as file:
+                file.seek(last_line_offset)
+                last_row = next(csv.reader([str(file.read(), "utf-8")]))
+            last_timestamp = pd.Timestamp(last_row[columns.index(colname_dt)])
+            df[colname_dt] = parse_timestamps(
+                df[colname_dt], self.settings.get("dt_format")
+            )
+            if df[colname_dt].min() < last_timestamp:
+                return None
+            df = df.sort_values(by=colname_dt, kind="stable")
+            df[DELAY_COLUMN] = (
+                df[colname_dt]
+                .diff()
+                .shift(-1)
+                .fillna(pd.Timedelta(0))
+                .dt.total_seconds()
+                * 1000
+            )
+            gap = df[colname_dt].iloc[0] - last_timestamp
+            last_row[-1] = str(gap.total_seconds() * 1000)
+        if sorted(df.columns) != sorted(columns):
+            return None
+
+        if last_line_offset is not None:
+            # rewrite the delay of the last row, now followed by the new rows
+            with open(self.output_path, "r+b") as file:
+                file.truncate(last_line_offset)
+            with open(self.output_path, "a", newline="") as file:
+                csv.writer(file, lineterminator="\n").writerow(last_row)
+        with open(self.output_path, "a", newline="") as file:
+            df[columns].to_csv(
+                file,
+                header=False,
+                index=False,
+                lineterminator="\n",
+                date_format=DATE_FORMAT,
+            )
+        logger.info(
+            {
+                "message": "Appended prepared rows",
+                "dataset_filepath": self.input_path,
+                "output_filepath": self.output_path,
+                "rows": len(df),
+            }
+        )
+        return len(df)
+
+    @staticmethod
+    def _file_state(path: str) -> Optional[dict]:
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        if not file.tell():
+            return False
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
+
+
+def _last_line_offset(path: str) -> int:
+    """Byte offset of the start of the last line of a file."""
+    with open(path, "rb") as file:
+        end = file.seek(0, os.SEEK_END)
+        # ignore the line end of the last line itself
+        while end and file.seek(end - 1) >= 0 and file.read(1) in (b"\n", b"\r"):
+            end -= 1
+        position = end
+        while position > 0:
+            start = max(0, position - _TAIL_BLOCK_SIZE)
+            file.seek(start)
+            block = file.read(position - start)
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            position = start
+        return 0
@@ -0,0 +1,658 @@
+"""Senders that deliver serialized events to an AWS Kinesis stream."""
+
+import bisect
+import hashlib
+import logging
+import math
+import queue
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from aws_dataflow_simulator.dataflow.aggregation import (
+    DEFAULT_MAX_BYTES,
+    RecordAggregator,
+)
+from aws_dataflow_simulator.dataflow.metrics import (
+    THROTTLE_ERROR_CODE,
+    ProducerMetrics,
+)
+from aws_dataflow_simulator.exceptions import CouldNotPutRecordsToKinesis
+
+logger = logging.getLogger(__name__)
+
+# Kinesis PutRecords service limits
+MAX_RECORDS_PER_REQUEST = 500
+MAX_BYTES_PER_REQUEST = 5 * 1024 * 1024
+MAX_BYTES_PER_RECORD = 1024 * 1024
+# Kinesis per shard write limits
+SHARD_RECORDS_PER_S = 1000
+SHARD_BYTES_PER_S = 1024 * 1024
+
+
+class KinesisRecordSender:
+    """Send every event with its own PutRecord call.
+
+    Throttled records are retried with exponential backoff, other errors
+    are raised right away. With a `rate_limiter`, every record first waits
+    for the write capacity of its shard.
+    """
+
+    def __init__(
+        self,
+        kinesis_client,
+        stream_name: str,
+        max_retries: int = 5,
+        backoff_base_s: float = 0.1,
+        metrics: Optional[ProducerMetrics] = None,
+        rate_limiter: Optional["ShardRateLimiter"] = None,
+    ):
+        self._kinesis_client = kinesis_client
+        self.stream_name = stream_name
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.metrics = metrics or ProducerMetrics()
+        self.rate_limiter = rate_limiter
+
+    def put(self, data: bytes, partition_key: str) -> None:
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter:
+                self.rate_limiter.acquire(partition_key, len(data) + len(partition_key))
+            if self._put_record(
+                data, partition_key, last_attempt=attempt == self.max_retries
+            ):
+                return
+            if self.rate_limiter:
+                self.rate_limiter.throttled(partition_key)
+            self.metrics.inc("retried_records")
+            time.sleep(self.backoff_base_s * (2**attempt))
+
+    def _put_record(self, data: bytes, partition_key: str, last_attempt: bool) -> bool:
+        """Send one PutRecord request, returning False if it was throttled."""
+        start = time.perf_counter()
+        try:
+            self._kinesis_client.put_record(
+                StreamName=self.stream_name,
+                Data=data,
+                PartitionKey=partition_key,
+            )
+        except Exception as e:
+            error = getattr(e, "response", {}).get("Error", {})
+            throttled = error.get("Code") == THROTTLE_ERROR_CODE
+            if throttled:
+                self.metrics.inc("throttled_records")
+            if throttled and not last_attempt:
+                return False
+            self.metrics.inc("failed_records")
+            raise
+        finally:
+            self.metrics.inc("put_requests")
+            self.metrics.observe(
+                "send_latency_ms", (time.perf_counter() - start) * 1000
+            )
+        return True
+
+    def flush(self) -> None:
+        """Nothing is buffered, kept for interface parity with batch senders."""
+
+    def drain(self) -> None:
+        """Every record is sent by put, kept for interface parity."""
+
+    def close(self) -> None:
+        self.flush()
+
+
+class KinesisBatchProducer:
+    """Group events into PutRecords calls within the Kinesis request limits.
+
+    Records are buffered until either 500 records or 5 MB (data plus
+    partition keys) are pending, or until `flush` is called explicitly.
+    Entries rejected in a partially failed response are retried on their
+    own with exponential backoff. With a `rate_limiter`, every record waits
+    for the write capacity of its shard before it is added to a batch.
+    """
+
+    def __init__(
+        self,
+        kinesis_client,
+        stream_name: str,
+        max_records: int = MAX_RECORDS_PER_REQUEST,
+        max_bytes: int = MAX_BYTES_PER_REQUEST,
+        max_retries: int = 5,
+        backoff_base_s: float = 0.1,
+        metrics: Optional[ProducerMetrics] = None,
+        rate_limiter: Optional["ShardRateLimiter"] = None,
+    ):
+        if not 0 < max_records <= MAX_RECORDS_PER_REQUEST:
+            raise ValueError(
+                f"max_records must be between 1 and {MAX_RECORDS_PER_REQUEST}."
+            )
+        if not 0 < max_bytes <= MAX_BYTES_PER_REQUEST:
+            raise ValueError(
+                f"max_bytes must be between 1 and {MAX_BYTES_PER_REQUEST}."
+            )
+        self._kinesis_client = kinesis_client
+        self.stream_name = stream_name
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.metrics = metrics or ProducerMetrics()
+        self.rate_limiter = rate_limiter
+
+        self._buffer: List[dict] = []
+        self._buffer_bytes = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of records waiting to be sent."""
+        return len(self._buffer)
+
+    def put(self, data: bytes, partition_key: str) -> None:
+        """Buffer a record, sending the current batch first if it would overflow."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        record_bytes = len(data) + len(partition_key.encode("utf-8"))
+        if record_bytes > MAX_BYTES_PER_RECORD:
+            raise ValueError(
+                f"Record of {record_bytes} bytes exceeds the Kinesis limit "
+                f"of {MAX_BYTES_PER_RECORD} bytes."
+            )
+
+        if (
+            len(self._buffer) >= self.max_records
+            or self._buffer_bytes + record_bytes > self.max_bytes
+        ):
+            self.flush()
+
+        if self.rate_limiter:
+            self.rate_limiter.acquire(partition_key, record_bytes)
+        self._buffer.append({"Data": data, "PartitionKey": partition_key})
+        self._buffer_bytes += record_bytes
+
+        if len(self._buffer) >= self.max_records:
+            self.flush()
+
+    def flush(self) -> None:
+        """Send all buffered records, retrying only the failed entries."""
+        if not self._buffer:
+            return
+
+        records, self._buffer, self._buffer_bytes = self._buffer, [], 0
+        for attempt in range(self.max_retries + 1):
+            records, error = self._put_records(records)
+            if not records:
+                return
+            if attempt < self.max_retries:
+                self.metrics.inc("retried_records", len(records))
+                delay_s = self.backoff_base_s * (2**attempt)
+                logger.warning(
+                    {
+                        "message": "Retrying failed Kinesis records",
+                        "failed_record_count": len(records),
+                        "error_code": error,
+                        "retry_in_s": delay_s,
+                    }
+                )
+                time.sleep(delay_s)
+                self._acquire_retries(records, error)
+
+        self.metrics.inc("failed_records", len(records))
+        raise CouldNotPutRecordsToKinesis(
+            f"{len(records)} records could not be put to stream "
+            f"{self.stream_name} after {self.max_retries} retries: {error}"
+        )
+
+    def drain(self) -> None:
+        """Send the buffered records, flush already blocks until they are sent."""
+        self.flush()
+
+    def close(self) -> None:
+        self.flush()
+
+    def _acquire_retries(self, records: List[dict], error: Optional[str]) -> None:
+        """Slow down the throttled shards and wait for capacity to retry."""
+        if not self.rate_limiter:
+            return
+        if error == THROTTLE_ERROR_CODE:
+            for partition_key in {record["PartitionKey"] for record in records}:
+                self.rate_limiter.throttled(partition_key)
+        for record in records:
+            self.rate_limiter.acquire(
+                record["PartitionKey"],
+                len(record["Data"]) + len(record["PartitionKey"].encode("utf-8")),
+            )
+
+    def _put_records(self, records: List[dict]) -> Tuple[List[dict], Optional[str]]:
+        """Send one PutRecords request, returning the entries that failed."""
+        start = time.perf_counter()
+        response = self._kinesis_client.put_records(
+            StreamName=self.stream_name, Records=records
+        )
+        self.metrics.observe("send_latency_ms", (time.perf_counter() - start) * 1000)
+        self.metrics.observe("batch_size", len(records))
+        self.metrics.inc("put_requests")
+        if not response.get("FailedRecordCount"):
+            return [], None
+
+        failed, error, throttled = [], None, 0
+        for record, result in zip(records, response["Records"]):
+            if "ErrorCode" in result:
+                failed.append(record)
+                error = result["ErrorCode"]
+                throttled += error == THROTTLE_ERROR_CODE
+        if throttled:
+            self.metrics.inc("throttled_records", throttled)
+        return failed, error
+
+
+class ShardMap:
+    """Map partition keys to shards the same way Kinesis does.
+
+    Kinesis hashes each partition key with MD5 to a 128-bit integer and stores
+    the record in the shard whose hash key range contains it.
+    """
+
+    def __init__(self, starting_hash_keys: List[int]):
+        self.starting_hash_keys = sorted(starting_hash_keys)
+
+    def __len__(self) -> int:
+        return len(self.starting_hash_keys)
+
+    @classmethod
+    def even(cls, shard_count: int) -> "ShardMap":
+        """Hash key ranges of a stream created with shard_count uniform shards."""
+        if shard_count < 1:
+            raise ValueError("shard_count must be at least 1.")
+        step = 2**128 // shard_count
+        return cls([i * step for i in range(shard_count)])
+
+    @classmethod
+    def from_stream(cls, kinesis_client, stream_name: str) -> "ShardMap":
+        """Read the hash key ranges of the open shards of a stream."""
+        shards, request = [], {"StreamName": stream_name}
+        while True:
+            response = kinesis_client.list_shards(**request)
+            shards.extend(response["Shards"])
+            if not response.get("NextToken"):
+                break
+            request = {"NextToken": response["NextToken"]}
+
+        open_shards = [
+            shard
+            for shard in shards
+            if "EndingSequenceNumber" not in shard["SequenceNumberRange"]
+        ]
+        return cls(
+            [int(shard["HashKeyRange"]["StartingHashKey"]) for shard in open_shards]
+        )
+
+    @staticmethod
+    def hash_key(partition_key: str) -> int:
+        return int.from_bytes(
+            hashlib.md5(partition_key.encode("utf-8")).digest(), "big"
+        )
+
+    def shard_index(self, partition_key: str) -> int:
+        """Index of the shard that stores records with this partition key."""
+        return (
+            bisect.bisect_right(self.starting_hash_keys, self.hash_key(partition_key))
+            - 1
+        )
+
+
+class AdaptiveTokenBucket:
+    """Token buckets for the record and byte write limits of one shard.
+
+    Both buckets refill continuously at `rate` times the shard limits and
+    hold at most `burst_s` seconds of tokens. The rate follows AIMD: a
+    throttled write multiplies it by `decrease` (once per
+    `decrease_interval_s`, as one overloaded second throttles many records
+    at once) and it then grows back by `increase_per_s` every second, so it
+    settles just below what the shard actually accepts.
+    """
+
+    _TOLERANCE = 1e-6
+
+    def __init__(
+        self,
+        records_per_s: float = SHARD_RECORDS_PER_S,
+        bytes_per_s: float = SHARD_BYTES_PER_S,
+        burst_s: float = 0.1,
+        decrease: float = 0.5,
+        increase_per_s: float = 0.1,
+        min_rate: float = 0.05,
+        decrease_interval_s: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.records_per_s = records_per_s
+        self.bytes_per_s = bytes_per_s
+        self.burst_s = burst_s
+        self.decrease = decrease
+        self.increase_per_s = increase_per_s
+        self.min_rate = min_rate
+        self.decrease_interval_s = decrease_interval_s
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self.rate = 1.0
+        self._records = records_per_s * burst_s
+        self._bytes = bytes_per_s * burst_s
+        self._updated = clock()
+        self._decreased = -math.inf
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        self.rate = min(1.0, self.rate + self.increase_per_s * elapsed)
+        self._records = min(
+            self.records_per_s * self.burst_s,
+            self._records + elapsed * self.records_per_s * self.rate,
+        )
+        self._bytes = min(
+            self.bytes_per_s * self.burst_s,
+            self._bytes + elapsed * self.bytes_per_s * self.rate,
+        )
+
+    def take(self, nbytes: int) -> float:
+        """Take the tokens of one record, or return the seconds to wait for them.
+
+        A record larger than the byte bucket is let through once the bucket
+        is full, leaving it in debt.
+        """
+        with self._lock:
+            self._refill(self._clock())
+            needed_bytes = min(nbytes, self.bytes_per_s * self.burst_s)
+            # tolerate rounding, or sleeping the returned time could fall just short
+            if (
+                self._records >= 1 - self._TOLERANCE
+                and self._bytes >= needed_bytes - self._TOLERANCE
+            ):
+                self._records -= 1
+                self._bytes -= nbytes
+                return 0.0
+            return max(
+                (1 - self._records) / (self.records_per_s * self.rate),
+                (needed_bytes - self._bytes) / (self.bytes_per_s * self.rate),
+            )
+
+    def throttled(self) -> None:
+        """Decrease the rate after the shard rejected a write."""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            if now - self._decreased >= self.decrease_interval_s:
+                self._decreased = now
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+
+
+class ShardRateLimiter:
+    """Keep the writes to every shard of a stream within its limits.
+
+    Each shard accepts 1000 records or 1 MiB per second. Writers wait for
+    the AdaptiveTokenBucket of the record's shard before sending and
+    report throttled records, so a replay runs at the highest rate the
+    stream sustains instead of failing on ProvisionedThroughputExceeded.
+
+    Args:
+        shard_map (ShardMap): Hash key ranges of the stream shards.
+        records_per_s (float): Record limit of each shard.
+        bytes_per_s (float): Byte limit of each shard, data plus partition key.
+    """
+
+    def __init__(
+        self,
+        shard_map: ShardMap,
+        records_per_s: float = SHARD_RECORDS_PER_S,
+        bytes_per_s: float = SHARD_BYTES_PER_S,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        **bucket_kwargs,
+    ):
+        self.shard_map = shard_map
+        self._sleep = sleep
+        self.buckets = [
+            AdaptiveTokenBucket(
+                records_per_s, bytes_per_s, clock=clock, **bucket_kwargs
+            )
+            for _ in range(len(shard_map))
+        ]
+
+    def acquire(self, partition_key: str, nbytes: int) -> float:
+        """Wait until the shard of the record can take it, returning the seconds waited."""
+        bucket = self.buckets[self.shard_map.shard_index(partition_key)]
+        waited_s = 0.0
+        while True:
+            wait_s = bucket.take(nbytes)
+            if not wait_s:
+                return waited_s
+            self._sleep(wait_s)
+            waited_s += wait_s
+
+    def throttled(self, partition_key: str) -> None:
+        """Slow down the shard of a record that was throttled."""
+        self.buckets[self.shard_map.shard_index(partition_key)].throttled()
+
+
+class AggregatingSender:
+    """Pack events into KPL aggregated records before handing them to a sender.
+
+    Kinesis limits every shard to 1000 records per second, so events of a
+    few hundred bytes hit the record limit long before the byte limit.
+    Events are collected per shard and sent as one aggregated record once
+    the next event would take it over `max_bytes`, or on flush. Every
+    aggregated record holds events of a single shard and is sent with the
+    partition key of its first event, so it lands on that shard. Events
+    larger than `max_bytes` on their own are sent as plain records.
+
+    Args:
+        sender: Sender of the aggregated records, e.g. a ShardedProducer.
+        shard_map (ShardMap): Hash key ranges of the stream shards.
+        max_bytes (int): Maximum size of an aggregated record.
+    """
+
+    def __init__(
+        self, sender, shard_map: "ShardMap", max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        # leave room for the partition key within the record limit
+        if not 0 < max_bytes <= MAX_BYTES_PER_RECORD - 256:
+            raise ValueError(
+                f"max_bytes must be between 1 and {MAX_BYTES_PER_RECORD - 256}."
+            )
+        self.sender = sender
+        self.shard_map = shard_map
+        self.max_bytes = max_bytes
+        self._aggregators = [RecordAggregator() for _ in range(len(shard_map))]
+
+    @property
+    def rate_limiter(self) -> Optional["ShardRateLimiter"]:
+        return getattr(self.sender, "rate_limiter", None)
+
+    def put(self, data: bytes, partition_key: str) -> None:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        aggregator = self._aggregators[self.shard_map.shard_index(partition_key)]
+        if aggregator.size_with(data, partition_key) > self.max_bytes:
+            self._send(aggregator)
+            if aggregator.size_with(data, partition_key) > self.max_bytes:
+                self.sender.put(data, partition_key=partition_key)
+                return
+        aggregator.add(data, partition_key)
+
+    def flush(self) -> None:
+        """Send every partial aggregated record, then flush the sender."""
+        for aggregator in self._aggregators:
+            self._send(aggregator)
+        self.sender.flush()
+
+    def drain(self) -> None:
+        for aggregator in self._aggregators:
+            self._send(aggregator)
+        self.sender.drain()
+
+    def close(self) -> None:
+        try:
+            for aggregator in self._aggregators:
+                self._send(aggregator)
+        finally:
+            self.sender.close()
+
+    def _send(self, aggregator: RecordAggregator) -> None:
+        if len(aggregator):
+            data, partition_key = aggregator.serialize()
+            self.sender.put(data, partition_key=partition_key)
+
+
+class ShardedProducer:
+    """Send events concurrently with one worker lane per Kinesis shard.
+
+    Every partition key is routed to the lane that owns its shard through a
+    bounded queue, so a slow or throttled shard only holds back its own lane
+    and the parser blocks instead of buffering without limit. With `batch`,
+    each lane groups records with its own KinesisBatchProducer and flushes
+    when its queue is idle for `linger_ms`, when its batch is full or when
+    `flush` is called. Otherwise each lane sends one PutRecord per event.
+
+    Args:
+        shard_map (ShardMap): Hash key ranges of the stream shards.
+        concurrency (Optional[int]): Number of lanes, defaults to one per shard.
+            With fewer lanes than shards, each lane serves several shards.
+        queue_size (int): Maximum number of records waiting in each lane.
+        linger_ms (float): Idle time after which a lane sends a partial batch.
+        batch (bool): Send with PutRecords batches instead of PutRecord calls.
+        metrics (Optional[ProducerMetrics]): Metrics shared by all lanes.
+        rate_limiter (Optional[ShardRateLimiter]): Write limits shared by all lanes.
+    """
+
+    _FLUSH = object()
+    _STOP = object()
+
+    def __init__(
+        self,
+        kinesis_client,
+        stream_name: str,
+        shard_map: ShardMap,
+        concurrency: Optional[int] = None,
+        queue_size: int = 10000,
+        linger_ms: float = 100,
+        batch: bool = True,
+        metrics: Optional[ProducerMetrics] = None,
+        rate_limiter: Optional[ShardRateLimiter] = None,
+        **producer_kwargs,
+    ):
+        self.stream_name = stream_name
+        self.metrics = metrics or ProducerMetrics()
+        self.shard_map = shard_map
+        self.concurrency = min(concurrency or len(shard_map), len(shard_map))
+        self.linger_ms = linger_ms
+
+        self._errors: List[Exception] = []
+        self._queues = [
+            queue.Queue(maxsize=queue_size) for _ in range(self.concurrency)
+        ]
+        self._producers = [
+            (
+                KinesisBatchProducer(
+                    kinesis_client,
+                    stream_name,
+                    metrics=self.metrics,
+                    rate_limiter=rate_limiter,
+                    **producer_kwargs,
+                )
+                if batch
+                else KinesisRecordSender(
+                    kinesis_client,
+                    stream_name,
+                    metrics=self.metrics,
+                    rate_limiter=rate_limiter,
+                )
+            )
+            for _ in range(self.concurrency)
+        ]
+        self._threads = [
+            threading.Thread(
+                target=self._run_lane,
+                args=(lane,),
+                name=f"kinesis-lane-{lane}",
+                daemon=True,
+            )
+            for lane in range(self.concurrency)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, data: bytes, partition_key: str) -> None:
+        """Queue a record on the lane of its shard, blocking while the lane is full."""
+        self._raise_lane_error()
+        lane = self.shard_map.shard_index(partition_key) % self.concurrency
+        self._queues[lane].put((data, partition_key))
+
+    def flush(self) -> None:
+        """Ask every lane to send its partial batch."""
+        self._raise_lane_error()
+        for lane_queue in self._queues:
+            lane_queue.put(self._FLUSH)
+
+    def drain(self) -> None:
+        """Send every record put so far, blocking until all lanes are done."""
+        self.flush()
+        for lane_queue in self._queues:
+            lane_queue.join()
+        self._raise_lane_error()
+
+    def close(self) -> None:
+        """Send all queued records and stop the lanes."""
+        for lane_queue in self._queues:
+            lane_queue.put(self._STOP)
+        for thread in self._threads:
+            thread.join()
+        self._raise_lane_error()
+
+    def _raise_lane_error(self) -> None:
+        if self._errors:
+            raise self._errors[0]
+
+    def _run_lane(self, lane: int) -> None:
+        lane_queue, producer = self._queues[lane], self._producers[lane]
+        failed = False
+        while True:
+            try:
+                item = lane_queue.get(timeout=self.linger_ms / 1000.0)
+            except queue.Empty:
+                if not failed:
+                    failed = not self._send(lane, producer.flush)
+                continue
+
+            try:
+                if item is self._STOP:
+                    if not failed:
+                        self._send(lane, producer.flush)
+                    return
+
+                # after a failure keep draining the queue so the parser never blocks
+                if failed:
+                    continue
+                if item is self._FLUSH:
+                    failed = not self._send(lane, producer.flush)
+                else:
+                    failed = not self._send(lane, producer.put, *item)
+            finally:
+                # lets drain() wait for the items queued before it
+                lane_queue.task_done()
+
+    def _send(self, lane: int, method, *args) -> bool:
+        """Call a sender method, recording the error if it fails."""
+        try:
+            method(*args)
+        except Exception as e:
+            logger.error(
+                {
+                    "message": "Kinesis lane failed",
+                    "lane": lane,
+                    "stream_name": self.stream_name,
+                    "error": str(e),
+                }
+            )
+            self._errors.append(e)
+            return False
+        return True
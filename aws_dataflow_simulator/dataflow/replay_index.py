@@ -0,0 +1,262 @@
+"""Sidecar index of a prepared dataset for seeking without parsing it."""
+
+import logging
+import os
+import tempfile
+import zlib
+from typing import Optional
+
+import numpy as np
+
+from aws_dataflow_simulator.clients import get_client
+from aws_dataflow_simulator.dataflow.checkpoint import ReplayPosition
+from aws_dataflow_simulator.dataflow.serialization import DELAY_COLUMN
+from aws_dataflow_simulator.utils_dataset import is_parquet
+from aws_dataflow_simulator.utils_s3 import (
+    DEFAULT_PART_SIZE,
+    compute_etag,
+    get_part_size,
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = ".index.npy"
+
+# one entry per row plus an end entry, 20 bytes per row
+INDEX_DTYPE = np.dtype(
+    [("byte_offset", "<u8"), ("offset_ms", "<f8"), ("key_hash", "<u4")]
+)
+
+# bytes of the dataset scanned for line ends at a time
+_SCAN_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def index_path(dataset_path: str) -> str:
+    """Path of the sidecar index of a dataset, next to it."""
+    return f"{dataset_path}{INDEX_SUFFIX}"
+
+
+class ReplayIndex:
+    """Row byte offsets, timeline offsets and partition key hashes of a dataset.
+
+    Entry i holds where row i starts in the CSV file (0 for Parquet, which is
+    addressed by row), the offset of its event on the dataset timeline, i.e.
+    the cumulative time_till_next_event_ms of the rows before it, and the
+    crc32 of its partition key, so that `key_hash % workers` is the worker
+    owning it. A last entry marks the end of the dataset: the file size, the
+    length of the whole timeline and, as its key hash, the etag_hash of the
+    dataset, to tell whether the index still belongs to it.
+
+    Stored as a NumPy .npy file and memory-mapped on load, so opening the
+    index of a large dataset costs no more than the pages a lookup touches.
+
+    Args:
+        entries (np.ndarray): Structured array of INDEX_DTYPE.
+    """
+
+    def __init__(self, entries: np.ndarray):
+        if entries.dtype != INDEX_DTYPE or not len(entries):
+            raise ValueError("Not a replay index.")
+        self.entries = entries
+
+    def __len__(self) -> int:
+        """Number of rows of the dataset."""
+        return len(self.entries) - 1
+
+    @property
+    def size(self) -> int:
+        """Size in bytes of the CSV dataset, 0 for Parquet."""
+        return int(self.entries["byte_offset"][-1])
+
+    @property
+    def duration_ms(self) -> float:
+        return float(self.entries["offset_ms"][-1])
+
+    def matches(self, etag: str) -> bool:
+        """Check if the index was built for the dataset with this ETag."""
+        return int(self.entries["key_hash"][-1]) == etag_hash(etag)
+
+    def save(self, path: str) -> None:
+        np.save(path, self.entries, allow_pickle=False)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "ReplayIndex":
+        return cls(np.load(path, mmap_mode="r" if mmap else None, allow_pickle=False))
+
+    @classmethod
+    def load_from_s3(cls, bucket_name: str, key: str) -> Optional["ReplayIndex"]:
+        """Download and memory-map an index from S3, None if there is none.
+
+        The download is unlinked once mapped, the mapping stays valid.
+        """
+        s3_client = get_client("s3")
+        fd, path = tempfile.mkstemp(prefix="dataflowsim-", suffix=INDEX_SUFFIX)
+        os.close(fd)
+        try:
+            s3_client.download_file(bucket_name, key, path)
+            return cls.load(path)
+        except Exception as e:
+            logger.info(
+                {
+                    "message": "No replay index loaded",
+                    "index": f"s3://{bucket_name}/{key}",
+                    "error": str(e),
+                }
+            )
+            return None
+        finally:
+            os.remove(path)
+
+    def position(self, row: int) -> ReplayPosition:
+        """Replay position of a row, the end of the dataset past the last row."""
+        entry = self.entries[min(max(row, 0), len(self))]
+        return ReplayPosition(
+            row=min(max(row, 0), len(self)),
+            byte_offset=int(entry["byte_offset"]),
+            offset_ms=float(entry["offset_ms"]),
+        )
+
+    def row_at(self, offset_ms: float) -> int:
+        """First row whose event is at or after offset_ms on the timeline."""
+        return int(
+            np.searchsorted(self.entries["offset_ms"][:-1], offset_ms, side="left")
+        )
+
+    def seek(self, offset_ms: float) -> ReplayPosition:
+        """Position of the first event at or after offset_ms, by binary search."""
+        return self.position(self.row_at(offset_ms))
+
+    def worker_rows(self, worker_index: int, workers: int) -> np.ndarray:
+        """Rows whose partition keys a worker owns with key partitioning."""
+        return np.flatnonzero(self.entries["key_hash"][:-1] % workers == worker_index)
+
+
+def hash_keys(keys) -> np.ndarray:
+    """crc32 of every partition key, as used by partition.worker_of."""
+    return np.fromiter(
+        (zlib.crc32(key.encode("utf-8")) for key in keys),
+        dtype="<u4",
+        count=len(keys),
+    )
+
+
+def dataset_etag(dataset_path: str) -> str:
+    """ETag of a local dataset on S3 once uploaded by `s3 upload`.
+
+    Like boto3 and the AWS CLI by default, files from DEFAULT_PART_SIZE on
+    are uploaded in parts of that size.
+    """
+    size = os.path.getsize(dataset_path)
+    if size < DEFAULT_PART_SIZE:
+        return compute_etag(dataset_path)
+    return compute_etag(dataset_path, get_part_size(size))
+
+
+def etag_hash(etag: str) -> int:
+    """crc32 of an ETag, quoted as S3 returns it or not."""
+    return zlib.crc32(etag.strip('"').encode("utf-8"))
+
+
+def build_replay_index(dataset_path: str, chunksize: int = 1_000_000) -> ReplayIndex:
+    """Index a prepared CSV or Parquet dataset, reading it in chunks.
+
+    Raises:
+        ValueError: The CSV lines do not match its rows, e.g. because of
+            values with line breaks, which line-based replays cannot seek in.
+    """
+    if is_parquet(dataset_path):
+        byte_offsets = None
+        keys_and_delays = _iter_parquet_keys_and_delays(dataset_path, chunksize)
+    else:
+        byte_offsets = _line_starts(dataset_path)
+        keys_and_delays = _iter_csv_keys_and_delays(dataset_path, chunksize)
+
+    key_hashes, delays = [], []
+    for keys, delays_ms in keys_and_delays:
+        key_hashes.append(hash_keys(keys))
+        delays.append(delays_ms)
+    key_hashes = np.concatenate(key_hashes) if key_hashes else np.empty(0, "<u4")
+    delays = np.concatenate(delays) if delays else np.empty(0)
+
+    rows = len(key_hashes)
+    entries = np.zeros(rows + 1, dtype=INDEX_DTYPE)
+    entries["offset_ms"][1:] = np.cumsum(delays)
+    entries["key_hash"][:-1] = key_hashes
+    entries["key_hash"][-1] = etag_hash(dataset_etag(dataset_path))
+    if byte_offsets is not None:
+        if len(byte_offsets) != rows + 1:
+            raise ValueError(
+                f"{dataset_path} has {len(byte_offsets) - 1} lines but {rows} "
+                "rows, the index needs exactly one line per row."
+            )
+        entries["byte_offset"] = byte_offsets
+    return ReplayIndex(entries)
+
+
+def write_replay_index(dataset_path: str, chunksize: int = 1_000_000) -> str:
+    """Build the index of a dataset and save it next to it, returning its path."""
+    path = index_path(dataset_path)
+    build_replay_index(dataset_path, chunksize).save(path)
+    return path
+
+
+def _line_starts(path: str) -> np.ndarray:
+    """Byte offset of every line after the header, then the file size."""
+    starts = []
+    size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        position = 0
+        while True:
+            block = file.read(_SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10)
+            starts.append(newlines.astype("<u8") + position + 1)
+            position += len(block)
+    # lines start after every line end, the first one being the header's
+    starts = np.concatenate(starts) if starts else np.empty(0, "<u8")
+    if len(starts) and starts[-1] == size:
+        starts = starts[:-1]
+    return np.append(starts, np.uint64(size)).astype("<u8")
+
+
+def _iter_csv_keys_and_delays(path: str, chunksize: int):
+    import pandas as pd
+
+    header = pd.read_csv(path, nrows=0).columns
+    columns = [header[0]] + [col for col in header[1:] if col == DELAY_COLUMN]
+    # keys as the raw strings csv.DictReader gives the streamer
+    chunks = pd.read_csv(
+        path,
+        usecols=columns,
+        dtype={header[0]: str},
+        keep_default_na=False,
+        chunksize=chunksize,
+    )
+    for chunk in chunks:
+        yield chunk[header[0]].tolist(), _delays(chunk)
+
+
+def _iter_parquet_keys_and_delays(path: str, chunksize: int):
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    names = parquet_file.schema_arrow.names
+    columns = [names[0]] + [name for name in names[1:] if name == DELAY_COLUMN]
+    for record_batch in parquet_file.iter_batches(
+        batch_size=chunksize, columns=columns
+    ):
+        chunk = record_batch.to_pandas()
+        yield chunk.iloc[:, 0].astype(str).tolist(), _delays(chunk)
+
+
+def _delays(chunk) -> np.ndarray:
+    if DELAY_COLUMN not in chunk.columns:
+        return np.zeros(len(chunk))
+    import pandas as pd
+
+    return (
+        pd.to_numeric(chunk[DELAY_COLUMN], errors="coerce")
+        .fillna(0)
+        .to_numpy(dtype=float)
+    )
@@ -0,0 +1,81 @@
+"""Drift-free pacing of replayed events."""
+
+import time
+from typing import Callable
+
+LAG_POLICIES = ("catchup", "shed")
+
+# events sent less than this late are considered on schedule
+LATE_TOLERANCE_MS = 1.0
+
+
+class EventScheduler:
+    """Release events at absolute offsets from the start of the replay.
+
+    Each event has a target time of `start + offset_ms / speed` on a monotonic
+    clock, so time spent sending events or logging is absorbed by the next
+    sleep instead of accumulating into drift. When the sender falls behind,
+    the `catchup` policy sends late events immediately until it is back on
+    schedule, while `shed` drops events that are more than `max_lag_ms` late.
+
+    Args:
+        speed (float): Replay speed multiplier, e.g. 10 compresses the timeline 10x.
+        lag_policy (str): Either "catchup" or "shed".
+        max_lag_ms (float): Lag above which events are dropped with the shed policy.
+    """
+
+    def __init__(
+        self,
+        speed: float = 1.0,
+        lag_policy: str = "catchup",
+        max_lag_ms: float = 1000.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if speed <= 0:
+            raise ValueError("speed must be greater than 0.")
+        if lag_policy not in LAG_POLICIES:
+            raise ValueError(f"lag_policy must be one of {LAG_POLICIES}.")
+        self.speed = speed
+        self.lag_policy = lag_policy
+        self.max_lag_ms = max_lag_ms
+        self._clock = clock
+        self._sleep = sleep
+        self._start = None
+
+        self.lag_ms = 0.0
+        self.max_observed_lag_ms = 0.0
+        self.late_events = 0
+        self.shed_events = 0
+
+    def start(self, offset_ms: float = 0.0) -> None:
+        """Anchor offset_ms, 0 unless resuming a replay, to the current time."""
+        self._start = self._clock() - offset_ms / self.speed / 1000.0
+
+    def time_until_ms(self, offset_ms: float) -> float:
+        """Wall-clock milliseconds until the target time of offset_ms."""
+        if self._start is None:
+            self.start()
+        target = self._start + offset_ms / self.speed / 1000.0
+        return (target - self._clock()) * 1000.0
+
+    def sleep_until(self, offset_ms: float) -> float:
+        """Sleep until the target time of offset_ms, returning the lag in ms."""
+        remaining_ms = self.time_until_ms(offset_ms)
+        if remaining_ms > 0:
+            self._sleep(remaining_ms / 1000.0)
+            return 0.0
+        return -remaining_ms
+
+    def admit(self, offset_ms: float) -> bool:
+        """Wait for the event at offset_ms and decide whether it should be sent."""
+        self.lag_ms = self.sleep_until(offset_ms)
+        if self.lag_ms <= LATE_TOLERANCE_MS:
+            return True
+
+        self.late_events += 1
+        self.max_observed_lag_ms = max(self.max_observed_lag_ms, self.lag_ms)
+        if self.lag_policy == "shed" and self.lag_ms > self.max_lag_ms:
+            self.shed_events += 1
+            return False
+        return True
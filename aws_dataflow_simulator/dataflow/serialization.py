@@ -0,0 +1,105 @@
+"""Batch serialization of dataset rows into Kinesis event payloads."""
+
+import json
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DELAY_COLUMN = "time_till_next_event_ms"
+
+
+@dataclass
+class EventBatch:
+    """Ready to send events, one entry per row in each list.
+
+    lead_ms is the time between the previous event and the first event of
+    the batch beyond the previous event's delay, e.g. rows left out of the
+    batch because another worker sends them.
+    """
+
+    payloads: List[bytes]
+    partition_keys: List[str]
+    delays_ms: List[float]
+    lead_ms: float = 0.0
+
+    def __iter__(self) -> Iterator[Tuple[bytes, str, float]]:
+        return iter(zip(self.payloads, self.partition_keys, self.delays_ms))
+
+    def __len__(self) -> int:
+        return len(self.payloads)
+
+
+def get_json_encoder() -> Callable[[object], bytes]:
+    """Return the fastest available JSON encoder, producing UTF-8 bytes.
+
+    orjson is used when installed, the standard library encoder otherwise.
+    Values JSON cannot represent natively (e.g. timestamps) are sent as str().
+    """
+    if orjson is not None:
+        return lambda obj: orjson.dumps(obj, default=str)
+    encode = json.JSONEncoder(default=str).encode
+    return lambda obj: encode(obj).encode("utf-8")
+
+
+def serialize_rows(
+    rows: List[dict],
+    encoder: Optional[Callable[[object], bytes]] = None,
+    key_column: Optional[str] = None,
+) -> EventBatch:
+    """Encode a batch of row dicts, keyed by key_column or the first column."""
+    encoder = encoder or get_json_encoder()
+    payloads, partition_keys, delays_ms = [], [], []
+    for row in rows:
+        delays_ms.append(float(row.pop(DELAY_COLUMN, None) or 0))
+        # Assuming the first column can be used as a partition key by default
+        partition_keys.append(str(row[key_column or next(iter(row))]))
+        payloads.append(encoder(row))
+    return EventBatch(payloads, partition_keys, delays_ms)
+
+
+def serialize_frame(df, key_column: Optional[str] = None) -> EventBatch:
+    """Encode a DataFrame in one vectorized pass.
+
+    Partition keys (key_column, by default the first column) and delays are taken as whole columns and
+    the payloads come from a single DataFrame.to_json call instead of one
+    json.dumps per row.
+    """
+    if DELAY_COLUMN in df.columns:
+        delays_ms = df[DELAY_COLUMN].fillna(0).astype(float).tolist()
+        df = df.drop(columns=DELAY_COLUMN)
+    else:
+        delays_ms = [0.0] * len(df)
+    if not len(df):
+        return EventBatch([], [], [])
+
+    # match the str() representation used for timestamps in serialize_rows
+    # (a column-wise astype(str) would drop midnight times from a whole batch)
+    datetime_columns = [col for col in df.columns if df[col].dtype.kind == "M"]
+    if datetime_columns:
+        df = df.assign(**{col: df[col].map(str) for col in datetime_columns})
+
+    keys = df[key_column] if key_column else df.iloc[:, 0]
+    partition_keys = keys.astype(str).tolist()
+    # the default of 10 decimals would round floats that CSV rows send in full
+    lines = df.to_json(
+        orient="records", lines=True, force_ascii=False, double_precision=15
+    )
+    # newlines inside values are escaped by JSON, so every line is one record
+    payloads = [line.encode("utf-8") for line in lines.split("\n") if line]
+    return EventBatch(payloads, partition_keys, delays_ms)
+
+
+def iter_row_batches(rows: Iterable[dict], batch_size: int) -> Iterator[List[dict]]:
+    """Group an iterator of rows into lists of at most batch_size rows."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
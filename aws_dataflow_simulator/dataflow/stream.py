@@ -1,41 +1,703 @@
-import boto3
 import csv
-import json
 import logging
+import multiprocessing
+import os
 import time
+from contextlib import closing
+from dataclasses import replace
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import Callable, Dict, Iterator, Optional, Tuple, Union
+
+import numpy as np
 
 import aws_dataflow_simulator.config as config
-from aws_dataflow_simulator.utils_s3 import download_file_from_s3
+from aws_dataflow_simulator.clients import get_client
+from aws_dataflow_simulator.dataflow.amplify import amplify_frame, amplify_rows
+from aws_dataflow_simulator.dataflow.checkpoint import ReplayCheckpoint, ReplayPosition
+from aws_dataflow_simulator.dataflow.metrics import (
+    EmfExporter,
+    JsonLinesExporter,
+    MetricsReporter,
+    ProducerMetrics,
+    PrometheusExporter,
+)
+from aws_dataflow_simulator.dataflow.partition import (
+    PARTITION_MODES,
+    parse_start_at,
+    select_frame,
+    select_rows,
+    shared_clock_offset_ms,
+    slice_bounds,
+)
+from aws_dataflow_simulator.dataflow.producer import (
+    AggregatingSender,
+    KinesisBatchProducer,
+    KinesisRecordSender,
+    ShardMap,
+    ShardRateLimiter,
+    ShardedProducer,
+)
+from aws_dataflow_simulator.dataflow.replay_index import (
+    ReplayIndex,
+    dataset_etag,
+    index_path,
+)
+from aws_dataflow_simulator.dataflow.scheduler import EventScheduler
+from aws_dataflow_simulator.dataflow.serialization import (
+    EventBatch,
+    get_json_encoder,
+    iter_row_batches,
+    serialize_frame,
+    serialize_rows,
+)
+from aws_dataflow_simulator.utils_dataset import (
+    get_parquet_row_count,
+    is_parquet,
+    iter_file_lines_mmap,
+    iter_parquet_batches,
+)
+from aws_dataflow_simulator.utils_s3 import (
+    get_parquet_row_count as get_parquet_row_count_from_s3,
+    iter_file_lines_from_s3,
+    iter_parquet_batches_from_s3,
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# how often replay progress and schedule lag are logged
+LAG_REPORT_INTERVAL_S = 10
+# how often the per-event counts kept in the replay loop are added to the metrics
+METRICS_FLUSH_INTERVAL_S = 1
+# the schedule lag is sampled once every this many events
+LAG_SAMPLE_EVERY = 64
+
+# where the prepared dataset is read from
+DATASET_SOURCES = ("s3", "local")
+
 
 class CSVtoStream:
-    def __init__(self):
-        """Read the environmental variables."""
+    def __init__(
+        self,
+        batch_mode: Optional[bool] = None,
+        speed: Optional[float] = None,
+        checkpoint_path: Optional[str] = None,
+        resume: Optional[bool] = None,
+        workers: Optional[int] = None,
+        worker_index: Optional[int] = None,
+        partition_by: Optional[str] = None,
+        start_at: Optional[Union[str, float]] = None,
+        start_from: Optional[str] = None,
+        source: Optional[str] = None,
+        aggregate: Optional[bool] = None,
+        amplify: Optional[int] = None,
+    ):
+        """Read the environmental variables.
+
+        With several `workers`, this replay only sends its part of the
+        dataset: with partition_by "key" the events whose partition key it
+        owns, with "range" one contiguous slice. All workers pace their
+        events on one clock that starts at `start_at`. With `start_from`, a
+        `colname_dt` timestamp, the replay skips the events before it.
+
+        The dataset is read from S3 unless `source` is "local", which
+        memory-maps the local file instead. With `aggregate`, events are
+        packed into KPL aggregated records. With `amplify` above 1, every
+        row is sent as that many events with their own partition keys,
+        spread over the time until the next row.
+        """
         self.bucket_name: str = config.get_s3_bucket_name()
         self.dataset_filepath: str = config.get_dataset_filepath(processed=True)
         self.kinesis_stream_name: str = config.get_kinesis_stream_name()
+        self.batch_mode: bool = (
+            config.get_stream_batch_mode() if batch_mode is None else batch_mode
+        )
+        self.batch_linger_ms: float = config.get_stream_batch_linger_ms()
+        self.first_event_dt: Optional[str] = config.get_first_event_dt()
+        self.speed: float = config.get_stream_speed() if speed is None else speed
+        self.lag_policy: str = config.get_stream_lag_policy()
+        self.max_lag_ms: float = config.get_stream_max_lag_ms()
+        self.concurrency: Optional[int] = config.get_stream_concurrency()
+        self.queue_size: int = config.get_stream_queue_size()
+        self.serialize_batch_size: int = config.get_stream_serialize_batch_size()
+        self.checkpoint_path: Optional[str] = (
+            config.get_stream_checkpoint_path()
+            if checkpoint_path is None
+            else checkpoint_path
+        )
+        self.checkpoint_interval_s: float = config.get_stream_checkpoint_interval_s()
+        self.resume: bool = config.get_stream_resume() if resume is None else resume
+        self.workers: int = config.get_stream_workers() if workers is None else workers
+        self.worker_index: int = (
+            config.get_stream_worker_index() if worker_index is None else worker_index
+        ) or 0
+        self.partition_by: str = partition_by or config.get_stream_partition_by()
+        self.start_at: Optional[float] = parse_start_at(
+            config.get_stream_start_at() if start_at is None else start_at
+        )
+        self.start_from: Optional[str] = start_from or config.get_stream_start_from()
+        self.source: str = source or config.get_stream_source()
+        self.aggregate: bool = (
+            config.get_stream_aggregate() if aggregate is None else aggregate
+        )
+        self.aggregation_max_bytes: int = config.get_stream_aggregation_max_bytes()
+        self.amplify: int = config.get_stream_amplify() if amplify is None else amplify
+        self.amplify_jitter_ms: Optional[float] = config.get_stream_amplify_jitter_ms()
+        self.colname_dt: Optional[str] = config.get_colname_dt()
+        # column sent as partition key, None for the first column
+        self.partition_key_column: Optional[str] = None
+        if self.amplify < 1:
+            raise ValueError("amplify must be at least 1.")
+        if self.source not in DATASET_SOURCES:
+            raise ValueError(f"source must be one of {DATASET_SOURCES}.")
+        if self.partition_by not in PARTITION_MODES:
+            raise ValueError(f"partition_by must be one of {PARTITION_MODES}.")
+        if not 0 <= self.worker_index < self.workers:
+            raise ValueError("worker_index must be between 0 and workers - 1.")
+        if self.workers > 1 and self.start_at is None:
+            raise ValueError("start_at must be set for the workers to share a clock.")
+        if self.workers > 1 and self.checkpoint_path:
+            root, ext = os.path.splitext(self.checkpoint_path)
+            self.checkpoint_path = (
+                f"{root}.worker-{self.worker_index}-of-{self.workers}{ext}"
+            )
+        self.metrics = ProducerMetrics()
+        self._flushed_counts = {}
+        # schedule lag samples since the last metrics flush
+        self._lag_samples_ms = []
 
         # clients to connect to AWS services
-        self._kinesis_client = boto3.client("kinesis")
+        self._kinesis_client = get_client("kinesis")
+
+    def get_sender(self):
+        """Create the sender used to deliver events to Kinesis.
+
+        With more than one shard (or lane) the events are sent concurrently,
+        one lane per shard, both in batch and in per-record mode. Unless
+        disabled, all lanes share a rate limiter that keeps the writes to
+        every shard within its limits. With aggregation, the events of each
+        shard are packed into KPL aggregated records in front of the sender.
+        """
+        shard_map = self.get_shard_map()
+        rate_limiter = None
+        if config.get_stream_rate_limit():
+            # the workers of a partitioned replay share the shard limits
+            rate_limiter = ShardRateLimiter(
+                shard_map,
+                records_per_s=config.get_stream_shard_records_per_s() / self.workers,
+                bytes_per_s=config.get_stream_shard_bytes_per_s() / self.workers,
+            )
+        sender = self._get_kinesis_sender(shard_map, rate_limiter)
+        if self.aggregate:
+            return AggregatingSender(
+                sender, shard_map, max_bytes=self.aggregation_max_bytes
+            )
+        return sender
+
+    def _get_kinesis_sender(self, shard_map: ShardMap, rate_limiter):
+        lanes = min(self.concurrency or len(shard_map), len(shard_map))
+        if lanes > 1:
+            # every lane holds a connection, size the pool to the lane count
+            kinesis_client = get_client("kinesis", max_pool_connections=lanes)
+            return ShardedProducer(
+                kinesis_client,
+                stream_name=self.kinesis_stream_name,
+                shard_map=shard_map,
+                concurrency=lanes,
+                queue_size=self.queue_size,
+                linger_ms=self.batch_linger_ms,
+                batch=self.batch_mode,
+                metrics=self.metrics,
+                rate_limiter=rate_limiter,
+            )
+        if self.batch_mode:
+            return KinesisBatchProducer(
+                self._kinesis_client,
+                stream_name=self.kinesis_stream_name,
+                metrics=self.metrics,
+                rate_limiter=rate_limiter,
+            )
+        return KinesisRecordSender(
+            self._kinesis_client,
+            stream_name=self.kinesis_stream_name,
+            metrics=self.metrics,
+            rate_limiter=rate_limiter,
+        )
+
+    def get_shard_map(self) -> ShardMap:
+        """Read the shards of the stream, assuming uniform shards if not allowed."""
+        try:
+            return ShardMap.from_stream(self._kinesis_client, self.kinesis_stream_name)
+        except Exception as e:
+            logging.warning(
+                {
+                    "message": "Could not list shards, assuming uniform shards",
+                    "kinesis_stream_name": self.kinesis_stream_name,
+                    "error": str(e),
+                }
+            )
+            return ShardMap.even(self.get_shard_count())
+
+    def get_shard_count(self) -> int:
+        """Number of open shards of the stream, from the config if not allowed."""
+        try:
+            response = self._kinesis_client.describe_stream_summary(
+                StreamName=self.kinesis_stream_name
+            )
+            return response["StreamDescriptionSummary"]["OpenShardCount"]
+        except Exception:
+            return config.get_kinesis_shard_count()
+
+    def get_scheduler(self) -> EventScheduler:
+        """Create the scheduler that paces events along the dataset timeline."""
+        return EventScheduler(
+            speed=self.speed,
+            lag_policy=self.lag_policy,
+            max_lag_ms=self.max_lag_ms,
+        )
+
+    def get_metrics_reporter(self) -> MetricsReporter:
+        """Create the reporter exporting metrics to the configured targets."""
+        exporters = []
+        if config.get_metrics_jsonl_path():
+            exporters.append(JsonLinesExporter(config.get_metrics_jsonl_path()))
+        if config.get_metrics_prometheus_port() is not None:
+            try:
+                exporters.append(
+                    PrometheusExporter(config.get_metrics_prometheus_port())
+                )
+            except OSError as e:
+                # e.g. port 80 outside the container, the replay runs without it
+                logging.warning(
+                    {
+                        "message": "Could not serve Prometheus metrics",
+                        "port": config.get_metrics_prometheus_port(),
+                        "error": str(e),
+                    }
+                )
+        if config.get_metrics_emf():
+            exporters.append(
+                EmfExporter(
+                    namespace=config.get_metrics_namespace(),
+                    dimensions=self.get_metrics_dimensions(),
+                )
+            )
+        return MetricsReporter(
+            self.metrics, exporters, interval_s=config.get_metrics_interval_s()
+        )
+
+    def get_metrics_dimensions(self) -> Dict[str, str]:
+        dimensions = {"StreamName": self.kinesis_stream_name}
+        if self.workers > 1:
+            dimensions["Worker"] = str(self.worker_index)
+        return dimensions
+
+    def get_checkpoint(self) -> Optional[ReplayCheckpoint]:
+        """Create the checkpoint of this replay, None if checkpointing is off."""
+        if not self.checkpoint_path:
+            return None
+        if self.source == "local":
+            stat = os.stat(self.dataset_filepath)
+            return ReplayCheckpoint(
+                self.checkpoint_path,
+                dataset=os.path.abspath(self.dataset_filepath),
+                etag=f'"{stat.st_size}-{stat.st_mtime_ns}"',
+            )
+        head = get_client("s3").head_object(
+            Bucket=self.bucket_name, Key=self.dataset_filepath
+        )
+        return ReplayCheckpoint(
+            self.checkpoint_path,
+            dataset=f"s3://{self.bucket_name}/{self.dataset_filepath}",
+            etag=head.get("ETag"),
+        )
+
+    def get_replay_index(self) -> Optional[ReplayIndex]:
+        """Load the sidecar index of the dataset, None if missing or stale."""
+        if self.source == "local":
+            path = index_path(self.dataset_filepath)
+            index = ReplayIndex.load(path) if os.path.exists(path) else None
+        else:
+            index = ReplayIndex.load_from_s3(
+                self.bucket_name, index_path(self.dataset_filepath)
+            )
+        if index is None:
+            return None
+        if self.source == "local":
+            etag = dataset_etag(self.dataset_filepath)
+        else:
+            etag = (
+                get_client("s3")
+                .head_object(Bucket=self.bucket_name, Key=self.dataset_filepath)
+                .get("ETag", "")
+            )
+        if not index.matches(etag):
+            logging.warning(
+                {
+                    "message": "Ignoring replay index of another dataset version",
+                    "dataset_filepath": self.dataset_filepath,
+                    "etag": etag,
+                }
+            )
+            return None
+        return index
+
+    def get_slice(self) -> Tuple[ReplayPosition, Optional[int]]:
+        """Where the part of the dataset replayed by this worker starts and ends.
+
+        Only range partitioning splits the dataset and only `start_from`
+        skips its beginning. With the replay index of the dataset, both are
+        a binary search and a lookup: slices have the same number of rows.
+        Without it, a CSV dataset is split into byte ranges starting at line
+        boundaries and a Parquet dataset into row ranges, and the timeline
+        offset of a slice is read from the `colname_dt` timestamps of its
+        first row and of the dataset's.
+
+        Returns:
+            Tuple[ReplayPosition, Optional[int]]: Position of the first row of
+                the slice and the byte offset (CSV) or row (Parquet) it ends
+                before, None for the end of the dataset.
+        """
+        range_partitioned = self.workers > 1 and self.partition_by == "range"
+        if not range_partitioned and self.start_from is None:
+            return ReplayPosition(), None
+
+        index = self.get_replay_index()
+        if index is not None:
+            return self._slice_from_index(index, range_partitioned)
+        if self.start_from is not None:
+            raise ValueError(
+                "start_from needs the replay index of the dataset, "
+                "write it with dataset prepare and upload it next to the dataset."
+            )
+
+        if is_parquet(self.dataset_filepath):
+            num_rows = self._parquet_row_count()
+            start_row, end_row = slice_bounds(num_rows, self.worker_index, self.workers)
+            start = ReplayPosition(row=start_row)
+            if start_row < end_row:
+                start.offset_ms = self._timeline_offset_ms(
+                    self._first_parquet_row(0), self._first_parquet_row(start_row)
+                )
+            return start, end_row
+
+        size = self._dataset_size()
+        start_byte, end_byte = slice_bounds(size, self.worker_index, self.workers)
+        with closing(self.load_dataset()) as lines:
+            header = next(lines, "")
+            first_row = next(csv.DictReader(chain([header], lines)), None)
+        header_bytes = len(header.encode("utf-8"))
+        if start_byte <= header_bytes:
+            start_byte = header_bytes
+        else:
+            # the slice starts with the first line beginning at or after start_byte
+            with closing(self._iter_dataset_lines(start_byte - 1)) as lines:
+                start_byte += len(next(lines, b"")) - 1
+        start = ReplayPosition(byte_offset=start_byte)
+        if start_byte < end_byte:
+            with closing(self.load_dataset(start_byte=start_byte)) as lines:
+                slice_row = next(csv.DictReader(lines), None)
+            start.offset_ms = self._timeline_offset_ms(first_row, slice_row)
+        return start, end_byte
+
+    def _slice_from_index(
+        self, index: ReplayIndex, range_partitioned: bool
+    ) -> Tuple[ReplayPosition, Optional[int]]:
+        start_row, end_row = 0, len(index)
+        if range_partitioned:
+            start_row, end_row = slice_bounds(
+                len(index), self.worker_index, self.workers
+            )
+        if self.start_from is not None:
+            offset_ms = self._timeline_offset_ms(
+                self._first_row(), {self.colname_dt: self.start_from}
+            )
+            start_row = min(max(start_row, index.row_at(offset_ms)), end_row)
+
+        end = None
+        # an empty slice ends where it starts, so nothing past it is read
+        if end_row < len(index) or start_row >= end_row:
+            end = (
+                end_row
+                if is_parquet(self.dataset_filepath)
+                else index.position(end_row).byte_offset
+            )
+        return index.position(start_row), end
 
-    def load_dataset(self):
-        decoded_cdv_data = download_file_from_s3(
-            bucket_name=self.bucket_name, filepath=self.dataset_filepath
+    def _first_row(self) -> dict:
+        if is_parquet(self.dataset_filepath):
+            return self._first_parquet_row(0)
+        with closing(self.load_dataset()) as lines:
+            return next(csv.DictReader(lines), {})
+
+    def _first_parquet_row(self, row: int) -> dict:
+        batches = self._iter_parquet_batches(batch_size=1, start_row=row)
+        with closing(batches):
+            return next(batches).to_pylist()[0]
+
+    def _timeline_offset_ms(self, first_row: dict, row: dict) -> float:
+        """Milliseconds between the timestamps of the first row and a row."""
+        import pandas as pd
+
+        colname_dt = self.colname_dt
+        if not colname_dt or colname_dt not in first_row:
+            raise ValueError(
+                "The colname_dt timestamps of the prepared dataset are needed "
+                "to place this replay on the dataset timeline."
+            )
+        delta = pd.Timestamp(row[colname_dt]) - pd.Timestamp(first_row[colname_dt])
+        return delta.total_seconds() * 1000
+
+    def _save_checkpoint(
+        self, checkpoint: ReplayCheckpoint, sender, position: ReplayPosition
+    ) -> None:
+        """Deliver every event put so far, then record the position."""
+        sender.drain()
+        checkpoint.save(position)
+        logging.info(
+            {
+                "message": "Saved replay checkpoint",
+                "checkpoint": checkpoint.location,
+                "row": position.row,
+                "byte_offset": position.byte_offset,
+                "offset_ms": round(position.offset_ms, 3),
+            }
+        )
+
+    def _flush_metrics(
+        self, scheduler: EventScheduler, sent_events: int, sent_bytes: int
+    ) -> None:
+        """Add the counts of the replay loop since the last flush to the metrics.
+
+        The replay loop only keeps plain counters and a list of lag samples,
+        so it never takes the metrics locks per event.
+        """
+        counts = {
+            "events_sent": sent_events,
+            "bytes_sent": sent_bytes,
+            "events_shed": scheduler.shed_events,
+        }
+        delta = {
+            name: count - self._flushed_counts.get(name, 0)
+            for name, count in counts.items()
+        }
+        self._flushed_counts = counts
+        for name, count in delta.items():
+            if count:
+                self.metrics.inc(name, count)
+        lag_samples_ms, self._lag_samples_ms = self._lag_samples_ms, []
+        self.metrics.observe_many("schedule_lag_ms", lag_samples_ms)
+
+    def _log_progress(
+        self, scheduler: EventScheduler, sent_events: int, offset_ms: float
+    ) -> None:
+        simulated_dt = None
+        if self.first_event_dt:
+            simulated_dt = str(
+                datetime.fromisoformat(self.first_event_dt)
+                + timedelta(milliseconds=offset_ms)
+            )
+        logging.info(
+            {
+                "message": "Stream progress",
+                "sent_events": sent_events,
+                "simulated_dt": simulated_dt,
+                "lag_ms": round(scheduler.lag_ms, 3),
+                "max_lag_ms": round(scheduler.max_observed_lag_ms, 3),
+                "late_events": scheduler.late_events,
+                "shed_events": scheduler.shed_events,
+            }
+        )
+
+    def load_dataset(self, start_byte: int = 0) -> Iterator[str]:
+        """Stream the lines of the dataset from S3 one chunk at a time.
+
+        A local dataset is memory-mapped instead, and every line decoded
+        straight from the mapping. When starting from a byte offset, the
+        header line is read first so the lines can still be parsed with
+        csv.DictReader.
+        """
+        if start_byte:
+            with closing(self._iter_dataset_lines()) as lines:
+                yield str(next(lines, b""), "utf-8")
+            # e.g. resuming from a checkpoint saved after the last row: S3
+            # rejects a ranged GET from the end of the object
+            if self.source != "local" and start_byte >= self._dataset_size():
+                return
+
+        with closing(self._iter_dataset_lines(start_byte)) as lines:
+            for line in lines:
+                yield str(line, "utf-8")
+
+    def _iter_dataset_lines(self, start_byte: int = 0) -> Iterator[bytes]:
+        if self.source == "local":
+            return iter_file_lines_mmap(self.dataset_filepath, start_byte=start_byte)
+        return iter_file_lines_from_s3(
+            bucket_name=self.bucket_name,
+            filepath=self.dataset_filepath,
+            start_byte=start_byte,
+        )
+
+    def _iter_parquet_batches(self, **kwargs) -> Iterator:
+        if self.source == "local":
+            return iter_parquet_batches(self.dataset_filepath, **kwargs)
+        return iter_parquet_batches_from_s3(
+            bucket_name=self.bucket_name, filepath=self.dataset_filepath, **kwargs
+        )
+
+    def _dataset_size(self) -> int:
+        if self.source == "local":
+            return os.path.getsize(self.dataset_filepath)
+        return (
+            get_client("s3")
+            .head_object(Bucket=self.bucket_name, Key=self.dataset_filepath)
+            .get("ContentLength", 0)
         )
 
-        # parse the file
-        file_content = decoded_cdv_data.splitlines()
+    def _parquet_row_count(self) -> int:
+        if self.source == "local":
+            return get_parquet_row_count(self.dataset_filepath)
+        return get_parquet_row_count_from_s3(self.bucket_name, self.dataset_filepath)
+
+    def iter_event_batches(
+        self, start: Optional[ReplayPosition] = None, end: Optional[int] = None
+    ) -> Iterator[Tuple[EventBatch, ReplayPosition]]:
+        """Read the dataset and serialize it into events one batch at a time.
+
+        Parquet record batches are encoded in a single vectorized pass, CSV
+        rows are grouped into batches for the fastest available JSON encoder.
+        Reading starts at `start`, a CSV dataset with a ranged GET from its
+        byte offset and a Parquet dataset from the row group of its row, and
+        stops before `end`, a byte offset or row. With key partitioning, only
+        the rows of this worker's partition keys are serialized. Amplified
+        rows are fanned out one batch at a time, so memory grows with the
+        batch size times the factor, not with the dataset.
+
+        Yields:
+            Tuple[EventBatch, ReplayPosition]: Each batch with the position
+                of the row following it.
+        """
+        start = start or ReplayPosition()
+        row = start.row
+        if is_parquet(self.dataset_filepath):
+            for record_batch in self._iter_parquet_batches(
+                batch_size=self.serialize_batch_size,
+                start_row=row,
+                end_row=end,
+            ):
+                df, lead_ms = record_batch.to_pandas(), 0.0
+                if self.partition_by == "key" and self.workers > 1:
+                    df, lead_ms = select_frame(df, self.worker_index, self.workers)
+                if self.amplify > 1:
+                    df = amplify_frame(
+                        df,
+                        self.amplify,
+                        self.amplify_jitter_ms,
+                        np.random.default_rng(row),
+                        self.colname_dt,
+                        self.partition_key_column,
+                    )
+                row += len(record_batch)
+                event_batch = serialize_frame(df, self.partition_key_column)
+                event_batch.lead_ms = lead_ms
+                yield event_batch, ReplayPosition(row)
+            return
+
+        if end is not None and start.byte_offset >= end:
+            # an empty slice, e.g. of more workers than lines: a ranged GET
+            # from the end of the dataset is rejected by S3
+            return
+        lines = self.load_dataset(start_byte=start.byte_offset)
+        header = next(lines, "")
+        byte_offset = start.byte_offset or len(header.encode("utf-8"))
+
+        def count_bytes(lines: Iterator[str]) -> Iterator[str]:
+            nonlocal byte_offset
+            for line in lines:
+                if end is not None and byte_offset >= end:
+                    return
+                byte_offset += len(line.encode("utf-8"))
+                yield line
 
-        return file_content
+        encoder = get_json_encoder()
+        rows = csv.DictReader(chain([header], count_bytes(lines)))
+        # the reader pulls no line beyond the last row of a batch
+        for batch in iter_row_batches(rows, self.serialize_batch_size):
+            batch_rows, lead_ms = len(batch), 0.0
+            if self.partition_by == "key" and self.workers > 1:
+                batch, lead_ms = select_rows(batch, self.worker_index, self.workers)
+            if self.amplify > 1:
+                # seeded by row, so a resumed replay sends the same variants
+                batch = amplify_rows(
+                    batch,
+                    self.amplify,
+                    self.amplify_jitter_ms,
+                    np.random.default_rng(row),
+                    self.colname_dt,
+                    self.partition_key_column,
+                )
+            row += batch_rows
+            event_batch = serialize_rows(batch, encoder, self.partition_key_column)
+            event_batch.lead_ms = lead_ms
+            yield event_batch, ReplayPosition(row, byte_offset)
+
+    def iter_timed_events(self) -> Iterator[Tuple[float, bytes, str]]:
+        """Events of the whole dataset with their time on the colname_dt clock.
+
+        The time of the first event is read from its colname_dt timestamp,
+        the others follow from the delays, so the dataset is read once.
+
+        Yields:
+            Tuple[float, bytes, str]: Epoch milliseconds, payload and
+                partition key of every event.
+        """
+        import pandas as pd
+
+        first_row = self._first_row()
+        if not first_row:
+            return
+        if not self.colname_dt or self.colname_dt not in first_row:
+            raise ValueError(
+                f"The column '{self.colname_dt}' was not found in "
+                f"{self.dataset_filepath}, it is needed to merge it by event time."
+            )
+        if self.partition_key_column and self.partition_key_column not in first_row:
+            raise ValueError(
+                f"The partition key column '{self.partition_key_column}' was not "
+                f"found in {self.dataset_filepath}."
+            )
+        event_ms = pd.Timestamp(first_row[self.colname_dt]).value / 1e6
+        for event_batch, _ in self.iter_event_batches():
+            event_ms += event_batch.lead_ms
+            for event_data, partition_key, delay_ms in event_batch:
+                yield event_ms, event_data, partition_key
+                event_ms += delay_ms
 
     def start_stream(self) -> None:
-        """Conevrt rows in csv file on AWS S3 to events in AWS Kinesis stream."""
+        """Conevrt rows in csv file on AWS S3 to events in AWS Kinesis stream.
 
-        csv_reader = csv.DictReader(self.load_dataset())
+        With a checkpoint path, the replay position is saved every
+        `checkpoint_interval_s` after the sender delivered all events put so
+        far, and a restarted replay resumes from it: at least once, events
+        sent after the last checkpoint are sent again.
+        """
+        checkpoint = self.get_checkpoint()
+        position, end = self.get_slice()
+        if checkpoint and self.resume:
+            position = checkpoint.load() or position
+        if position.finished:
+            logging.info(
+                {
+                    "message": "Replay already complete according to its checkpoint",
+                    "checkpoint": checkpoint.location,
+                    "rows": position.row,
+                }
+            )
+            return {"statusCode": 200, "body": "Finished streaming data."}
+
+        event_batches = self.iter_event_batches(position, end)
 
         logging.info(
             {
@@ -43,34 +705,88 @@ class CSVtoStream:
                 "dataset_filepath": self.dataset_filepath,
                 "s3_bucket": self.bucket_name,
                 "kinesis_stream_name": self.kinesis_stream_name,
+                "batch_mode": self.batch_mode,
+                "start_row": position.row,
+                "start_byte": position.byte_offset,
+                "worker_index": self.worker_index,
+                "workers": self.workers,
             }
         )
-        # Skip the header row
-        _ = next(csv_reader, None)
+        sender = self.get_sender()
+        scheduler = self.get_scheduler()
+        reporter = self.get_metrics_reporter().start()
+        event_data = None
+        sent_events = 0
+        sent_bytes = 0
+        # offset of the current event from the first one on the dataset timeline
+        offset_ms = position.offset_ms
+        # offset of the oldest event waiting in the batch, None if nothing is pending
+        pending_since_ms = None
+        # aggregated records are buffered and flushed like batches
+        buffered = self.batch_mode or self.aggregate
+        next_report = time.monotonic() + LAG_REPORT_INTERVAL_S
+        next_metrics_flush = time.monotonic() + METRICS_FLUSH_INTERVAL_S
+        next_checkpoint = time.monotonic() + self.checkpoint_interval_s
 
-        # Process each row in the CSV file and send it to the Kinesis stream
-        for row in csv_reader:
+        if self.start_at is None:
+            scheduler.start(offset_ms)
+        else:
+            # every worker anchors the timeline to the shared start time
+            scheduler.start(shared_clock_offset_ms(self.start_at, self.speed))
+        try:
+            # Process each row in the CSV file and send it to the Kinesis stream
+            for event_batch, batch_end in event_batches:
+                offset_ms += event_batch.lead_ms
+                for event_index, (event_data, partition_key, delay_ms) in enumerate(
+                    event_batch, position.row
+                ):
+                    event_offset_ms, offset_ms = offset_ms, offset_ms + delay_ms
 
-            if "time_till_next_event_ms" in row:
-                delay_ms = int(float(row["time_till_next_event_ms"]))
-            else:
-                delay_ms = None
+                    # in batch mode, send buffered events at most batch_linger_ms late
+                    if pending_since_ms is not None:
+                        flush_at_ms = (
+                            pending_since_ms + self.batch_linger_ms * self.speed
+                        )
+                        if flush_at_ms <= event_offset_ms:
+                            scheduler.sleep_until(flush_at_ms)
+                            sender.flush()
+                            pending_since_ms = None
 
-            # create event
-            del row["time_till_next_event_ms"]
-            event_data = json.dumps(row)
-            self._kinesis_client.put_record(
-                StreamName=self.kinesis_stream_name,
-                Data=event_data,
-                PartitionKey=row[
-                    next(iter(row))
-                ],  # Assuming the first column can be used as a partition key
-            )
+                    admitted = scheduler.admit(event_offset_ms)
+                    if not event_index % LAG_SAMPLE_EVERY:
+                        self._lag_samples_ms.append(scheduler.lag_ms)
+                    if not admitted:
+                        continue
 
-            if delay_ms:
-                delay_seconds = delay_ms / 1000.0
-                logging.info(f"Applying delay of {delay_seconds}s before next event.")
-                time.sleep(delay_seconds)
+                    sender.put(event_data, partition_key=partition_key)
+                    sent_events += 1
+                    sent_bytes += len(event_data)
+                    if buffered and pending_since_ms is None:
+                        pending_since_ms = event_offset_ms
+
+                    now = time.monotonic()
+                    if now >= next_metrics_flush:
+                        next_metrics_flush = now + METRICS_FLUSH_INTERVAL_S
+                        self._flush_metrics(scheduler, sent_events, sent_bytes)
+                    if now >= next_report:
+                        next_report += LAG_REPORT_INTERVAL_S
+                        self._log_progress(scheduler, sent_events, event_offset_ms)
+
+                position = replace(batch_end, offset_ms=offset_ms)
+                if checkpoint and time.monotonic() >= next_checkpoint:
+                    self._save_checkpoint(checkpoint, sender, position)
+                    next_checkpoint = time.monotonic() + self.checkpoint_interval_s
+                    pending_since_ms = None
+        finally:
+            # drain (or stop, after a lane error) the sender lanes
+            try:
+                sender.close()
+            finally:
+                self._flush_metrics(scheduler, sent_events, sent_bytes)
+                reporter.close()
+        if checkpoint:
+            checkpoint.save(replace(position, finished=True))
+        self._log_progress(scheduler, sent_events, offset_ms)
 
         logging.info(
             {
@@ -78,14 +794,54 @@ class CSVtoStream:
                 "dataset_filepath": self.dataset_filepath,
                 "s3_bucket": self.bucket_name,
                 "kinesis_stream_name": self.kinesis_stream_name,
-                "event_data": event_data,
+                "event_data": event_data and event_data.decode("utf-8"),
             }
         )
-        # garbage collction
-        del event_data, delay_ms, delay_seconds
 
         return {"statusCode": 200, "body": "Finished streaming data."}
 
 
+def run_worker(**stream_kwargs) -> None:
+    CSVtoStream(**stream_kwargs).start_stream()
+
+
+def run_workers(
+    workers: int,
+    start_at: Optional[Union[str, float]] = None,
+    start_delay_s: float = 5.0,
+    target: Callable[..., None] = run_worker,
+    **stream_kwargs,
+) -> None:
+    """Run a partitioned replay with one local process per worker.
+
+    Stands in for the Fargate tasks of the StreamingStack when testing on
+    one machine. Unless `start_at` is given, the workers share a clock
+    starting `start_delay_s` from now, which leaves them time to start up.
+    """
+    start_at = parse_start_at(start_at) or time.time() + start_delay_s
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=target,
+            kwargs=dict(
+                stream_kwargs,
+                workers=workers,
+                worker_index=worker_index,
+                start_at=start_at,
+            ),
+            name=f"replay-worker-{worker_index}",
+        )
+        for worker_index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    failed = [process.name for process in processes if process.exitcode]
+    if failed:
+        raise RuntimeError(f"Replay workers failed: {', '.join(failed)}")
+
+
 if __name__ == "__main__":
     CSVtoStream().start_stream()
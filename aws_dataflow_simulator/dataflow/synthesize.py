@@ -0,0 +1,400 @@
+"""Synthetic datasets shaped like a real one, generated in parallel shards.
+
+A schema describes every column by what is needed to sample it with NumPy:
+
+    {"columns": [
+        {"name": "id", "kind": "key", "prefix": "cust_", "unique_ratio": 0.8},
+        {"name": "tx_datetime", "kind": "timestamp",
+         "start": "2024-08-19 15:00:00", "mean_gap_ms": 10.0,
+         "gap_quantiles_ms": [0.0, ..., 95.2]},
+        {"name": "category", "kind": "category",
+         "values": ["a", "b"], "weights": [0.7, 0.3]},
+        {"name": "amount", "kind": "float", "quantiles": [...], "decimals": 2},
+        {"name": "items", "kind": "int", "quantiles": [...]},
+    ]}
+
+Every column may also have a "null_fraction". Schemas are learned from a
+sample of an existing dataset with `learn_schema` or written by hand and
+loaded with `load_schema`.
+"""
+
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from aws_dataflow_simulator.dataflow.serialization import DELAY_COLUMN
+from aws_dataflow_simulator.utils_dataset import (
+    DATE_FORMAT,
+    is_parquet,
+    iter_parquet_batches,
+    parse_timestamps,
+    write_chunks,
+)
+
+logger = logging.getLogger(__name__)
+
+COLUMN_KINDS = ("key", "timestamp", "category", "float", "int")
+OUTPUT_FORMATS = ("csv", "parquet")
+
+# points of the empirical distributions stored for numeric columns and gaps
+QUANTILES = 101
+# numeric columns with at most this many values, e.g. flags, are categorical
+NUMERIC_MAX_CATEGORIES = 20
+# most decimals kept when rounding generated floats
+MAX_DECIMALS = 6
+
+
+def learn_schema(
+    dataset_path: str,
+    timestamp_column_name: Optional[str] = None,
+    sample_rows: int = 100_000,
+    max_categories: int = 1000,
+) -> dict:
+    """Learn the schema of a CSV or Parquet dataset from its first rows.
+
+    Strings with at most `max_categories` values are sampled with their
+    observed frequencies, other strings as keys sharing the common prefix of
+    the sample. Numbers are sampled from their quantiles, the timestamp
+    column from the quantiles of the gaps between consecutive events.
+
+    Args:
+        dataset_path (str): Path to the raw or prepared dataset.
+        timestamp_column_name (Optional[str]): Column with the event time.
+        sample_rows (int): Number of rows read to learn the schema.
+        max_categories (int): Most distinct values of a categorical column.
+
+    Returns:
+        dict: The schema.
+    """
+    df = _read_sample(dataset_path, sample_rows)
+    df.columns = [col.lower() for col in df.columns]
+    if timestamp_column_name and timestamp_column_name not in df.columns:
+        raise ValueError(
+            f"The column '{timestamp_column_name}' was not found in the dataset."
+        )
+
+    columns = []
+    for name in df.columns:
+        # delays are derived from the generated timestamps
+        if name == DELAY_COLUMN:
+            continue
+        series = df[name]
+        values = series.dropna()
+        if name == timestamp_column_name:
+            column = _learn_timestamp(values)
+        elif pd.api.types.is_bool_dtype(series) or (
+            pd.api.types.is_numeric_dtype(series)
+            and values.nunique() <= NUMERIC_MAX_CATEGORIES
+        ):
+            column = _learn_category(values)
+        elif pd.api.types.is_numeric_dtype(series):
+            column = _learn_number(values)
+        elif values.nunique() <= max_categories:
+            column = _learn_category(values.astype(str))
+        else:
+            column = _learn_key(values.astype(str))
+        column = {"name": name, **column}
+        null_fraction = float(series.isna().mean()) if len(series) else 0.0
+        if null_fraction:
+            column["null_fraction"] = null_fraction
+        columns.append(column)
+    return {"columns": columns}
+
+
+def _read_sample(dataset_path: str, sample_rows: int) -> pd.DataFrame:
+    if not is_parquet(dataset_path):
+        return pd.read_csv(dataset_path, nrows=sample_rows)
+    batches = []
+    for batch in iter_parquet_batches(dataset_path, end_row=sample_rows):
+        batches.append(batch.to_pandas())
+    return pd.concat(batches, ignore_index=True) if batches else pd.DataFrame()
+
+
+def _learn_timestamp(values: pd.Series) -> dict:
+    timestamps = parse_timestamps(values).sort_values()
+    if timestamps.empty:
+        raise ValueError("The timestamp column has no values.")
+    gaps_ms = timestamps.diff().dropna().dt.total_seconds().to_numpy() * 1000
+    if not len(gaps_ms):
+        gaps_ms = np.zeros(1)
+    return {
+        "kind": "timestamp",
+        "start": str(timestamps.iloc[0]),
+        "mean_gap_ms": float(gaps_ms.mean()),
+        "gap_quantiles_ms": _quantiles(gaps_ms),
+    }
+
+
+def _learn_category(values: pd.Series) -> dict:
+    frequencies = values.value_counts(normalize=True)
+    return {
+        "kind": "category",
+        "values": frequencies.index.tolist(),
+        "weights": frequencies.tolist(),
+    }
+
+
+def _learn_number(values: pd.Series) -> dict:
+    numbers = values.to_numpy(dtype=float)
+    if pd.api.types.is_integer_dtype(values):
+        return {"kind": "int", "quantiles": _quantiles(numbers)}
+    decimals = next(
+        (d for d in range(MAX_DECIMALS) if np.allclose(numbers, numbers.round(d))),
+        MAX_DECIMALS,
+    )
+    return {"kind": "float", "quantiles": _quantiles(numbers), "decimals": decimals}
+
+
+def _learn_key(values: pd.Series) -> dict:
+    return {
+        "kind": "key",
+        "prefix": os.path.commonprefix(values.unique().tolist()),
+        "unique_ratio": values.nunique() / len(values),
+    }
+
+
+def _quantiles(values: np.ndarray) -> List[float]:
+    return np.quantile(values, np.linspace(0, 1, QUANTILES)).tolist()
+
+
+def load_schema(path: str) -> dict:
+    """Load and validate a JSON schema file."""
+    with open(path) as file:
+        schema = json.load(file)
+    validate_schema(schema)
+    return schema
+
+
+def save_schema(schema: dict, path: str) -> None:
+    with open(path, "w") as file:
+        json.dump(schema, file, indent=2, default=str)
+
+
+def validate_schema(schema: dict) -> None:
+    """Check that every column of a schema can be sampled.
+
+    Raises:
+        ValueError: The schema is missing a column field or has an unknown kind.
+    """
+    columns = schema.get("columns") if isinstance(schema, dict) else None
+    if not columns:
+        raise ValueError("The schema must have a non-empty list of columns.")
+    required = {
+        "key": ("unique_ratio",),
+        "timestamp": ("start", "gap_quantiles_ms"),
+        "category": ("values", "weights"),
+        "float": ("quantiles",),
+        "int": ("quantiles",),
+    }
+    timestamps = 0
+    for column in columns:
+        kind = column.get("kind")
+        if "name" not in column or kind not in COLUMN_KINDS:
+            raise ValueError(
+                f"Every column needs a name and a kind from {COLUMN_KINDS}: {column}"
+            )
+        missing = [field for field in required[kind] if field not in column]
+        if kind == "key" and "cardinality" in column:
+            missing = []
+        if missing:
+            raise ValueError(f"Column '{column['name']}' is missing {missing}.")
+        if kind == "category" and len(column["values"]) != len(column["weights"]):
+            raise ValueError(f"Column '{column['name']}' needs one weight per value.")
+        timestamps += kind == "timestamp"
+    if timestamps > 1:
+        raise ValueError("The schema can have at most one timestamp column.")
+
+
+def timestamp_column(schema: dict) -> Optional[dict]:
+    return next((col for col in schema["columns"] if col["kind"] == "timestamp"), None)
+
+
+def shard_gaps_ms(column: dict, rows: int, rng: np.random.Generator) -> np.ndarray:
+    """Sample the gaps after every row of a shard from the learned distribution.
+
+    The gaps are scaled to sum to `rows * mean_gap_ms`, so every shard spans
+    a known part of the timeline: shards generated independently line up
+    one after another without overlapping.
+    """
+    quantiles = np.asarray(column["gap_quantiles_ms"], dtype=float)
+    gaps_ms = np.interp(rng.random(rows), np.linspace(0, 1, len(quantiles)), quantiles)
+    mean_gap_ms = float(column.get("mean_gap_ms", quantiles.mean()))
+    total_ms = gaps_ms.sum()
+    if total_ms > 0:
+        gaps_ms *= rows * mean_gap_ms / total_ms
+    return gaps_ms
+
+
+def sample_column(
+    column: dict, rows: int, rng: np.random.Generator, total_rows: int
+) -> np.ndarray:
+    """Sample the values of every kind of column but timestamps."""
+    kind = column["kind"]
+    if kind == "category":
+        weights = np.asarray(column["weights"], dtype=float)
+        indices = rng.choice(len(weights), size=rows, p=weights / weights.sum())
+        values = np.empty(len(weights), dtype=object)
+        values[:] = column["values"]
+        return values[indices]
+    if kind == "key":
+        cardinality = column.get("cardinality") or max(
+            1, round(column["unique_ratio"] * total_rows)
+        )
+        keys = rng.integers(0, cardinality, rows).astype(str)
+        return np.char.add(column.get("prefix", ""), keys).astype(object)
+
+    quantiles = np.asarray(column["quantiles"], dtype=float)
+    values = np.interp(rng.random(rows), np.linspace(0, 1, len(quantiles)), quantiles)
+    if kind == "int":
+        return values.round().astype("int64")
+    return values.round(column.get("decimals", MAX_DECIMALS))
+
+
+def iter_shard_chunks(
+    schema: dict,
+    rows: int,
+    shard_offset_ms: float,
+    total_rows: int,
+    seed: int,
+    shard_index: int,
+    chunksize: int = 100_000,
+) -> Iterator[pd.DataFrame]:
+    """Generate the rows of one shard `chunksize` rows at a time.
+
+    Every shard has its own random stream derived from the seed, so the
+    output does not depend on how many processes generate it.
+    """
+    rng = np.random.default_rng([seed, shard_index])
+    ts_column = timestamp_column(schema)
+    if ts_column is not None:
+        gaps_ms = shard_gaps_ms(ts_column, rows, rng)
+        offsets_ms = shard_offset_ms + np.cumsum(gaps_ms) - gaps_ms
+        start = pd.Timestamp(ts_column["start"])
+
+    for chunk_start in range(0, rows, chunksize):
+        size = min(chunksize, rows - chunk_start)
+        columns = {}
+        for column in schema["columns"]:
+            if column["kind"] == "timestamp":
+                chunk_offsets_ms = offsets_ms[chunk_start : chunk_start + size]
+                values = start + pd.to_timedelta(chunk_offsets_ms, unit="ms")
+            else:
+                values = sample_column(column, size, rng, total_rows)
+            values = pd.Series(values)
+            null_fraction = column.get("null_fraction", 0)
+            if null_fraction:
+                if column["kind"] == "int":
+                    values = values.astype("Int64")
+                values[rng.random(size) < null_fraction] = None
+            columns[column["name"]] = values
+        if ts_column is not None:
+            columns[DELAY_COLUMN] = gaps_ms[chunk_start : chunk_start + size]
+        yield pd.DataFrame(columns)
+
+
+def generate_shard(
+    schema: dict,
+    path: str,
+    rows: int,
+    shard_offset_ms: float,
+    total_rows: int,
+    seed: int,
+    shard_index: int,
+    chunksize: int = 100_000,
+) -> int:
+    """Write one shard to a CSV or Parquet file, runs in a worker process."""
+    chunks = iter_shard_chunks(
+        schema, rows, shard_offset_ms, total_rows, seed, shard_index, chunksize
+    )
+    return write_chunks(chunks, path, date_format=DATE_FORMAT)
+
+
+def synthesize_dataset(
+    schema: dict,
+    rows: int,
+    output_dir: str,
+    output_format: str = "csv",
+    shard_rows: int = 1_000_000,
+    processes: Optional[int] = None,
+    seed: int = 0,
+    chunksize: int = 100_000,
+) -> List[str]:
+    """Generate `rows` rows as shards of `shard_rows` rows with a process pool.
+
+    Shard k covers rows `k * shard_rows` onwards and, with a timestamp
+    column, starts `k * shard_rows * mean_gap_ms` after the schema start, so
+    the shards read in order form one timeline. Every shard has a
+    time_till_next_event_ms column and can be replayed as it is. At most two
+    shards per process are in flight.
+
+    Args:
+        schema (dict): Schema learned with learn_schema or loaded with load_schema.
+        rows (int): Total number of rows.
+        output_dir (str): Directory the part-<k>.<format> shards are written to.
+        output_format (str): Either csv or parquet.
+        shard_rows (int): Number of rows of every shard.
+        processes (Optional[int]): Number of processes, one per CPU if None.
+        seed (int): Seed of the random streams of the shards.
+        chunksize (int): Number of rows held in memory per process.
+
+    Returns:
+        List[str]: Paths of the shards in timeline order.
+    """
+    validate_schema(schema)
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}.")
+    if rows < 0 or shard_rows < 1:
+        raise ValueError("rows must be non-negative and shard_rows positive.")
+
+    os.makedirs(output_dir, exist_ok=True)
+    ts_column = timestamp_column(schema)
+    mean_gap_ms = 0.0
+    if ts_column is not None:
+        mean_gap_ms = float(
+            ts_column.get("mean_gap_ms", np.mean(ts_column["gap_quantiles_ms"]))
+        )
+
+    shards = []
+    for shard_index, first_row in enumerate(range(0, rows, shard_rows)):
+        path = os.path.join(output_dir, f"part-{shard_index:05d}.{output_format}")
+        shards.append((shard_index, path, min(shard_rows, rows - first_row), first_row))
+
+    workers = processes or os.cpu_count() or 1
+    max_pending = 2 * workers
+    with ProcessPoolExecutor(max_workers=min(workers, len(shards) or 1)) as pool:
+        pending, paths = set(), {}
+        for shard_index, path, shard_size, first_row in shards:
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _log_shards(done, paths)
+            future = pool.submit(
+                generate_shard,
+                schema,
+                path,
+                shard_size,
+                first_row * mean_gap_ms,
+                rows,
+                seed,
+                shard_index,
+                chunksize,
+            )
+            paths[future] = path
+            pending.add(future)
+        _log_shards(wait(pending).done, paths)
+    return [path for _, path, _, _ in shards]
+
+
+def _log_shards(futures, paths: dict) -> None:
+    for future in futures:
+        logging.info(
+            {
+                "message": "Wrote synthetic shard",
+                "path": paths[future],
+                "rows": future.result(),
+            }
+        )
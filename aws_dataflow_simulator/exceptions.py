@@ -7,3 +7,7 @@ class CouldNotLoadFileFromS3(Exception):
 
 class CouldNotUploadFileToS3(Exception):
     """Could not upload file to AWS S3."""
+
+
+class CouldNotPutRecordsToKinesis(Exception):
+    """Could not put records to AWS Kinesis stream."""
@@ -1,5 +1,114 @@
+import heapq
+import io
+import mmap
+import os
+import tempfile
+import warnings
+from typing import Any, Iterator, List, Optional
+
+import numpy as np
 import pandas as pd
-from typing import Optional
+from pandas.tseries.api import guess_datetime_format
+
+DELAY_COLUMN = "time_till_next_event_ms"
+# CSV timestamps are written with one format, so that every chunk and every
+# way of preparing a dataset writes them the same
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+# sort key column written in front of every row of a sorted run
+_RUN_KEY_COLUMN = "__timestamp_ns"
+# dataset.dt_format values of numeric epoch timestamps and their units
+EPOCH_FORMATS = {"epoch_s": "s", "epoch_ms": "ms", "epoch_us": "us", "epoch_ns": "ns"}
+# number of distinct timestamps a format is inferred and checked on
+FORMAT_SAMPLE_SIZE = 1000
+
+
+def infer_epoch_unit(values: pd.Series) -> str:
+    """Unit of numeric epoch timestamps, from their magnitude.
+
+    Seconds up to 1e11 (year 5138), then milliseconds, microseconds and
+    nanoseconds, each a thousand times larger.
+    """
+    largest = pd.to_numeric(values).abs().max()
+    for unit, limit in (("s", 1e11), ("ms", 1e14), ("us", 1e17)):
+        if not largest >= limit:
+            return unit
+    return "ns"
+
+
+def infer_timestamp_format(values) -> str:
+    """Infer the strftime format of timestamp strings from a sample.
+
+    "ISO8601" is used if every sampled value is an ISO 8601 timestamp, it
+    parses fastest and allows fractional seconds to vary, otherwise the
+    format guessed from the first value if it parses every sampled value,
+    and "mixed", pandas' per-value parsing, as the last resort.
+    """
+    sample = pd.Series(values).dropna().astype(str).iloc[:FORMAT_SAMPLE_SIZE]
+    if sample.empty:
+        return "ISO8601"
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        guessed_format = guess_datetime_format(sample.iloc[0])
+    for timestamp_format in filter(None, ("ISO8601", guessed_format)):
+        parsed = pd.to_datetime(sample, format=timestamp_format, errors="coerce")
+        if parsed.notna().all():
+            return timestamp_format
+    return "mixed"
+
+
+def infer_column_format(values: pd.Series) -> str:
+    """Format of a timestamp column for parse_timestamps, see EPOCH_FORMATS."""
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return f"epoch_{infer_epoch_unit(values)}"
+    return infer_timestamp_format(pd.unique(values.dropna()))
+
+
+def parse_timestamps(
+    values: pd.Series, timestamp_format: Optional[str] = None
+) -> pd.Series:
+    """Parse a timestamp column, faster than pd.to_datetime without a format.
+
+    Numeric columns, or any column with an epoch_* format, are converted
+    from epoch seconds, milliseconds, microseconds or nanoseconds in one
+    vectorized step. Strings are parsed with `timestamp_format`, or the
+    format inferred from a sample, and every distinct string only once:
+    logs with many events per second repeat the same timestamps.
+
+    Args:
+        values (pd.Series): Timestamps as strings or epoch numbers.
+        timestamp_format (Optional[str]): strftime format, "ISO8601",
+            "mixed" or one of EPOCH_FORMATS, inferred if None.
+
+    Returns:
+        pd.Series: The parsed timestamps.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if timestamp_format in EPOCH_FORMATS or (
+        timestamp_format is None
+        and pd.api.types.is_numeric_dtype(values)
+        and not pd.api.types.is_bool_dtype(values)
+    ):
+        unit = EPOCH_FORMATS.get(timestamp_format) or infer_epoch_unit(values)
+        return pd.to_datetime(pd.to_numeric(values), unit=unit)
+
+    codes, uniques = pd.factorize(values)
+    if timestamp_format is not None:
+        parsed = pd.to_datetime(uniques, format=timestamp_format)
+    else:
+        inferred_format = infer_timestamp_format(uniques)
+        try:
+            parsed = pd.to_datetime(uniques, format=inferred_format)
+        except ValueError:
+            # values past the sample have another format
+            parsed = pd.to_datetime(uniques, format="mixed")
+    parsed = pd.DatetimeIndex(parsed)
+    return pd.Series(
+        parsed.take(codes, allow_fill=True, fill_value=pd.NaT),
+        index=values.index,
+        name=values.name,
+    )
 
 
 def preprocess_dataset(
@@ -8,6 +117,7 @@ def preprocess_dataset(
     apply_delay: bool,
     delay_ms: Optional[int],
     timestamp_column_name: Optional[str],
+    timestamp_format: Optional[str] = None,
 ) -> pd.DataFrame:
     """Adds time_till_next_event_ms column for streaming.
 
@@ -18,6 +128,8 @@ def preprocess_dataset(
         delay_ms (Optional[int]): If apply_delay is True, adds static delay between events.
         timestamp_column_name (Optional[str]): If apply_delay is True,
             uses timestamp_column_name to calculate the difference between row events.
+        timestamp_format (Optional[str]): Format of timestamp_column_name,
+            see parse_timestamps, inferred if None.
 
     Returns:
         pd.DataFrame: The preprocessed DataFrame.
@@ -42,7 +154,9 @@ def preprocess_dataset(
             )
 
         # Convert the datetime column to datetime objects
-        df[timestamp_column_name] = pd.to_datetime(df[timestamp_column_name])
+        df[timestamp_column_name] = parse_timestamps(
+            df[timestamp_column_name], timestamp_format
+        )
 
         # Sort by the datetime column if not already sorted
         df = df.sort_values(by=timestamp_column_name)
@@ -60,3 +174,410 @@ def preprocess_dataset(
         raise ValueError("Either delay_ms or timestamp_column_name must be specified.")
 
     return df
+
+
+def is_parquet(filepath: str) -> bool:
+    """Check if a dataset path refers to a Parquet file."""
+    return os.path.splitext(str(filepath))[1].lower() in PARQUET_EXTENSIONS
+
+
+def iter_file_lines_mmap(filepath: str, start_byte: int = 0) -> Iterator[memoryview]:
+    """Stream the lines of a local file from a read-only memory map.
+
+    Lines, line endings included, are memoryview slices of the mapping, so
+    nothing is copied before the caller decodes them, and repeated reads of
+    the same file are served from the page cache.
+
+    Args:
+        filepath (str): Path of the local file.
+        start_byte (int): Offset of the first line to read.
+    """
+    with open(filepath, "rb") as file:
+        if not os.fstat(file.fileno()).st_size:
+            return
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mapping, "madvise"):
+        mapping.madvise(mmap.MADV_SEQUENTIAL)
+    view = memoryview(mapping)
+    try:
+        start, size = start_byte, len(mapping)
+        while start < size:
+            end = mapping.find(b"\n", start)
+            end = size if end < 0 else end + 1
+            yield view[start:end]
+            start = end
+    finally:
+        try:
+            view.release()
+            mapping.close()
+        except BufferError:
+            # a line is still referenced, the mapping is closed once it is freed
+            pass
+
+
+def iter_parquet_file_batches(
+    parquet_file: Any,
+    batch_size: int = 10000,
+    start_row: int = 0,
+    end_row: Optional[int] = None,
+) -> Iterator[Any]:
+    """Read the rows of a pyarrow ParquetFile from start_row up to end_row.
+
+    Row groups before start_row are skipped using the row counts in the
+    footer, without being read.
+    """
+    row_groups, skip_rows = [], start_row
+    for index in range(parquet_file.num_row_groups):
+        num_rows = parquet_file.metadata.row_group(index).num_rows
+        if skip_rows >= num_rows and not row_groups:
+            skip_rows -= num_rows
+        else:
+            row_groups.append(index)
+    if not row_groups:
+        return
+    remaining_rows = None if end_row is None else max(0, end_row - start_row)
+    for batch in parquet_file.iter_batches(
+        batch_size=batch_size, row_groups=row_groups
+    ):
+        if skip_rows:
+            skipped = min(skip_rows, len(batch))
+            batch, skip_rows = batch.slice(skipped), skip_rows - skipped
+        if remaining_rows is not None:
+            if not remaining_rows:
+                return
+            batch = batch.slice(0, remaining_rows)
+            remaining_rows -= len(batch)
+        if len(batch):
+            yield batch
+
+
+def iter_parquet_batches(
+    filepath: str,
+    batch_size: int = 10000,
+    start_row: int = 0,
+    end_row: Optional[int] = None,
+) -> Iterator[Any]:
+    """Stream the rows of a local, memory-mapped Parquet file as record batches."""
+    _, pq = _import_pyarrow()
+    parquet_file = pq.ParquetFile(filepath, memory_map=True)
+    try:
+        yield from iter_parquet_file_batches(
+            parquet_file, batch_size, start_row, end_row
+        )
+    finally:
+        parquet_file.close()
+
+
+def get_parquet_row_count(filepath: str) -> int:
+    """Number of rows of a local Parquet file, read from its footer."""
+    _, pq = _import_pyarrow()
+    return pq.ParquetFile(filepath).metadata.num_rows
+
+
+def save_processed_dataset(df: pd.DataFrame, output_path: str) -> None:
+    """Write a processed dataset as CSV or, for .parquet paths, as Parquet.
+
+    Parquet keeps the column types, so the timestamp and delay columns do not
+    round-trip through strings. CSV timestamps are written with DATE_FORMAT,
+    like preprocess_dataset_chunked writes them.
+    """
+    if is_parquet(output_path):
+        _import_pyarrow()
+        df.to_parquet(output_path, index=False)
+    else:
+        df.to_csv(output_path, index=False, date_format=DATE_FORMAT)
+
+
+def preprocess_dataset_chunked(
+    dataset_path: str,
+    output_path: str,
+    start_datetime: Optional[str],
+    apply_delay: bool,
+    delay_ms: Optional[int],
+    timestamp_column_name: Optional[str],
+    chunksize: int = 1_000_000,
+    tmp_dir: Optional[str] = None,
+    timestamp_format: Optional[str] = None,
+) -> int:
+    """Out-of-core variant of preprocess_dataset for datasets larger than RAM.
+
+    The CSV is read in chunks of `chunksize` rows and written straight to
+    `output_path`. time_till_next_event_ms is computed across chunk
+    boundaries by holding back the last row of every chunk. Input that is not
+    sorted by `timestamp_column_name` is sorted with an external merge sort:
+    each chunk is sorted into a run file in `tmp_dir` and the runs are merged
+    lazily, so peak memory depends on the chunk size, not the dataset size.
+
+    Args:
+        dataset_path (str): Path to the dataset CSV file.
+        output_path (str): Path of the processed CSV file to write.
+        start_datetime (Optional[str]): The datetime to normalize the timestamps to.
+        apply_delay (bool): Whether to apply delay or stream as fast as possible.
+        delay_ms (Optional[int]): If apply_delay is True, adds static delay between events.
+        timestamp_column_name (Optional[str]): If apply_delay is True,
+            uses timestamp_column_name to calculate the difference between row events.
+        chunksize (int): Number of rows held in memory at a time.
+        tmp_dir (Optional[str]): Directory for the sorted runs, defaults to the system one.
+        timestamp_format (Optional[str]): Format of timestamp_column_name,
+            see parse_timestamps, inferred if None.
+
+    Returns:
+        int: Number of rows written.
+    """
+    # every row group of a Parquet file needs the same column types
+    dtypes = _infer_dtypes(dataset_path, chunksize) if is_parquet(output_path) else None
+    if not apply_delay:
+        return write_chunks(
+            _read_chunks(dataset_path, chunksize, dtypes=dtypes), output_path
+        )
+
+    assert start_datetime, "You must specify start datetime for first event."
+
+    if delay_ms:
+        chunks = (
+            chunk.assign(**{DELAY_COLUMN: delay_ms})
+            for chunk in _read_chunks(dataset_path, chunksize, dtypes=dtypes)
+        )
+        return write_chunks(chunks, output_path)
+    if not timestamp_column_name:
+        raise ValueError("Either delay_ms or timestamp_column_name must be specified.")
+
+    header = pd.read_csv(dataset_path, nrows=0).columns
+    if timestamp_column_name not in [col.lower() for col in header]:
+        raise ValueError(
+            f"The column '{timestamp_column_name}' was not found in the dataset."
+        )
+
+    if timestamp_format is None:
+        # inferred once, so ambiguous dates such as 01/02 read the same in every chunk
+        column = next(col for col in header if col.lower() == timestamp_column_name)
+        first_chunk = pd.read_csv(dataset_path, usecols=[column], nrows=chunksize)
+        timestamp_format = infer_column_format(first_chunk[column])
+
+    # sorted input is written in one pass, only unsorted input is sorted
+    try:
+        chunks = _check_sorted(
+            _read_chunks(
+                dataset_path, chunksize, timestamp_column_name, timestamp_format, dtypes
+            ),
+            timestamp_column_name,
+        )
+        return write_chunks(
+            _add_delays(chunks, timestamp_column_name),
+            output_path,
+            date_format=DATE_FORMAT,
+        )
+    except _UnsortedInput:
+        pass
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as run_dir:
+        run_paths = _write_sorted_runs(
+            dataset_path,
+            timestamp_column_name,
+            chunksize,
+            run_dir,
+            timestamp_format,
+            dtypes,
+        )
+        run_dtypes = None
+        if dtypes is not None:
+            run_dtypes = {
+                col.lower(): dtype
+                for col, dtype in dtypes.items()
+                if col.lower() != timestamp_column_name
+            }
+        chunks = _merge_sorted_runs(
+            run_paths, timestamp_column_name, chunksize, run_dtypes
+        )
+        return write_chunks(
+            _add_delays(chunks, timestamp_column_name),
+            output_path,
+            date_format=DATE_FORMAT,
+        )
+
+
+def _infer_dtypes(dataset_path: str, chunksize: int) -> dict:
+    """Column dtypes that hold the values of every chunk of the CSV.
+
+    pd.read_csv infers the dtypes of every chunk on its own, e.g. int64 for
+    a column that only holds strings further down. Numeric dtypes are
+    widened to their common type, any other mismatch becomes object.
+    """
+    dtypes = {}
+    for chunk in pd.read_csv(dataset_path, chunksize=chunksize):
+        for col, dtype in chunk.dtypes.items():
+            previous = dtypes.setdefault(col, dtype)
+            if previous == dtype:
+                continue
+            if all(
+                pd.api.types.is_numeric_dtype(d) and not pd.api.types.is_bool_dtype(d)
+                for d in (previous, dtype)
+            ):
+                dtypes[col] = np.result_type(previous, dtype)
+            else:
+                dtypes[col] = np.dtype(object)
+    return dtypes
+
+
+def _read_chunks(
+    dataset_path: str,
+    chunksize: int,
+    timestamp_column_name: Optional[str] = None,
+    timestamp_format: Optional[str] = None,
+    dtypes: Optional[dict] = None,
+) -> Iterator[pd.DataFrame]:
+    """Read the CSV in chunks with lowercase columns and parsed timestamps."""
+    for chunk in pd.read_csv(dataset_path, chunksize=chunksize, dtype=dtypes):
+        chunk.columns = [col.lower() for col in chunk.columns]
+        if timestamp_column_name:
+            try:
+                chunk[timestamp_column_name] = parse_timestamps(
+                    chunk[timestamp_column_name], timestamp_format
+                )
+            except ValueError as e:
+                raise ValueError(
+                    f"The timestamps of '{timestamp_column_name}' do not all have "
+                    f"the format {timestamp_format!r}, set it with dataset.dt_format: "
+                    f"{e}"
+                ) from e
+        yield chunk
+
+
+class _UnsortedInput(Exception):
+    """The chunks are not sorted by their timestamps, see _check_sorted."""
+
+
+def _check_sorted(
+    chunks: Iterator[pd.DataFrame], timestamp_column_name: str
+) -> Iterator[pd.DataFrame]:
+    """Pass sorted chunks through, raise _UnsortedInput at the first unsorted one."""
+    previous = None
+    for chunk in chunks:
+        timestamps = chunk[timestamp_column_name]
+        if not timestamps.is_monotonic_increasing or (
+            previous is not None and len(timestamps) and timestamps.iloc[0] < previous
+        ):
+            raise _UnsortedInput()
+        if len(timestamps):
+            previous = timestamps.iloc[-1]
+        yield chunk
+
+
+def _add_delays(
+    chunks: Iterator[pd.DataFrame], timestamp_column_name: str
+) -> Iterator[pd.DataFrame]:
+    """Add time_till_next_event_ms to sorted chunks, carrying the last row over."""
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        chunk[DELAY_COLUMN] = (
+            chunk[timestamp_column_name].diff().shift(-1).dt.total_seconds() * 1000
+        )
+        # the delay of the last row depends on the first row of the next chunk
+        carry = chunk.iloc[-1:].drop(columns=DELAY_COLUMN)
+        yield chunk.iloc[:-1]
+    if carry is not None:
+        yield carry.assign(**{DELAY_COLUMN: 0.0})
+
+
+def write_chunks(
+    chunks: Iterator[pd.DataFrame], output_path: str, date_format: Optional[str] = None
+) -> int:
+    """Write chunks to a single CSV or Parquet file, returning the number of rows."""
+    if is_parquet(output_path):
+        return _write_parquet_chunks(chunks, output_path)
+
+    rows = 0
+    with open(output_path, "w", newline="") as file:
+        for chunk in chunks:
+            chunk.to_csv(
+                file, index=False, header=file.tell() == 0, date_format=date_format
+            )
+            rows += len(chunk)
+    return rows
+
+
+def _write_parquet_chunks(chunks: Iterator[pd.DataFrame], output_path: str) -> int:
+    """Write chunks as row groups of one Parquet file with the first chunk's schema."""
+    pa, pq = _import_pyarrow()
+    rows, writer = 0, None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = pq.ParquetWriter(output_path, table.schema)
+            else:
+                table = pa.Table.from_pandas(
+                    chunk, schema=writer.schema, preserve_index=False
+                )
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(
+            "Parquet datasets require pyarrow, "
+            "install aws-dataflow-simulator with the parquet extra."
+        )
+    return pa, pq
+
+
+def _write_sorted_runs(
+    dataset_path: str,
+    timestamp_column_name: str,
+    chunksize: int,
+    run_dir: str,
+    timestamp_format: Optional[str] = None,
+    dtypes: Optional[dict] = None,
+) -> List[str]:
+    """Sort every chunk in memory and write it as a run file keyed by timestamp."""
+    run_paths = []
+    for i, chunk in enumerate(
+        _read_chunks(
+            dataset_path, chunksize, timestamp_column_name, timestamp_format, dtypes
+        )
+    ):
+        chunk = chunk.sort_values(by=timestamp_column_name, kind="stable")
+        chunk.insert(0, _RUN_KEY_COLUMN, chunk[timestamp_column_name].astype("int64"))
+        run_path = os.path.join(run_dir, f"run_{i:06d}.csv")
+        chunk.to_csv(run_path, index=False)
+        run_paths.append(run_path)
+    return run_paths
+
+
+def _merge_sorted_runs(
+    run_paths: List[str],
+    timestamp_column_name: str,
+    chunksize: int,
+    dtypes: Optional[dict] = None,
+) -> Iterator[pd.DataFrame]:
+    """Lazily k-way merge the sorted runs back into chunks of chunksize rows."""
+    files = [open(run_path, newline="") for run_path in run_paths]
+    try:
+        header = None
+        for file in files:
+            header = file.readline()
+        merged = heapq.merge(*files, key=lambda line: int(line.split(",", 1)[0]))
+        while True:
+            lines = [line for _, line in zip(range(chunksize), merged)]
+            if not lines:
+                return
+            chunk = pd.read_csv(io.StringIO(header + "".join(lines)), dtype=dtypes)
+            chunk = chunk.drop(columns=_RUN_KEY_COLUMN)
+            # runs are written per chunk, so fractional seconds may be missing
+            chunk[timestamp_column_name] = pd.to_datetime(
+                chunk[timestamp_column_name], format="ISO8601"
+            )
+            yield chunk
+    finally:
+        for file in files:
+            file.close()
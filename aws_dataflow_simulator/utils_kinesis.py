@@ -1,19 +1,35 @@
-import boto3
 import base64
+import json
+import logging
 import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
 
+from aws_dataflow_simulator.clients import get_client
 from aws_dataflow_simulator.config import get_dataset_filepath
+from aws_dataflow_simulator.dataflow.aggregation import deaggregate, is_aggregated
 import csv
 
+logger = logging.getLogger(__name__)
+
 # AWS Kinesis Stream configuration
 STREAM_NAME = os.getenv("KINESIS_STREAM_NAME")
 
-# Initialize a Kinesis client
-kinesis_client = boto3.client("kinesis")
+# GetRecords returns at most 10000 records and allows 5 calls/s per shard
+MAX_RECORDS_PER_GET = 10000
+MIN_GET_INTERVAL_S = 0.2
+
+
+def get_kinesis_client():
+    """Shared Kinesis client, created on first use instead of at import."""
+    return get_client("kinesis")
 
 
 # Read the header from the CSV file
-def get_csv_header(file_path=get_dataset_filepath(processed=True)):
+def get_csv_header(file_path=None):
+    file_path = file_path or get_dataset_filepath(processed=True)
     with open(file_path, newline="") as csvfile:
         reader = csv.reader(csvfile)
         header = next(reader)  # Read the first line, which is the header
@@ -28,19 +44,26 @@ def row_to_dict(row_data, header):
     return dict(zip(header, row_values))
 
 
-def get_shard_iterator(stream_name, shard_id):
-    response = kinesis_client.get_shard_iterator(
-        StreamName=stream_name,
-        ShardId=shard_id,
-        ShardIteratorType="TRIM_HORIZON",  # You can change this to "LATEST" to get only the latest events
-    )
+def get_shard_iterator(
+    stream_name, shard_id, iterator_type="TRIM_HORIZON", sequence_number=None
+):
+    request = {
+        "StreamName": stream_name,
+        "ShardId": shard_id,
+        # You can change this to "LATEST" to get only the latest events
+        "ShardIteratorType": iterator_type,
+    }
+    if sequence_number:
+        request["ShardIteratorType"] = "AFTER_SEQUENCE_NUMBER"
+        request["StartingSequenceNumber"] = sequence_number
+    response = get_kinesis_client().get_shard_iterator(**request)
     return response["ShardIterator"]
 
 
-def get_records(shard_iterator):
-    response = kinesis_client.get_records(
+def get_records(shard_iterator, limit=MAX_RECORDS_PER_GET):
+    response = get_kinesis_client().get_records(
         ShardIterator=shard_iterator,
-        Limit=10,  # Adjust the limit as needed
+        Limit=limit,
     )
     return response
 
@@ -49,40 +72,256 @@ def decode_data(base64_data):
     return base64.b64decode(base64_data).decode("utf-8")
 
 
-def process_stream():
-    _ = get_csv_header()
-    # Describe the stream to get shard IDs
-    stream_description = kinesis_client.describe_stream(StreamName=STREAM_NAME)
-    shards = stream_description["StreamDescription"]["Shards"]
-    print(shards)
+def deaggregate_records(records: List[dict]) -> List[dict]:
+    """Expand KPL aggregated records into their user records.
+
+    Every user record keeps the fields of the Kinesis record it came in,
+    with its own Data and PartitionKey, and a SubSequenceNumber giving its
+    position within the aggregated record. Other records are returned as is.
+    """
+    user_records = []
+    for record in records:
+        data = record["Data"]
+        if not is_aggregated(data):
+            user_records.append(record)
+            continue
+        for sub_sequence_number, (
+            partition_key,
+            explicit_hash_key,
+            user_data,
+        ) in enumerate(deaggregate(data)):
+            user_record = dict(
+                record,
+                Data=user_data,
+                PartitionKey=partition_key,
+                SubSequenceNumber=sub_sequence_number,
+            )
+            if explicit_hash_key is not None:
+                user_record["ExplicitHashKey"] = explicit_hash_key
+            user_records.append(user_record)
+    return user_records
+
+
+class ShardCheckpoint:
+    """Last processed sequence number per shard, persisted to a local JSON file.
+
+    Closed shards that were read to the end are stored as SHARD_END so they
+    are skipped on restart.
+    """
+
+    SHARD_END = "SHARD_END"
+
+    def __init__(self, filepath: Optional[str] = None):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self._sequence_numbers: Dict[str, str] = {}
+        if filepath and os.path.isfile(filepath):
+            with open(filepath, "r") as file:
+                self._sequence_numbers = json.load(file)
+
+    def get(self, shard_id: str) -> Optional[str]:
+        with self._lock:
+            return self._sequence_numbers.get(shard_id)
+
+    def update(self, shard_id: str, sequence_number: str) -> None:
+        with self._lock:
+            self._sequence_numbers[shard_id] = sequence_number
+
+    def save(self) -> None:
+        """Atomically write the checkpoint file."""
+        if not self.filepath:
+            return
+        with self._lock:
+            data = dict(self._sequence_numbers)
+        tmp_filepath = f"{self.filepath}.tmp"
+        with open(tmp_filepath, "w") as file:
+            json.dump(data, file, indent=2, sort_keys=True)
+        os.replace(tmp_filepath, self.filepath)
+
+
+class KinesisConsumer:
+    """Read every shard of a stream concurrently, one thread per shard.
+
+    Each reader asks for large GetRecords batches, polls quickly while
+    MillisBehindLatest shows it is behind and slows down to `idle_sleep_s`
+    once it has caught up. Throttled reads back off exponentially. Child
+    shards are read only after their parent shard is finished, so per key
+    ordering survives resharding. With a checkpoint file, a restart resumes
+    after the last processed sequence number instead of TRIM_HORIZON.
+    KPL aggregated records are expanded into their user records unless
+    `deaggregate` is False.
+
+    Args:
+        stream_name (str): Name of the Kinesis stream.
+        process_records (Callable): Called with the shard id and each non-empty
+            list of records, from the shard's reader thread.
+        checkpoint_path (Optional[str]): Local JSON file with sequence numbers.
+        iterator_type (str): Where to start shards without a checkpoint.
+        stop_at_latest (bool): Stop a shard once it has caught up with the tip.
+        checkpoint_interval_s (float): How often the checkpoint file is written.
+        deaggregate (bool): Pass user records instead of aggregated records.
+    """
 
-    for shard in shards[1:]:
+    def __init__(
+        self,
+        stream_name: str,
+        process_records: Callable[[str, List[dict]], None],
+        checkpoint_path: Optional[str] = None,
+        iterator_type: str = "TRIM_HORIZON",
+        stop_at_latest: bool = False,
+        limit: int = MAX_RECORDS_PER_GET,
+        idle_sleep_s: float = 1.0,
+        checkpoint_interval_s: float = 10.0,
+        max_backoff_s: float = 10.0,
+        deaggregate: bool = True,
+    ):
+        self.stream_name = stream_name
+        self.process_records = process_records
+        self.checkpoint = ShardCheckpoint(checkpoint_path)
+        self.iterator_type = iterator_type
+        self.stop_at_latest = stop_at_latest
+        self.limit = limit
+        self.idle_sleep_s = idle_sleep_s
+        self.checkpoint_interval_s = checkpoint_interval_s
+        self.max_backoff_s = max_backoff_s
+        self.deaggregate = deaggregate
+
+        self._stop = threading.Event()
+        self._finished: Dict[str, threading.Event] = {}
+        self._errors: List[Exception] = []
+
+    def stop(self) -> None:
+        """Ask all shard readers to stop after their current batch."""
+        self._stop.set()
+
+    def list_shards(self) -> List[dict]:
+        shards, request = [], {"StreamName": self.stream_name}
+        while True:
+            response = get_kinesis_client().list_shards(**request)
+            shards.extend(response["Shards"])
+            if not response.get("NextToken"):
+                return shards
+            request = {"NextToken": response["NextToken"]}
+
+    def run(self) -> None:
+        """Read all shards until they are closed, caught up or stopped."""
+        shards = self.list_shards()
+        self._finished = {shard["ShardId"]: threading.Event() for shard in shards}
+        threads = [
+            threading.Thread(
+                target=self._run_shard,
+                args=(shard,),
+                name=f"kinesis-reader-{shard['ShardId']}",
+                daemon=True,
+            )
+            for shard in shards
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=self.checkpoint_interval_s)
+                self.checkpoint.save()
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
+        finally:
+            self.checkpoint.save()
+
+        if self._errors:
+            raise self._errors[0]
+
+    def _run_shard(self, shard: dict) -> None:
         shard_id = shard["ShardId"]
-        print(f"Processing shard: {shard_id}")
-
-        # Get the shard iterator
-        shard_iterator = get_shard_iterator(STREAM_NAME, shard_id)
-
-        while shard_iterator:
-            # Get records from the shard
-            records_response = get_records(shard_iterator)
-            records = records_response["Records"]
-
-            first_record = True  # Flag to check the first record
-            for record in records:
-                if first_record:
-                    first_record = False  # Skip the first record
-                    continue
-                print(record)
-                # Decode the base64-encoded data
-                decoded_data = record["Data"].decode("utf-8")
-                print(decoded_data)
-
-            # Move to the next shard iterator
-            shard_iterator = records_response.get("NextShardIterator")
+        try:
+            # wait until the parent shard is fully read to keep per key ordering
+            for parent_key in ("ParentShardId", "AdjacentParentShardId"):
+                parent = self._finished.get(shard.get(parent_key))
+                while parent is not None and not parent.wait(timeout=1.0):
+                    if self._stop.is_set():
+                        return
+            self._read_shard(shard_id)
+        except Exception as e:
+            logger.error(
+                {
+                    "message": "Shard reader failed",
+                    "shard_id": shard_id,
+                    "error": str(e),
+                }
+            )
+            self._errors.append(e)
+            self.stop()
+        finally:
+            self._finished[shard_id].set()
+
+    def _read_shard(self, shard_id: str) -> None:
+        sequence_number = self.checkpoint.get(shard_id)
+        if sequence_number == ShardCheckpoint.SHARD_END:
+            return
+
+        shard_iterator = get_shard_iterator(
+            self.stream_name, shard_id, self.iterator_type, sequence_number
+        )
+        backoff_s = MIN_GET_INTERVAL_S
+        while shard_iterator and not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                response = get_records(shard_iterator, limit=self.limit)
+            except (
+                get_kinesis_client().exceptions.ProvisionedThroughputExceededException
+            ):
+                time.sleep(backoff_s + random.uniform(0, backoff_s))
+                backoff_s = min(backoff_s * 2, self.max_backoff_s)
+                continue
+            except get_kinesis_client().exceptions.ExpiredIteratorException:
+                shard_iterator = get_shard_iterator(
+                    self.stream_name,
+                    shard_id,
+                    self.iterator_type,
+                    self.checkpoint.get(shard_id),
+                )
+                continue
+            backoff_s = MIN_GET_INTERVAL_S
+
+            records = response["Records"]
+            if records:
+                sequence_number = records[-1]["SequenceNumber"]
+                if self.deaggregate:
+                    records = deaggregate_records(records)
+                self.process_records(shard_id, records)
+                self.checkpoint.update(shard_id, sequence_number)
+
+            shard_iterator = response.get("NextShardIterator")
             if not shard_iterator:
-                print(f"No more records in shard: {shard_id}")
-                break
+                logger.info({"message": "Shard closed", "shard_id": shard_id})
+                self.checkpoint.update(shard_id, ShardCheckpoint.SHARD_END)
+                return
+
+            caught_up = not records and response.get("MillisBehindLatest", 0) == 0
+            if caught_up and self.stop_at_latest:
+                return
+            # GetRecords allows 5 calls per second per shard
+            wait_s = self.idle_sleep_s if caught_up else MIN_GET_INTERVAL_S
+            time.sleep(max(0.0, wait_s - (time.monotonic() - started)))
+
+
+def print_records(shard_id: str, records: List[dict]) -> None:
+    for record in records:
+        print(record["Data"].decode("utf-8"))
+
+
+def process_stream(
+    checkpoint_path: Optional[str] = None, stop_at_latest: bool = True
+) -> None:
+    KinesisConsumer(
+        stream_name=STREAM_NAME,
+        process_records=print_records,
+        checkpoint_path=checkpoint_path,
+        stop_at_latest=stop_at_latest,
+    ).run()
 
 
 if __name__ == "__main__":
@@ -1,59 +1,195 @@
-import boto3
+"""Helper functions to bulk load historic data from AWS S3 into AWS RDS."""
+
 import csv
-import psycopg2
+import io
+import logging
 import os
+from typing import Iterable, Iterator, List
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from aws_dataflow_simulator.utils_s3 import iter_file_lines_from_s3
+
+logger = logging.getLogger(__name__)
+
+# Configuration, set by BatchUpdateStack in the Lambda environment
+s3_bucket = os.getenv("DATASET_BUCKET", "your-dataset-bucket")
+s3_key = os.getenv("DATASET_KEY", "future.csv")
+rds_host = os.getenv("RDS_ENDPOINT", "your-rds-endpoint")
+rds_dbname = os.getenv("RDS_DB_NAME", "HistoricDataDB")
+rds_user = os.getenv("RDS_USER", "your-rds-username")
+rds_password = os.getenv("RDS_PASSWORD", "your-rds-password")
+rds_port = int(os.getenv("RDS_PORT", 5432))
+
+COPY_BUFFER_SIZE = 1024 * 1024
+INSERT_PAGE_SIZE = 5000
 
-# Configuration
-s3_bucket = "your-dataset-bucket"
-s3_key = "future.csv"
-rds_host = "your-rds-endpoint"
-rds_dbname = "HistoricDataDB"
-rds_user = "your-rds-username"
-rds_password = "your-rds-password"
-rds_port = 5432
 
+class _LinesReader(io.RawIOBase):
+    """Read-only file object over an iterator of byte lines, for COPY FROM STDIN."""
 
-def upload_csv_to_rds():
-    s3_client = boto3.client("s3")
+    def __init__(self, lines: Iterable[bytes]):
+        self._lines = iter(lines)
+        self._pending = b""
 
-    # Download the CSV file from S3
-    response = s3_client.get_object(Bucket=s3_bucket, Key=s3_key)
-    csv_data = response["Body"].read().decode("utf-8").splitlines()
-    reader = csv.DictReader(csv_data)
+    def readable(self) -> bool:
+        return True
 
-    # Connect to the RDS database
-    conn = psycopg2.connect(
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            self._pending = next(self._lines, None)
+            if self._pending is None:
+                self._pending = b""
+                return 0
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def get_connection():
+    return psycopg2.connect(
         host=rds_host,
         database=rds_dbname,
         user=rds_user,
         password=rds_password,
         port=rds_port,
     )
-    cur = conn.cursor()
 
-    # Create the table if it doesn't exist
+
+def parse_header(header_line: bytes) -> List[str]:
+    """Column names from the CSV header, lowercased like utils_dataset does."""
+    header = next(csv.reader([header_line.decode("utf-8")], skipinitialspace=True))
+    return [column.strip().lower() for column in header]
+
+
+def create_table(cur, table: str, columns: List[str]) -> None:
+    """Create the table with one TEXT column per CSV column if it does not exist."""
     cur.execute(
-        """
-    CREATE TABLE IF NOT EXISTS historic_table (
-        id SERIAL PRIMARY KEY,
-        column1 VARCHAR(255),
-        column2 VARCHAR(255),
-        date DATE
+        sql.SQL("CREATE TABLE IF NOT EXISTS {} ({})").format(
+            sql.Identifier(table),
+            sql.SQL(", ").join(
+                sql.SQL("{} TEXT").format(sql.Identifier(column)) for column in columns
+            ),
+        )
+    )
+
+
+def copy_lines(cur, table: str, columns: List[str], lines: Iterator[bytes]) -> int:
+    """Stream CSV lines (without header) into the table with COPY FROM STDIN."""
+    cur.copy_expert(
+        sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)")
+        .format(
+            sql.Identifier(table),
+            sql.SQL(", ").join(map(sql.Identifier, columns)),
+        )
+        .as_string(cur),
+        io.BufferedReader(_LinesReader(lines), buffer_size=COPY_BUFFER_SIZE),
+        size=COPY_BUFFER_SIZE,
     )
+    return cur.rowcount
+
+
+def insert_lines(
+    cur,
+    table: str,
+    columns: List[str],
+    lines: Iterator[bytes],
+    page_size: int = INSERT_PAGE_SIZE,
+) -> int:
+    """Insert CSV lines (without header) with multi-row INSERT statements.
+
+    Empty fields are inserted as NULL, the same as COPY does in CSV format.
     """
+    query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
+        sql.Identifier(table),
+        sql.SQL(", ").join(map(sql.Identifier, columns)),
     )
+    rows = csv.reader(line.decode("utf-8") for line in lines)
+    inserted = 0
+    while True:
+        page = [
+            [value if value != "" else None for value in row]
+            for _, row in zip(range(page_size), rows)
+        ]
+        if not page:
+            return inserted
+        execute_values(cur, query, page, page_size=page_size)
+        inserted += len(page)
 
-    # Insert CSV data into RDS
-    for row in reader:
-        cur.execute(
-            "INSERT INTO historic_table (column1, column2, date) VALUES (%s, %s, %s)",
-            (row["column1"], row["column2"], row["date"]),
-        )
 
-    # Commit the transaction and close the connection
-    conn.commit()
-    cur.close()
-    conn.close()
+def upload_csv_to_rds(
+    bucket_name: str = s3_bucket,
+    filepath: str = s3_key,
+    table: str = "historic_table",
+    method: str = "copy",
+    conn=None,
+) -> int:
+    """Bulk load a CSV file on S3 into a PostgreSQL table.
+
+    The S3 body is streamed straight into COPY FROM STDIN, so the file is
+    never held in memory. If COPY fails, or with method="insert", the rows
+    are loaded with batched multi-row INSERTs instead. The table is created
+    from the CSV header if it does not exist.
+
+    Args:
+        bucket_name (str): Bucket with the CSV file.
+        filepath (str): Key of the CSV file on the bucket.
+        table (str): Name of the table to load into.
+        method (str): Either "copy" or "insert".
+        conn (Optional): Open psycopg2 connection, defaults to the RDS instance.
+
+    Returns:
+        int: Number of rows loaded.
+    """
+    if method not in ("copy", "insert"):
+        raise ValueError("method must be either copy or insert.")
+
+    own_connection = conn is None
+    conn = conn or get_connection()
+    try:
+        with conn.cursor() as cur:
+            lines = iter_file_lines_from_s3(bucket_name=bucket_name, filepath=filepath)
+            columns = parse_header(next(lines))
+            create_table(cur, table, columns)
+            conn.commit()
+
+            rows = None
+            if method == "copy":
+                try:
+                    rows = copy_lines(cur, table, columns, lines)
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    logger.warning(
+                        {
+                            "message": "COPY failed, falling back to batched inserts",
+                            "table": table,
+                            "error": str(e),
+                        }
+                    )
+                    lines = iter_file_lines_from_s3(
+                        bucket_name=bucket_name, filepath=filepath
+                    )
+                    next(lines)
+            if rows is None:
+                rows = insert_lines(cur, table, columns, lines)
+        conn.commit()
+    finally:
+        if own_connection:
+            conn.close()
+
+    logger.info(
+        {
+            "message": "Loaded CSV into RDS",
+            "s3_bucket": bucket_name,
+            "filepath": filepath,
+            "table": table,
+            "rows": rows,
+        }
+    )
+    return rows
 
 
 if __name__ == "__main__":
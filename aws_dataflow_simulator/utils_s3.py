@@ -1,9 +1,20 @@
 """Helper functions to interact with AWS S3."""
 
-import boto3
+import hashlib
+import io
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import fire
-from typing import Any
+from boto3.s3.transfer import TransferConfig
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, TextIO
 
+from aws_dataflow_simulator.clients import get_client
 from aws_dataflow_simulator.exceptions import (
     CouldNotUploadFileToS3,
     CouldNotLoadFileFromS3,
@@ -16,9 +27,8 @@ def upload_file_to_s3(bucket_name: str, filepath: str):
     :param bucket_name: Bucket to upload to
     :param file_path: File to upload
     """
-    s3_client = boto3.client("s3")
     try:
-        s3_client.upload_file(filepath, bucket_name, filepath)
+        S3Transfer().upload(filepath, bucket_name, filepath)
     except Exception as e:
         raise CouldNotUploadFileToS3(
             f"Failed to upload {filepath} to {bucket_name}: {e}"
@@ -33,7 +43,7 @@ def download_file_from_s3(bucket_name: str, filepath: str) -> Any:
     :param bucket_name: Bucket from which to download the file
     :param file_path: filepath on s3 bucket
     """
-    s3_client = boto3.client("s3")
+    s3_client = get_client("s3")
 
     # response = s3_client.get_object(Bucket=bucket_name, Key=filepath)
     try:
@@ -48,5 +58,503 @@ def download_file_from_s3(bucket_name: str, filepath: str) -> Any:
     return body
 
 
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Split a stream of byte chunks into lines, keeping the line endings.
+
+    Only the current chunk and an incomplete trailing line are held in memory.
+    """
+    remainder = b""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        lines = (remainder + chunk).split(b"\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line + b"\n"
+    if remainder:
+        yield remainder
+
+
+def iter_file_lines_from_s3(
+    bucket_name: str,
+    filepath: str,
+    chunk_size: int = 1024 * 1024,
+    start_byte: int = 0,
+) -> Iterator[bytes]:
+    """Stream the lines of a file on an S3 bucket without downloading it whole.
+
+    :param bucket_name: Bucket from which to read the file
+    :param filepath: filepath on s3 bucket
+    :param chunk_size: Number of bytes read from the response body at a time
+    :param start_byte: Offset to start reading from using a ranged GET
+    """
+    s3_client = get_client("s3")
+    request = {"Bucket": bucket_name, "Key": filepath}
+    if start_byte:
+        request["Range"] = f"bytes={start_byte}-"
+
+    try:
+        csv_obj = s3_client.get_object(**request)
+    except Exception as e:
+        raise CouldNotLoadFileFromS3(
+            f"Could not load file {filepath} from bucket {bucket_name}: {str(e)}"
+        )
+
+    body = csv_obj["Body"]
+    try:
+        yield from iter_lines(body.iter_chunks(chunk_size=chunk_size))
+    finally:
+        body.close()
+
+
+class S3ObjectReader(io.RawIOBase):
+    """Seekable, read-only file object over an S3 object using ranged GETs.
+
+    Wrap it in io.BufferedReader to read the object in large blocks.
+    """
+
+    def __init__(self, bucket_name: str, filepath: str, s3_client=None):
+        self.bucket_name = bucket_name
+        self.filepath = filepath
+        self._s3_client = s3_client or get_client("s3")
+        try:
+            self.size = self._s3_client.head_object(Bucket=bucket_name, Key=filepath)[
+                "ContentLength"
+            ]
+        except Exception as e:
+            raise CouldNotLoadFileFromS3(
+                f"Could not load file {filepath} from bucket {bucket_name}: {str(e)}"
+            )
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(0, offset)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        end = min(self._position + len(buffer), self.size)
+        if self._position >= end:
+            return 0
+        response = self._s3_client.get_object(
+            Bucket=self.bucket_name,
+            Key=self.filepath,
+            Range=f"bytes={self._position}-{end - 1}",
+        )
+        data = response["Body"].read()
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+def iter_parquet_batches_from_s3(
+    bucket_name: str,
+    filepath: str,
+    batch_size: int = 10000,
+    buffer_size: int = 8 * 1024 * 1024,
+    start_row: int = 0,
+    end_row: Optional[int] = None,
+) -> Iterator[Any]:
+    """Stream the rows of a Parquet file on S3 as pyarrow record batches.
+
+    Only the footer and the row groups being read are fetched, with ranged
+    GETs of buffer_size bytes. Row groups before start_row are skipped
+    using the row counts in the footer, reading stops before end_row.
+
+    :param bucket_name: Bucket from which to read the file
+    :param filepath: filepath on s3 bucket
+    :param batch_size: Maximum number of rows per batch
+    :param buffer_size: Number of bytes fetched per ranged GET
+    :param start_row: Index of the first row to read
+    :param end_row: Index of the row to stop before, None to read to the end
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(
+            "Reading Parquet datasets requires pyarrow, "
+            "install aws-dataflow-simulator with the parquet extra."
+        )
+
+    from aws_dataflow_simulator.utils_dataset import iter_parquet_file_batches
+
+    with io.BufferedReader(
+        S3ObjectReader(bucket_name, filepath), buffer_size=buffer_size
+    ) as file:
+        yield from iter_parquet_file_batches(
+            pq.ParquetFile(file), batch_size, start_row, end_row
+        )
+
+
+def get_parquet_row_count(bucket_name: str, filepath: str) -> int:
+    """Number of rows of a Parquet file on S3, read from its footer."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(
+            "Reading Parquet datasets requires pyarrow, "
+            "install aws-dataflow-simulator with the parquet extra."
+        )
+
+    with io.BufferedReader(S3ObjectReader(bucket_name, filepath)) as file:
+        return pq.ParquetFile(file).metadata.num_rows
+
+
+# S3 multipart upload limits
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_CONCURRENCY = 10
+# part sizes used by this module, the AWS CLI and common SDK settings
+COMMON_PART_SIZES_MIB = (5, 8, 16, 32, 64, 100, 128, 256, 512)
+# a multipart upload in progress is recorded next to the uploaded file
+MANIFEST_SUFFIX = ".s3upload.json"
+
+
+def get_part_size(file_size: int, part_size: int = DEFAULT_PART_SIZE) -> int:
+    """Part size of at least part_size that keeps an upload within 10000 parts."""
+    part_size = max(part_size, MIN_PART_SIZE)
+    return max(part_size, math.ceil(file_size / MAX_PARTS))
+
+
+def compute_etag(filepath: str, part_size: Optional[int] = None) -> str:
+    """ETag S3 reports for the file, uploaded whole or in parts of part_size.
+
+    A single PUT has the MD5 of the content as ETag, a multipart upload the
+    MD5 of the concatenated part MD5s followed by the number of parts.
+    """
+    with open(filepath, "rb") as file:
+        if part_size is None:
+            md5 = hashlib.md5()
+            for block in iter(lambda: file.read(DEFAULT_PART_SIZE), b""):
+                md5.update(block)
+            return md5.hexdigest()
+        digests = [
+            hashlib.md5(block).digest()
+            for block in iter(lambda: file.read(part_size), b"")
+        ]
+    return f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
+
+class TransferProgress:
+    """Thread-safe transfer callback printing progress and throughput.
+
+    Pass it as Callback to boto3 transfers. Bytes that were transferred by
+    an earlier, resumed attempt are reported with `skip` so they count as
+    done without inflating the throughput.
+    """
+
+    def __init__(
+        self,
+        total_bytes: int,
+        label: str,
+        stream: Optional[TextIO] = None,
+        interval_s: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.total_bytes = total_bytes
+        self.label = label
+        self.interval_s = interval_s
+        self._stream = stream or sys.stderr
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._start = clock()
+        self._next_render = self._start
+        self.skipped_bytes = 0
+        self.transferred_bytes = 0
+
+    @property
+    def throughput_mb_s(self) -> float:
+        elapsed_s = self._clock() - self._start
+        if elapsed_s <= 0:
+            return 0.0
+        return self.transferred_bytes / elapsed_s / 1e6
+
+    def skip(self, bytes_amount: int) -> None:
+        with self._lock:
+            self.skipped_bytes += bytes_amount
+
+    def __call__(self, bytes_amount: int) -> None:
+        with self._lock:
+            self.transferred_bytes += bytes_amount
+            if self._clock() >= self._next_render:
+                self._next_render = self._clock() + self.interval_s
+                self._render()
+
+    def close(self) -> None:
+        with self._lock:
+            self._render()
+            self._stream.write("\n")
+            self._stream.flush()
+
+    def _render(self) -> None:
+        done = self.skipped_bytes + self.transferred_bytes
+        percent = 100.0 * done / self.total_bytes if self.total_bytes else 100.0
+        self._stream.write(
+            f"\r{self.label}: {done / 1e6:.1f}/{self.total_bytes / 1e6:.1f} MB "
+            f"({percent:.0f}%) {self.throughput_mb_s:.1f} MB/s"
+        )
+        self._stream.flush()
+
+
+class S3Transfer:
+    """Concurrent multipart transfers between local files and S3.
+
+    Uploads larger than one part are sent as multipart uploads whose state
+    is kept in a local manifest, so an interrupted upload resumes with the
+    parts that are still missing. Incomplete uploads stay on the bucket
+    until they are resumed or aborted (e.g. by a lifecycle rule). Files
+    whose size and ETag match the object on S3 are skipped.
+
+    Args:
+        part_size (int): Size of each part in bytes, at least 5 MiB. Raised
+            as needed to keep large files within the 10000 part limit.
+        concurrency (int): Number of parts transferred at a time.
+    """
+
+    def __init__(
+        self,
+        part_size: int = DEFAULT_PART_SIZE,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        s3_client=None,
+    ):
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.concurrency = concurrency
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.part_size,
+            multipart_chunksize=self.part_size,
+            max_concurrency=concurrency,
+        )
+        self._s3_client = s3_client or get_client(
+            "s3", max_pool_connections=concurrency
+        )
+
+    def object_size(self, bucket_name: str, key: str) -> int:
+        return self._s3_client.head_object(Bucket=bucket_name, Key=key)["ContentLength"]
+
+    def is_unchanged(self, filepath: str, bucket_name: str, key: str) -> bool:
+        """Check if the object on S3 has the size and ETag of the local file."""
+        try:
+            head = self._s3_client.head_object(Bucket=bucket_name, Key=key)
+        except self._s3_client.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+        size = os.path.getsize(filepath)
+        if head["ContentLength"] != size:
+            return False
+
+        etag = head["ETag"].strip('"')
+        if "-" not in etag:
+            return compute_etag(filepath) == etag
+        parts = int(etag.rsplit("-", 1)[1])
+        # the part size of the upload is not stored, try our own and the
+        # common defaults of other tools among those giving the same part count
+        candidates = [
+            get_part_size(size, self.part_size),
+            math.ceil(size / parts),
+            math.ceil(size / parts / 2**20) * 2**20,
+            *(mib * 2**20 for mib in COMMON_PART_SIZES_MIB),
+        ]
+        return any(
+            compute_etag(filepath, part_size) == etag
+            for part_size in dict.fromkeys(candidates)
+            if math.ceil(size / part_size) == parts
+        )
+
+    def upload(
+        self,
+        filepath: str,
+        bucket_name: str,
+        key: str,
+        force: bool = False,
+        progress: Optional[TransferProgress] = None,
+        manifest_path: Optional[str] = None,
+    ) -> bool:
+        """Upload a file, returning False if it was skipped as unchanged."""
+        if not force and self.is_unchanged(filepath, bucket_name, key):
+            return False
+
+        size = os.path.getsize(filepath)
+        part_size = get_part_size(size, self.part_size)
+        if size <= part_size:
+            self._s3_client.upload_file(
+                filepath,
+                bucket_name,
+                key,
+                Config=self.transfer_config,
+                Callback=progress,
+            )
+        else:
+            self._upload_multipart(
+                filepath,
+                bucket_name,
+                key,
+                part_size,
+                manifest_path or filepath + MANIFEST_SUFFIX,
+                progress,
+            )
+        return True
+
+    def download(
+        self,
+        bucket_name: str,
+        key: str,
+        filepath: str,
+        force: bool = False,
+        progress: Optional[TransferProgress] = None,
+    ) -> bool:
+        """Download an object, returning False if the local file is unchanged."""
+        if (
+            not force
+            and os.path.isfile(filepath)
+            and self.is_unchanged(filepath, bucket_name, key)
+        ):
+            return False
+        self._s3_client.download_file(
+            bucket_name, key, filepath, Config=self.transfer_config, Callback=progress
+        )
+        return True
+
+    def _upload_multipart(
+        self,
+        filepath: str,
+        bucket_name: str,
+        key: str,
+        part_size: int,
+        manifest_path: str,
+        progress: Optional[TransferProgress],
+    ) -> None:
+        stat = os.stat(filepath)
+        upload = {
+            "bucket": bucket_name,
+            "key": key,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "part_size": part_size,
+        }
+        manifest = _load_manifest(manifest_path)
+        parts = None
+        if manifest and all(manifest.get(k) == v for k, v in upload.items()):
+            parts = self._uploaded_parts(
+                bucket_name, key, manifest["upload_id"], manifest["parts"]
+            )
+        elif manifest:
+            # the file or target changed since, its parts cannot be reused
+            self._abort_upload(manifest)
+        if parts is None:
+            upload["upload_id"] = self._s3_client.create_multipart_upload(
+                Bucket=bucket_name, Key=key
+            )["UploadId"]
+            parts = {}
+        else:
+            upload["upload_id"] = manifest["upload_id"]
+        upload["parts"] = parts
+        _save_manifest(manifest_path, upload)
+
+        part_count = math.ceil(stat.st_size / part_size)
+        if progress is not None:
+            for part_number in parts:
+                progress.skip(
+                    min(part_size, stat.st_size - (part_number - 1) * part_size)
+                )
+        lock = threading.Lock()
+
+        def upload_part(part_number: int) -> None:
+            with open(filepath, "rb") as file:
+                file.seek((part_number - 1) * part_size)
+                data = file.read(part_size)
+            etag = self._s3_client.upload_part(
+                Bucket=bucket_name,
+                Key=key,
+                UploadId=upload["upload_id"],
+                PartNumber=part_number,
+                Body=data,
+            )["ETag"]
+            with lock:
+                parts[part_number] = etag
+                _save_manifest(manifest_path, upload)
+            if progress is not None:
+                progress(len(data))
+
+        missing = [n for n in range(1, part_count + 1) if n not in parts]
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="s3-part"
+        ) as pool:
+            # the manifest keeps the finished parts if any part fails
+            list(pool.map(upload_part, missing))
+
+        self._s3_client.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload["upload_id"],
+            MultipartUpload={
+                "Parts": [{"PartNumber": n, "ETag": parts[n]} for n in sorted(parts)]
+            },
+        )
+        os.remove(manifest_path)
+
+    def _abort_upload(self, manifest: dict) -> None:
+        try:
+            self._s3_client.abort_multipart_upload(
+                Bucket=manifest["bucket"],
+                Key=manifest["key"],
+                UploadId=manifest["upload_id"],
+            )
+        except self._s3_client.exceptions.ClientError:
+            pass
+
+    def _uploaded_parts(
+        self, bucket_name: str, key: str, upload_id: str, manifest_parts: dict
+    ) -> Optional[Dict[int, str]]:
+        """Parts of the manifest that S3 still holds, None if the upload is gone."""
+        listed, request = {}, {}
+        while True:
+            try:
+                response = self._s3_client.list_parts(
+                    Bucket=bucket_name, Key=key, UploadId=upload_id, **request
+                )
+            except self._s3_client.exceptions.NoSuchUpload:
+                return None
+            for part in response.get("Parts", []):
+                listed[part["PartNumber"]] = part["ETag"]
+            if not response.get("IsTruncated"):
+                break
+            request = {"PartNumberMarker": response["NextPartNumberMarker"]}
+        return {
+            int(n): etag
+            for n, etag in manifest_parts.items()
+            if listed.get(int(n)) == etag
+        }
+
+
+def _load_manifest(manifest_path: str) -> Optional[dict]:
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path) as file:
+        return json.load(file)
+
+
+def _save_manifest(manifest_path: str, upload: dict) -> None:
+    # write to a temporary file first so a crash never leaves a partial manifest
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(upload, file)
+    os.replace(tmp_path, manifest_path)
+
+
 if __name__ == "__main__":
     fire.Fire()
@@ -0,0 +1,157 @@
+"""Fixtures of the offline benchmark suite.
+
+Run with `make benchmark`. S3 is mocked with moto and Kinesis replaced by
+FakeKinesis, so no AWS account is needed and results only depend on this
+package. The dataset size and schema are set with --bench-rows,
+--bench-string-columns and --bench-numeric-columns.
+"""
+
+import os
+import resource
+import sys
+import threading
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from aws_dataflow_simulator.clients import clear_clients
+from aws_dataflow_simulator.utils_dataset import (
+    preprocess_dataset,
+    save_processed_dataset,
+)
+from benchmarks.synthetic import TIMESTAMP_COLUMN, make_dataset
+
+BUCKET = "benchmark-bucket"
+FIRST_EVENT_DT = "2024-01-01 00:00:00"
+MB = 1024 * 1024
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("dataflowsim benchmarks")
+    group.addoption("--bench-rows", type=int, default=200_000)
+    group.addoption("--bench-string-columns", type=int, default=2)
+    group.addoption("--bench-numeric-columns", type=int, default=3)
+    group.addoption("--bench-shards", type=int, default=4)
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # peak instead of current RSS, in kilobytes on Linux and bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class PeakRss:
+    """Track the peak resident set size while the context is active."""
+
+    def __init__(self, interval_s: float = 0.005):
+        self.interval_s = interval_s
+        self.baseline = self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> "PeakRss":
+        self.baseline = self.peak = current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self.peak = max(self.peak, current_rss())
+
+
+@pytest.fixture
+def run_benchmark(benchmark):
+    """Benchmark a target and add throughput and memory figures to extra_info.
+
+    The target returns a dict with the `events` and `bytes` it processed and
+    optionally `first_event_s`, the time from its start to the first event
+    accepted by Kinesis. Every round runs on fresh arguments from `setup`.
+    """
+
+    def run(target, setup=None, rounds=3):
+        results = []
+
+        def measured(*args, **kwargs):
+            with PeakRss() as rss:
+                result = target(*args, **kwargs)
+            result.update(
+                peak_rss_mb=rss.peak / MB, rss_growth_mb=(rss.peak - rss.baseline) / MB
+            )
+            results.append(result)
+
+        benchmark.pedantic(measured, setup=setup, rounds=rounds, iterations=1)
+
+        if benchmark.stats is not None:
+            mean_s = benchmark.stats.stats.mean
+            benchmark.extra_info.update(
+                events=results[-1]["events"],
+                events_per_s=round(results[-1]["events"] / mean_s),
+                mb_per_s=round(results[-1]["bytes"] / MB / mean_s, 2),
+                peak_rss_mb=round(max(r["peak_rss_mb"] for r in results), 1),
+                rss_growth_mb=round(max(r["rss_growth_mb"] for r in results), 1),
+            )
+            first_event_s = [
+                r["first_event_s"] for r in results if "first_event_s" in r
+            ]
+            if first_event_s:
+                benchmark.extra_info["time_to_first_event_ms"] = round(
+                    min(first_event_s) * 1000, 2
+                )
+        return results
+
+    return run
+
+
+@pytest.fixture(scope="session")
+def bench_shards(request) -> int:
+    return request.config.getoption("--bench-shards")
+
+
+@pytest.fixture(scope="session")
+def raw_dataset(request, tmp_path_factory) -> str:
+    """Synthetic raw dataset, as it would be passed to `dataset prepare`."""
+    df = make_dataset(
+        rows=request.config.getoption("--bench-rows"),
+        string_columns=request.config.getoption("--bench-string-columns"),
+        numeric_columns=request.config.getoption("--bench-numeric-columns"),
+        start=FIRST_EVENT_DT,
+    )
+    # shuffled, so preparing the dataset includes the sort
+    path = tmp_path_factory.mktemp("raw") / "dataset.csv"
+    df.sample(frac=1, random_state=0).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def processed_datasets(raw_dataset, tmp_path_factory) -> dict:
+    """The prepared dataset as CSV and Parquet."""
+    df = preprocess_dataset(raw_dataset, FIRST_EVENT_DT, True, None, TIMESTAMP_COLUMN)
+    paths = {}
+    for fmt in ("csv", "parquet"):
+        paths[fmt] = str(tmp_path_factory.mktemp("processed") / f"dataset.{fmt}")
+        save_processed_dataset(df, paths[fmt])
+    return paths
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """Mock AWS with moto, with fresh shared clients created inside the mock."""
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    clear_clients()
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        yield
+    clear_clients()
@@ -0,0 +1,204 @@
+"""In-process stand-in for a boto3 Kinesis client with per-shard limits."""
+
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, List, Optional
+
+from aws_dataflow_simulator.dataflow.producer import ShardMap
+
+# Kinesis per shard service limits
+WRITE_RECORDS_PER_S = 1000
+WRITE_BYTES_PER_S = 1024 * 1024
+READS_PER_S = 5
+
+
+class KinesisError(Exception):
+    """Error shaped like botocore's ClientError, with a response dict."""
+
+    code = "InternalFailure"
+
+    def __init__(self, message: str = ""):
+        super().__init__(message)
+        self.response = {"Error": {"Code": self.code, "Message": message}}
+
+
+class ProvisionedThroughputExceededException(KinesisError):
+    code = "ProvisionedThroughputExceededException"
+
+
+class ExpiredIteratorException(KinesisError):
+    code = "ExpiredIteratorException"
+
+
+class _Shard:
+    def __init__(self, shard_id: str, starting_hash_key: int):
+        self.shard_id = shard_id
+        self.starting_hash_key = starting_hash_key
+        self.records: List[dict] = []
+        self.lock = threading.Lock()
+        self.window = None
+        self.window_records = 0
+        self.window_bytes = 0
+        self.read_window = None
+        self.window_reads = 0
+
+
+class FakeKinesis:
+    """Kinesis client stand-in that keeps records in memory.
+
+    Writes are limited per shard to 1000 records and 1 MiB per second and
+    reads to 5 GetRecords calls per second, like the real service, using
+    fixed one second windows. Rejected PutRecords entries get the
+    ProvisionedThroughputExceededException error code, rejected PutRecord and
+    GetRecords calls raise it.
+
+    Args:
+        shard_count (int): Number of uniform shards.
+        enforce_limits (bool): Apply the per-shard limits.
+    """
+
+    exceptions = SimpleNamespace(
+        ClientError=KinesisError,
+        ProvisionedThroughputExceededException=ProvisionedThroughputExceededException,
+        ExpiredIteratorException=ExpiredIteratorException,
+    )
+
+    def __init__(
+        self,
+        shard_count: int = 1,
+        enforce_limits: bool = True,
+        records_per_s: int = WRITE_RECORDS_PER_S,
+        bytes_per_s: int = WRITE_BYTES_PER_S,
+        reads_per_s: int = READS_PER_S,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.shard_map = ShardMap.even(shard_count)
+        self.shards = [
+            _Shard(f"shardId-{i:012d}", key)
+            for i, key in enumerate(self.shard_map.starting_hash_keys)
+        ]
+        self.enforce_limits = enforce_limits
+        self.records_per_s = records_per_s
+        self.bytes_per_s = bytes_per_s
+        self.reads_per_s = reads_per_s
+        self._clock = clock
+
+        self.first_put_at: Optional[float] = None
+        self.throttled_records = 0
+
+    @property
+    def record_count(self) -> int:
+        return sum(len(shard.records) for shard in self.shards)
+
+    def _admit_write(self, shard: _Shard, nbytes: int) -> bool:
+        if not self.enforce_limits:
+            return True
+        window = int(self._clock())
+        if window != shard.window:
+            shard.window, shard.window_records, shard.window_bytes = window, 0, 0
+        if (
+            shard.window_records + 1 > self.records_per_s
+            or shard.window_bytes + nbytes > self.bytes_per_s
+        ):
+            return False
+        shard.window_records += 1
+        shard.window_bytes += nbytes
+        return True
+
+    def _put(self, data: bytes, partition_key: str) -> Optional[dict]:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        shard = self.shards[self.shard_map.shard_index(partition_key)]
+        with shard.lock:
+            if not self._admit_write(shard, len(data) + len(partition_key)):
+                self.throttled_records += 1
+                return None
+            if self.first_put_at is None:
+                self.first_put_at = self._clock()
+            sequence_number = f"{len(shard.records):020d}"
+            shard.records.append(
+                {
+                    "Data": data,
+                    "PartitionKey": partition_key,
+                    "SequenceNumber": sequence_number,
+                }
+            )
+        return {"ShardId": shard.shard_id, "SequenceNumber": sequence_number}
+
+    def put_record(self, StreamName: str, Data: bytes, PartitionKey: str) -> dict:
+        result = self._put(Data, PartitionKey)
+        if result is None:
+            raise ProvisionedThroughputExceededException("Rate exceeded for shard")
+        return result
+
+    def put_records(self, StreamName: str, Records: List[dict]) -> dict:
+        results, failed = [], 0
+        for record in Records:
+            result = self._put(record["Data"], record["PartitionKey"])
+            if result is None:
+                failed += 1
+                result = {
+                    "ErrorCode": ProvisionedThroughputExceededException.code,
+                    "ErrorMessage": "Rate exceeded for shard",
+                }
+            results.append(result)
+        return {"FailedRecordCount": failed, "Records": results}
+
+    def list_shards(self, StreamName: str = None, NextToken: str = None) -> dict:
+        return {
+            "Shards": [
+                {
+                    "ShardId": shard.shard_id,
+                    "HashKeyRange": {"StartingHashKey": str(shard.starting_hash_key)},
+                    "SequenceNumberRange": {"StartingSequenceNumber": "0"},
+                }
+                for shard in self.shards
+            ]
+        }
+
+    def describe_stream_summary(self, StreamName: str) -> dict:
+        return {
+            "StreamDescriptionSummary": {
+                "StreamName": StreamName,
+                "OpenShardCount": len(self.shards),
+            }
+        }
+
+    def get_shard_iterator(
+        self,
+        StreamName: str,
+        ShardId: str,
+        ShardIteratorType: str,
+        StartingSequenceNumber: str = None,
+    ) -> dict:
+        shard = next(s for s in self.shards if s.shard_id == ShardId)
+        if ShardIteratorType == "AFTER_SEQUENCE_NUMBER":
+            position = int(StartingSequenceNumber) + 1
+        elif ShardIteratorType == "LATEST":
+            position = len(shard.records)
+        else:
+            position = 0
+        return {"ShardIterator": f"{ShardId}:{position}"}
+
+    def get_records(self, ShardIterator: str, Limit: int = 10000) -> dict:
+        shard_id, position = ShardIterator.rsplit(":", 1)
+        shard = next(s for s in self.shards if s.shard_id == shard_id)
+        position = int(position)
+        with shard.lock:
+            if self.enforce_limits:
+                window = int(self._clock())
+                if window != shard.read_window:
+                    shard.read_window, shard.window_reads = window, 0
+                if shard.window_reads >= self.reads_per_s:
+                    raise ProvisionedThroughputExceededException(
+                        "Rate exceeded for shard"
+                    )
+                shard.window_reads += 1
+            records = shard.records[position : position + Limit]
+            behind = len(shard.records) - position - len(records)
+        return {
+            "Records": records,
+            "NextShardIterator": f"{shard_id}:{position + len(records)}",
+            "MillisBehindLatest": 1000 if behind else 0,
+        }
@@ -0,0 +1,34 @@
+"""Synthetic datasets of configurable size and schema for the benchmarks."""
+
+import numpy as np
+import pandas as pd
+
+TIMESTAMP_COLUMN = "tx_datetime"
+
+
+def make_dataset(
+    rows: int,
+    string_columns: int = 2,
+    numeric_columns: int = 3,
+    mean_gap_ms: float = 10.0,
+    start: str = "2024-01-01 00:00:00",
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Generate a dataset shaped like a transaction log.
+
+    The first column is a high-cardinality id used as partition key, followed
+    by a timestamp column with exponentially distributed gaps, low-cardinality
+    string columns and float columns.
+    """
+    rng = np.random.default_rng(seed)
+    gaps_ms = rng.exponential(mean_gap_ms, rows).cumsum()
+    columns = {
+        "id": np.char.add("cust_", rng.integers(0, rows, rows).astype(str)),
+        TIMESTAMP_COLUMN: pd.Timestamp(start) + pd.to_timedelta(gaps_ms, unit="ms"),
+    }
+    for i in range(string_columns):
+        categories = np.char.add(f"cat{i}_", np.arange(50).astype(str))
+        columns[f"category_{i}"] = rng.choice(categories, rows)
+    for i in range(numeric_columns):
+        columns[f"amount_{i}"] = rng.lognormal(3, 1, rows).round(2)
+    return pd.DataFrame(columns)
@@ -0,0 +1,47 @@
+import pandas as pd
+
+from aws_dataflow_simulator.dataflow.serialization import serialize_frame
+from aws_dataflow_simulator.utils_kinesis import KinesisConsumer
+from benchmarks.fake_kinesis import FakeKinesis
+
+STREAM_NAME = "benchmark-stream"
+PUT_RECORDS_BATCH = 500
+
+
+def filled_stream(df: pd.DataFrame, shard_count: int) -> FakeKinesis:
+    kinesis = FakeKinesis(shard_count=shard_count, enforce_limits=False)
+    records = [
+        {"Data": data, "PartitionKey": partition_key}
+        for data, partition_key, _ in serialize_frame(df)
+    ]
+    for i in range(0, len(records), PUT_RECORDS_BATCH):
+        kinesis.put_records(STREAM_NAME, records[i : i + PUT_RECORDS_BATCH])
+    # reads are limited to 5 GetRecords calls per second and shard
+    kinesis.enforce_limits = True
+    return kinesis
+
+
+def test_consume(run_benchmark, monkeypatch, processed_datasets, bench_shards):
+    df = pd.read_parquet(processed_datasets["parquet"])
+
+    def setup():
+        kinesis = filled_stream(df, bench_shards)
+        monkeypatch.setattr(
+            "aws_dataflow_simulator.utils_kinesis.get_kinesis_client", lambda: kinesis
+        )
+        return (), {}
+
+    def consume():
+        received = {"events": 0, "bytes": 0}
+
+        def process_records(shard_id, records):
+            received["events"] += len(records)
+            received["bytes"] += sum(len(record["Data"]) for record in records)
+
+        KinesisConsumer(
+            STREAM_NAME, process_records, stop_at_latest=True, idle_sleep_s=0
+        ).run()
+        assert received["events"] == len(df)
+        return received
+
+    run_benchmark(consume, setup=setup)
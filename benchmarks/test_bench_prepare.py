@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aws_dataflow_simulator.utils_dataset import (
+    parse_timestamps,
+    preprocess_dataset,
+    preprocess_dataset_chunked,
+)
+from benchmarks.conftest import FIRST_EVENT_DT
+from benchmarks.synthetic import TIMESTAMP_COLUMN
+
+
+def test_prepare_in_memory(run_benchmark, raw_dataset):
+    def prepare():
+        df = preprocess_dataset(
+            raw_dataset, FIRST_EVENT_DT, True, None, TIMESTAMP_COLUMN
+        )
+        return {"events": len(df), "bytes": os.path.getsize(raw_dataset)}
+
+    run_benchmark(prepare)
+
+
+def test_prepare_chunked(run_benchmark, raw_dataset, tmp_path):
+    output_path = str(tmp_path / "dataset_processed.csv")
+
+    def prepare():
+        rows = preprocess_dataset_chunked(
+            raw_dataset,
+            output_path,
+            FIRST_EVENT_DT,
+            True,
+            None,
+            TIMESTAMP_COLUMN,
+            chunksize=50_000,
+            tmp_dir=str(tmp_path),
+        )
+        return {"events": rows, "bytes": os.path.getsize(raw_dataset)}
+
+    run_benchmark(prepare)
+
+
+@pytest.mark.parametrize("parser", ["to_datetime", "parse_timestamps"])
+@pytest.mark.parametrize("layout", ["day_first", "epoch_ms"])
+def test_parse_timestamps(run_benchmark, request, parser, layout):
+    rows = request.config.getoption("--bench-rows")
+    # about 50 events per second, so second resolution strings repeat
+    timestamps = pd.Timestamp(FIRST_EVENT_DT) + pd.to_timedelta(
+        np.random.default_rng(0).exponential(20, rows).cumsum(), unit="ms"
+    )
+    if layout == "epoch_ms":
+        values = pd.Series(timestamps.asi8 // 1_000_000)
+    else:
+        values = pd.Series(timestamps.strftime("%d/%m/%Y %H:%M:%S"))
+    size = int(values.memory_usage(deep=True))
+
+    def parse():
+        if parser == "to_datetime" and layout == "epoch_ms":
+            parsed = pd.to_datetime(values, unit="ms")
+        elif parser == "to_datetime":
+            parsed = pd.to_datetime(values, dayfirst=True)
+        else:
+            parsed = parse_timestamps(values)
+        return {"events": len(parsed), "bytes": size}
+
+    run_benchmark(parse)
@@ -0,0 +1,43 @@
+import os
+
+import boto3
+import pytest
+
+from aws_dataflow_simulator.utils_rds import upload_csv_to_rds
+from benchmarks.conftest import BUCKET
+from benchmarks.rds_load import TABLE, drop_table, make_csv
+
+KEY = "historic.csv"
+
+psycopg2 = pytest.importorskip("psycopg2")
+DSN = os.getenv("BENCH_POSTGRES_DSN")
+
+
+@pytest.fixture
+def rds(aws, request):
+    if not DSN:
+        pytest.skip("set BENCH_POSTGRES_DSN, e.g. after make postgres-start")
+    rows = request.config.getoption("--bench-rows")
+    body = make_csv(rows)
+    boto3.client("s3").put_object(Bucket=BUCKET, Key=KEY, Body=body)
+    conn = psycopg2.connect(DSN)
+    try:
+        yield conn, rows, len(body)
+        drop_table(conn)
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("method", ["copy", "insert"])
+def test_load_rds(run_benchmark, rds, method):
+    conn, rows, size = rds
+
+    def setup():
+        drop_table(conn)
+        return (), {}
+
+    def load():
+        assert upload_csv_to_rds(BUCKET, KEY, TABLE, method, conn) == rows
+        return {"events": rows, "bytes": size}
+
+    run_benchmark(load, setup=setup)
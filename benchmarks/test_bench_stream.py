@@ -0,0 +1,140 @@
+import time
+
+import boto3
+import pandas as pd
+import pytest
+
+from aws_dataflow_simulator.dataflow.stream import CSVtoStream
+from benchmarks.conftest import BUCKET
+from benchmarks.fake_kinesis import WRITE_RECORDS_PER_S, FakeKinesis
+
+STREAM_NAME = "benchmark-stream"
+# compresses the dataset timeline to nothing, events are sent as fast as possible
+SPEED = 1e9
+# seconds of traffic at the shard write limit in the throttled replay
+THROTTLED_SECONDS = 3
+
+
+@pytest.fixture
+def use_dataset(aws, monkeypatch, processed_datasets):
+    """Upload a prepared dataset to the mocked bucket and point the config at it."""
+    for name, value in {
+        "get_s3_bucket_name": lambda: BUCKET,
+        "get_kinesis_stream_name": lambda: STREAM_NAME,
+        "get_stream_concurrency": lambda: None,
+        "get_metrics_jsonl_path": lambda: None,
+        "get_metrics_prometheus_port": lambda: None,
+        "get_metrics_emf": lambda: False,
+    }.items():
+        monkeypatch.setattr(f"aws_dataflow_simulator.config.{name}", value)
+
+    def use(fmt: str, rows: int = None) -> int:
+        key = f"data/dataset_processed.{fmt}"
+        path = processed_datasets[fmt]
+        if rows is not None:
+            path = path.replace(f".{fmt}", f"_head.{fmt}")
+            pd.read_csv(processed_datasets[fmt], nrows=rows).to_csv(path, index=False)
+        boto3.client("s3").upload_file(path, BUCKET, key)
+        monkeypatch.setattr(
+            "aws_dataflow_simulator.config.get_dataset_filepath",
+            lambda processed=True: key,
+        )
+        return rows or len(pd.read_parquet(processed_datasets["parquet"]))
+
+    return use
+
+
+@pytest.fixture
+def replay(run_benchmark, monkeypatch, bench_shards):
+    """Benchmark full replays, each into a new FakeKinesis stream."""
+
+    def run(
+        rows: int,
+        batch_mode: bool,
+        enforce_limits: bool = False,
+        rounds=3,
+        aggregate: bool = False,
+    ):
+        def setup():
+            kinesis = FakeKinesis(
+                shard_count=bench_shards, enforce_limits=enforce_limits
+            )
+            # pace writes only when the stream enforces the shard limits
+            monkeypatch.setattr(
+                "aws_dataflow_simulator.config.get_stream_rate_limit",
+                lambda: enforce_limits,
+            )
+            monkeypatch.setattr(
+                "aws_dataflow_simulator.dataflow.stream.get_client",
+                lambda service_name, **kwargs: kinesis,
+            )
+            csv_to_stream = CSVtoStream(
+                batch_mode=batch_mode, speed=SPEED, aggregate=aggregate
+            )
+            return (csv_to_stream, kinesis), {}
+
+        def target(csv_to_stream, kinesis):
+            start = time.monotonic()
+            csv_to_stream.start_stream()
+            assert csv_to_stream.metrics.counters["events_sent"].value == rows
+            # aggregation packs many events into each Kinesis record
+            assert aggregate or kinesis.record_count == rows
+            return {
+                "events": rows,
+                "bytes": csv_to_stream.metrics.counters["bytes_sent"].value,
+                "first_event_s": kinesis.first_put_at - start,
+                "throttled_records": kinesis.throttled_records,
+                "kinesis_records": kinesis.record_count,
+            }
+
+        return run_benchmark(target, setup=setup, rounds=rounds)
+
+    return run
+
+
+@pytest.mark.parametrize(
+    "fmt, batch_mode",
+    [("csv", False), ("csv", True), ("parquet", True)],
+    ids=["csv-record", "csv-batch", "parquet-batch"],
+)
+def test_stream(replay, use_dataset, fmt, batch_mode):
+    replay(use_dataset(fmt), batch_mode)
+
+
+@pytest.mark.parametrize(
+    "batch_mode, aggregate",
+    [(False, False), (True, False), (True, True)],
+    ids=["record", "batch", "aggregated"],
+)
+def test_stream_throttled(
+    replay, use_dataset, bench_shards, benchmark, batch_mode, aggregate
+):
+    """Replay a few seconds worth of records at the per-shard write limit."""
+    rows = THROTTLED_SECONDS * WRITE_RECORDS_PER_S * bench_shards
+    results = replay(
+        use_dataset("csv", rows=rows),
+        batch_mode,
+        enforce_limits=True,
+        rounds=1,
+        aggregate=aggregate,
+    )
+
+    benchmark.extra_info.update(
+        shard_limit_events_per_s=WRITE_RECORDS_PER_S * bench_shards,
+        throttled_records=results[-1]["throttled_records"],
+        kinesis_records=results[-1]["kinesis_records"],
+    )
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_stream_local(replay, use_dataset, processed_datasets, monkeypatch, fmt):
+    """Replay the memory-mapped local dataset instead of reading it from S3."""
+    rows = use_dataset(fmt)
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.config.get_stream_source", lambda: "local"
+    )
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.config.get_dataset_filepath",
+        lambda processed=True: processed_datasets[fmt],
+    )
+    replay(rows, batch_mode=True)
@@ -28,7 +28,8 @@ class StreamingStack(Stack):
         self.bucket = bucket  # from S3BucketStack
         self.kinesis_stream = self._add_kinesis_stream()
         self.docker_image = self._build_docker_image()
-        self.fargate_service = self._get_fargate_service()
+        self.fargate_services = self._get_fargate_services()
+        self.fargate_service = self.fargate_services[0]
 
         if config.get_billing_alarm_threshold() > 0:
             self._add_cloudwatch_alarm()
@@ -56,7 +57,7 @@ class StreamingStack(Stack):
 
         return docker_image
 
-    def _get_fargate_service(self):
+    def _get_fargate_services(self):
         # Create an ECS cluster
         vpc = ec2.Vpc(self, "Vpc", max_azs=2)  # VPC for ECS
         vpc.apply_removal_policy(core.RemovalPolicy.DESTROY)
@@ -77,34 +78,66 @@ class StreamingStack(Stack):
             ],
         )
 
-        task_definition = ecs.FargateTaskDefinition(
-            self,
-            "FargateTaskDefinition",
-            memory_limit_mib=1024,
-            cpu=512,
-            task_role=task_role,
-        )
-
-        # Add the container to the task definition
-        container = task_definition.add_container(
-            "FargateContainer",
-            image=ecs.ContainerImage.from_docker_image_asset(self.docker_image),
-            logging=ecs.LogDrivers.aws_logs(stream_prefix="FargateContainer"),
-            environment={"KINESIS_STREAM_NAME": self.kinesis_stream.stream_name},
-        )
-        # Add a port mapping to the container
-        container.add_port_mappings(ecs.PortMapping(container_port=80, host_port=80))
-        # Define the Fargate service
-        fargate_service = ecs.FargateService(
-            self,
-            "FargateService",
-            cluster=cluster,
-            desired_count=1,  # Adjust as needed
-            task_definition=task_definition,
-        )
+        # one service per replay worker, as ECS tasks of a service have no ordinal
+        workers = config.get_stream_workers()
+        environment = {"KINESIS_STREAM_NAME": self.kinesis_stream.stream_name}
+        if workers > 1:
+            # the shared start is a deploy parameter, not part of the template:
+            # one computed at synth time passes before a slow deploy ends and
+            # changes the template on every synth. With partition_by=range the
+            # slices follow each other on this clock, so only key partitioning
+            # scales throughput with the workers.
+            start_at = core.CfnParameter(
+                self,
+                "ReplayStartAt",
+                type="String",
+                description="Shared start of the replay workers, "
+                "epoch seconds or ISO 8601.",
+                default=self.node.try_get_context("replay_start_at"),
+            )
+            environment.update(
+                WORKER_COUNT=str(workers), REPLAY_START_AT=start_at.value_as_string
+            )
+
+        fargate_services = []
+        for worker_index in range(workers):
+            suffix = f"Worker{worker_index}" if worker_index else ""
+            task_definition = ecs.FargateTaskDefinition(
+                self,
+                f"FargateTaskDefinition{suffix}",
+                memory_limit_mib=1024,
+                cpu=512,
+                task_role=task_role,
+            )
+
+            # Add the container to the task definition
+            container = task_definition.add_container(
+                "FargateContainer",
+                image=ecs.ContainerImage.from_docker_image_asset(self.docker_image),
+                logging=ecs.LogDrivers.aws_logs(stream_prefix="FargateContainer"),
+                environment=(
+                    dict(environment, WORKER_INDEX=str(worker_index))
+                    if workers > 1
+                    else environment
+                ),
+            )
+            # Add a port mapping to the container
+            container.add_port_mappings(ecs.PortMapping(container_port=80, host_port=80))
+            # Define the Fargate service
+            fargate_services.append(
+                ecs.FargateService(
+                    self,
+                    f"FargateService{suffix}",
+                    cluster=cluster,
+                    desired_count=1,  # one task per worker
+                    task_definition=task_definition,
+                )
+            )
         # Grant the necessary permissions to the task
         self.bucket.grant_read(task_role)
-        return fargate_service
+        # replay checkpoints, e.g. stream.checkpoint_path: s3://<bucket>/checkpoints/replay.json
+        self.bucket.grant_write(task_role, "checkpoints/*")
+        return fargate_services
 
     def _add_cloudwatch_alarm(self):
         """Setup CloudWatch Billing Alarm"""
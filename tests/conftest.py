@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from aws_dataflow_simulator.clients import clear_clients
+
+
+@pytest.fixture(autouse=True)
+def shared_clients():
+    """Give every test fresh AWS clients, created inside its own moto mock."""
+    clear_clients()
+    yield
+    clear_clients()
+
+
+class FakeClock:
+    """Monotonic clock whose sleep advances it instead of waiting."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class RecordingSender:
+    """Record when events are put and batches flushed on a FakeClock."""
+
+    def __init__(self, clock, put_duration_s=0.0):
+        self.clock = clock
+        self.put_duration_s = put_duration_s
+        self.events = []
+        self.partition_keys = []
+        self.flushes = []
+        self.drains = []
+        self.closed = False
+
+    def put(self, data, partition_key):
+        self.events.append((round(self.clock.now * 1000, 3), json.loads(data)))
+        self.partition_keys.append(partition_key)
+        self.clock.now += self.put_duration_s
+
+    def flush(self):
+        self.flushes.append(round(self.clock.now * 1000, 3))
+
+    def drain(self):
+        self.drains.append(len(self.events))
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def make_clock():
+    """Create FakeClocks, e.g. a fresh one for every replay of a test."""
+    return FakeClock
+
+
+@pytest.fixture
+def clock(make_clock):
+    return make_clock()
+
+
+@pytest.fixture
+def make_sender():
+    """Create RecordingSenders on a FakeClock."""
+    return RecordingSender
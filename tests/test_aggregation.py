@@ -0,0 +1,50 @@
+import hashlib
+
+import pytest
+
+from aws_dataflow_simulator.dataflow.aggregation import (
+    MAGIC,
+    RecordAggregator,
+    deaggregate,
+    is_aggregated,
+)
+
+
+def test_aggregated_record_wire_format():
+    aggregator = RecordAggregator()
+    aggregator.add(b"hi", "k")
+
+    data, partition_key = aggregator.serialize()
+
+    # partition_key_table: "k", records: {partition_key_index: 0, data: "hi"}
+    message = b"\x0a\x01k" + b"\x1a\x06" + b"\x08\x00\x1a\x02hi"
+    assert data == MAGIC + message + hashlib.md5(message).digest()
+    assert partition_key == "k"
+    assert len(aggregator) == 0
+
+
+def test_round_trip_shares_the_partition_key_table():
+    aggregator = RecordAggregator()
+    records = [("a", b"1" * 200), ("b", b"2"), ("a", b""), ("é", b"\xff" * 130)]
+    for partition_key, data in records:
+        expected_size = aggregator.size_with(data, partition_key)
+        aggregator.add(data, partition_key)
+        assert aggregator.size == expected_size
+
+    data, partition_key = aggregator.serialize()
+
+    assert len(data) == expected_size
+    assert partition_key == "a"
+    assert deaggregate(data) == [(key, None, value) for key, value in records]
+
+
+def test_plain_and_corrupt_records_are_not_aggregated():
+    aggregator = RecordAggregator()
+    aggregator.add(b"event", "key")
+    data, _ = aggregator.serialize()
+
+    assert is_aggregated(data)
+    assert not is_aggregated(b'{"id": 1}')
+    assert not is_aggregated(data[:-1] + bytes([data[-1] ^ 1]))
+    with pytest.raises(ValueError):
+        deaggregate(b'{"id": 1}')
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aws_dataflow_simulator.dataflow.amplify import (
+    amplify_frame,
+    amplify_rows,
+    variant_key,
+    variant_offsets,
+)
+from aws_dataflow_simulator.dataflow.serialization import DELAY_COLUMN
+
+
+def rows():
+    return [
+        {"id": "a", "tx_datetime": "2024-01-01 00:00:00", DELAY_COLUMN: "100"},
+        {"id": "b", "tx_datetime": "2024-01-01 00:00:00.100000", DELAY_COLUMN: "0.5"},
+        {"id": "c", "tx_datetime": "2024-01-01 00:00:00.100500", DELAY_COLUMN: "0"},
+    ]
+
+
+def test_variant_key():
+    assert variant_key("card-1", 0) == "card-1"
+    assert variant_key("card-1", 3) == "card-1#3"
+
+
+def test_variant_offsets_stay_before_the_next_event():
+    delays_ms = np.array([100.0, 0.5, 0.0, 1000.0])
+
+    offsets_ms, variant_delays_ms = variant_offsets(
+        delays_ms, 5, jitter_ms=20, rng=np.random.default_rng(0)
+    )
+
+    assert (offsets_ms[:, 0] == 0).all()
+    assert (np.diff(offsets_ms, axis=1) >= 0).all()
+    assert (offsets_ms <= np.minimum(delays_ms, 20)[:, None]).all()
+    assert (variant_delays_ms >= 0).all()
+    assert np.allclose(variant_delays_ms.sum(axis=1), delays_ms)
+
+
+def test_amplify_rows_keeps_the_timeline():
+    variants = amplify_rows(rows(), 3, None, np.random.default_rng(0), "tx_datetime")
+
+    assert [row["id"] for row in variants] == [
+        "a",
+        "a#1",
+        "a#2",
+        "b",
+        "b#1",
+        "b#2",
+        "c",
+        "c#1",
+        "c#2",
+    ]
+    assert sum(row[DELAY_COLUMN] for row in variants) == pytest.approx(100.5)
+    timestamps = pd.to_datetime(
+        [row["tx_datetime"] for row in variants], format="ISO8601"
+    )
+    assert timestamps.is_monotonic_increasing
+    # every event is at the offset its delays add up to
+    offsets_ms = np.cumsum([0] + [row[DELAY_COLUMN] for row in variants[:-1]])
+    assert np.allclose(
+        (timestamps - timestamps[0]).total_seconds() * 1000, offsets_ms, atol=1e-3
+    )
+
+
+def test_amplify_frame_matches_amplify_rows():
+    df = pd.DataFrame(rows()).astype({DELAY_COLUMN: float})
+
+    frame = amplify_frame(df, 4, 30, np.random.default_rng(5), "tx_datetime")
+    variants = amplify_rows(rows(), 4, 30, np.random.default_rng(5), "tx_datetime")
+
+    assert frame["id"].tolist() == [row["id"] for row in variants]
+    assert np.allclose(frame[DELAY_COLUMN], [row[DELAY_COLUMN] for row in variants])
+    timestamps = pd.to_datetime(
+        [row["tx_datetime"] for row in variants], format="ISO8601"
+    )
+    assert (abs(frame["tx_datetime"] - timestamps) < pd.Timedelta(1, "us")).all()
+
+
+def test_amplify_suffixes_the_key_column():
+    df = pd.DataFrame(rows()).astype({DELAY_COLUMN: float})
+
+    frame = amplify_frame(
+        df, 2, None, np.random.default_rng(0), key_column="tx_datetime"
+    )
+    variants = amplify_rows(
+        rows(), 2, None, np.random.default_rng(0), key_column="tx_datetime"
+    )
+
+    assert frame["id"].tolist() == ["a", "a", "b", "b", "c", "c"]
+    assert [row["tx_datetime"] for row in variants][:2] == [
+        "2024-01-01 00:00:00",
+        "2024-01-01 00:00:00#1",
+    ]
+    assert frame["tx_datetime"].tolist() == [row["tx_datetime"] for row in variants]
+
+
+def test_factor_one_is_a_no_op():
+    assert amplify_rows(rows(), 1, None, np.random.default_rng(0)) == rows()
@@ -0,0 +1,118 @@
+import io
+
+import boto3
+import pandas as pd
+import pytest
+from moto import mock_aws
+
+from aws_dataflow_simulator.dataflow.batch import CSVtoBatch, partition_key
+from aws_dataflow_simulator.dataflow.scheduler import EventScheduler
+
+BUCKET = "test-bucket"
+CSV_BODY = (
+    "id,tx_datetime,time_till_next_event_ms\n"
+    "a,2024-08-19 15:00:00,1800000\n"
+    "b,2024-08-19 15:30:00,5400000\n"
+    "c,2024-08-19 17:00:00,32400000\n"
+    "d,2024-08-20 02:00:00,0\n"
+)
+
+
+@pytest.fixture
+def make_batch(monkeypatch, tmp_path):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    dataset = tmp_path / "dataset_processed.csv"
+    dataset.write_text(CSV_BODY)
+    for name, value in {
+        "get_s3_bucket_name": lambda: BUCKET,
+        "get_dataset_filepath": lambda processed=True: str(dataset),
+        "get_colname_dt": lambda: "tx_datetime",
+        "get_batch_processes": lambda: 2,
+        "get_batch_chunksize": lambda: 2,
+    }.items():
+        monkeypatch.setattr(f"aws_dataflow_simulator.config.{name}", value)
+
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        yield lambda **kwargs: CSVtoBatch(**kwargs)
+
+
+def list_objects():
+    response = boto3.client("s3").list_objects_v2(Bucket=BUCKET)
+    return sorted(obj["Key"] for obj in response.get("Contents", []))
+
+
+def read_window(prefix):
+    s3_client = boto3.client("s3")
+    frames = [
+        pd.read_csv(
+            io.BytesIO(s3_client.get_object(Bucket=BUCKET, Key=key)["Body"].read())
+        )
+        for key in list_objects()
+        if key.startswith(prefix)
+    ]
+    return pd.concat(frames).sort_values("id")["id"].tolist()
+
+
+def test_partition_key():
+    window_start = pd.Timestamp("2024-08-19 15:00:00")
+    assert partition_key(window_start, "hour") == "dt=2024-08-19/hour=15"
+    assert partition_key(window_start, "day") == "dt=2024-08-19"
+
+
+def test_start_batch_writes_hourly_partitions(make_batch):
+    csv_to_batch = make_batch(window="hour", speed=1e9)
+
+    assert csv_to_batch.start_batch()["statusCode"] == 200
+
+    assert list_objects() == [
+        "batch/dt=2024-08-19/hour=15/part-00000.csv",
+        "batch/dt=2024-08-19/hour=17/part-00001.csv",
+        "batch/dt=2024-08-20/hour=02/part-00001.csv",
+    ]
+    assert read_window("batch/dt=2024-08-19/hour=15/") == ["a", "b"]
+
+
+def test_start_batch_writes_daily_partitions(make_batch):
+    make_batch(window="day", speed=1e9, s3_prefix="drops/").start_batch()
+
+    # the first day spans both chunks, so it is dropped as two parts
+    assert list_objects() == [
+        "drops/dt=2024-08-19/part-00000.csv",
+        "drops/dt=2024-08-19/part-00001.csv",
+        "drops/dt=2024-08-20/part-00001.csv",
+    ]
+    assert read_window("drops/dt=2024-08-19/") == ["a", "b", "c"]
+
+
+def test_windows_are_released_at_their_end_on_the_timeline(
+    make_batch, monkeypatch, clock
+):
+    csv_to_batch = make_batch(window="hour", speed=3600)
+    monkeypatch.setattr(
+        csv_to_batch,
+        "get_scheduler",
+        lambda: EventScheduler(speed=3600, clock=clock, sleep=clock.sleep),
+    )
+    released = []
+    upload_part = csv_to_batch.upload_part
+
+    def recording_upload(path, staging_dir):
+        released.append((round(clock.now, 3), path.split("/")[-2]))
+        return upload_part(path, staging_dir)
+
+    monkeypatch.setattr(csv_to_batch, "upload_part", recording_upload)
+
+    csv_to_batch.start_batch()
+
+    # one simulated hour per second, windows close at 16:00, 18:00 and 03:00
+    assert sorted(released) == [(1.0, "hour=15"), (3.0, "hour=17"), (12.0, "hour=02")]
+
+
+def test_missing_timestamp_column_is_rejected(make_batch, monkeypatch):
+    monkeypatch.setattr("aws_dataflow_simulator.config.get_colname_dt", lambda: None)
+
+    with pytest.raises(ValueError):
+        make_batch()
@@ -0,0 +1,63 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from aws_dataflow_simulator.dataflow.checkpoint import (
+    ReplayCheckpoint,
+    ReplayPosition,
+    parse_s3_uri,
+)
+
+DATASET = "s3://test-bucket/data/test_processed.csv"
+
+
+def test_parse_s3_uri():
+    assert parse_s3_uri("s3://bucket/path/to/key.json") == (
+        "bucket",
+        "path/to/key.json",
+    )
+    assert parse_s3_uri("/tmp/checkpoint.json") is None
+
+
+def test_local_checkpoint_round_trip(tmp_path):
+    path = tmp_path / "replay.json"
+    checkpoint = ReplayCheckpoint(str(path), DATASET, etag='"abc"')
+    assert checkpoint.load() is None
+
+    checkpoint.save(ReplayPosition(row=10, byte_offset=512, offset_ms=1500.5))
+
+    assert checkpoint.load() == ReplayPosition(10, 512, 1500.5)
+    assert not (tmp_path / "replay.json.tmp").exists()
+
+
+def test_s3_checkpoint_round_trip(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket="checkpoints")
+        checkpoint = ReplayCheckpoint("s3://checkpoints/replay.json", DATASET)
+        assert checkpoint.load() is None
+
+        checkpoint.save(ReplayPosition(row=3, finished=True))
+
+        assert checkpoint.load() == ReplayPosition(row=3, finished=True)
+
+
+@pytest.mark.parametrize(
+    "dataset, etag",
+    [("s3://test-bucket/data/other.csv", '"abc"'), (DATASET, '"changed"')],
+)
+def test_checkpoint_of_another_dataset_is_ignored(tmp_path, dataset, etag):
+    path = str(tmp_path / "replay.json")
+    ReplayCheckpoint(path, DATASET, etag='"abc"').save(ReplayPosition(row=10))
+
+    assert ReplayCheckpoint(path, dataset, etag=etag).load() is None
+
+
+def test_failed_save_does_not_raise(tmp_path, caplog):
+    checkpoint = ReplayCheckpoint(str(tmp_path / "missing" / "replay.json"), DATASET)
+
+    checkpoint.save(ReplayPosition(row=1))
+
+    assert "Could not save replay checkpoint" in caplog.text
@@ -0,0 +1,22 @@
+import subprocess
+import sys
+from pathlib import Path
+
+
+def test_cli_import_defers_heavy_modules(tmp_path):
+    # run in a directory without dataflow_config.yaml
+    script = (
+        "import sys\n"
+        "from aws_dataflow_simulator.cli import cli\n"
+        "print(sorted(m for m in ('boto3', 'pandas', 'yaml') if m in sys.modules))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=tmp_path,
+        capture_output=True,
+        text=True,
+        env={"PYTHONPATH": str(Path(__file__).parents[1])},
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,18 @@
+from aws_dataflow_simulator.clients import clear_clients, get_client
+
+
+def test_clients_are_shared_per_service_and_pool_size(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+    s3_client = get_client("s3")
+
+    assert get_client("s3") is s3_client
+    assert get_client("s3", max_pool_connections=5) is s3_client
+    assert get_client("kinesis") is not s3_client
+
+    pooled = get_client("s3", max_pool_connections=40)
+    assert pooled is not s3_client
+    assert pooled.meta.config.max_pool_connections == 40
+
+    clear_clients()
+    assert get_client("s3") is not s3_client
@@ -0,0 +1,132 @@
+import pytest
+
+from aws_dataflow_simulator.dataflow.merge import (
+    MergedStream,
+    merge_events,
+    parse_sources,
+)
+from aws_dataflow_simulator.dataflow.scheduler import EventScheduler
+
+TRANSACTIONS = (
+    "id,tx_datetime,time_till_next_event_ms\n"
+    "t1,2024-01-01 00:00:00.100,200\n"
+    "t2,2024-01-01 00:00:00.300,300\n"
+    "t3,2024-01-01 00:00:00.600,0\n"
+)
+CLICKS = (
+    "user,click_dt,page,time_till_next_event_ms\n"
+    "u1,2024-01-01 00:00:00,home,250\n"
+    "u2,2024-01-01 00:00:00.250,cart,0\n"
+)
+
+
+def sent_events(senders):
+    """Events of all senders in time order, with their stream and partition key."""
+    return sorted(
+        (time_ms, name, partition_key)
+        for name, sender in senders.items()
+        for (time_ms, _), partition_key in zip(sender.events, sender.partition_keys)
+    )
+
+
+def test_merge_events_orders_by_time_then_source():
+    merged = merge_events(
+        [
+            iter([(1, b"a", "a"), (5, b"b", "b")]),
+            iter([(1, b"c", "c"), (2, b"d", "d")]),
+        ]
+    )
+
+    assert [(t, index, key) for t, index, _, key in merged] == [
+        (1, 0, "a"),
+        (1, 1, "c"),
+        (2, 1, "d"),
+        (5, 0, "b"),
+    ]
+
+
+def test_parse_sources_rejects_invalid_entries():
+    with pytest.raises(ValueError):
+        parse_sources([{"name": "clicks", "filepath": "clicks.csv"}])
+    with pytest.raises(ValueError):
+        parse_sources([{"name": "clicks", "filepath": "a.csv", "colname_dt": "dt"}] * 2)
+
+
+@pytest.fixture
+def merged_stream(monkeypatch, tmp_path):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("KINESIS_STREAM_NAME", "test-stream")
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.config.get_metrics_prometheus_port", lambda: None
+    )
+    (tmp_path / "transactions.csv").write_text(TRANSACTIONS)
+    (tmp_path / "clicks.csv").write_text(CLICKS)
+    return MergedStream(
+        sources=[
+            {
+                "name": "transactions",
+                "filepath": str(tmp_path / "transactions.csv"),
+                "colname_dt": "tx_datetime",
+            },
+            {
+                "name": "clicks",
+                "filepath": str(tmp_path / "clicks.csv"),
+                "colname_dt": "click_dt",
+                "kinesis_stream_name": "clicks-stream",
+                "partition_key": "page",
+                "key_prefix": "click-",
+            },
+        ],
+        batch_mode=False,
+        source="local",
+    )
+
+
+def test_merged_stream_interleaves_sources_on_one_timeline(
+    merged_stream, monkeypatch, clock, make_sender
+):
+    senders = {name: make_sender(clock) for name in ("test-stream", "clicks-stream")}
+    monkeypatch.setattr(merged_stream, "get_senders", lambda: senders)
+    monkeypatch.setattr(
+        merged_stream.streams[0],
+        "get_scheduler",
+        lambda: EventScheduler(speed=1, clock=clock, sleep=clock.sleep),
+    )
+
+    merged_stream.start_stream()
+
+    assert sent_events(senders) == [
+        (0.0, "clicks-stream", "click-home"),
+        (100.0, "test-stream", "t1"),
+        (250.0, "clicks-stream", "click-cart"),
+        (300.0, "test-stream", "t2"),
+        (600.0, "test-stream", "t3"),
+    ]
+    assert all(sender.closed for sender in senders.values())
+    assert merged_stream.metrics.counters["events_sent"].value == 5
+
+
+def test_merged_stream_amplifies_the_partition_key_of_a_source(
+    merged_stream, monkeypatch, clock, make_sender
+):
+    senders = {name: make_sender(clock) for name in ("test-stream", "clicks-stream")}
+    monkeypatch.setattr(merged_stream, "get_senders", lambda: senders)
+    monkeypatch.setattr(
+        merged_stream.streams[0],
+        "get_scheduler",
+        lambda: EventScheduler(speed=1, clock=clock, sleep=clock.sleep),
+    )
+    for stream in merged_stream.streams:
+        stream.amplify = 2
+
+    merged_stream.start_stream()
+
+    # the variants of a click are keyed by its page, not by the first column
+    assert sorted(senders["clicks-stream"].partition_keys) == [
+        "click-cart",
+        "click-cart#1",
+        "click-home",
+        "click-home#1",
+    ]
@@ -0,0 +1,103 @@
+import io
+import json
+import random
+import urllib.request
+
+import pytest
+
+from aws_dataflow_simulator.dataflow.metrics import (
+    EmfExporter,
+    Histogram,
+    JsonLinesExporter,
+    MetricsReporter,
+    ProducerMetrics,
+    PrometheusExporter,
+    to_prometheus,
+)
+
+
+def test_histogram_percentiles_within_relative_error():
+    random.seed(1)
+    values = [random.lognormvariate(2, 1.5) for _ in range(20000)]
+    histogram = Histogram()
+    histogram.record_many(values[:10000])
+    for value in values[10000:]:
+        histogram.record(value)
+
+    values.sort()
+    for percent in (50, 90, 99):
+        exact = values[int(len(values) * percent / 100) - 1]
+        assert histogram.percentile(percent) == pytest.approx(exact, rel=1 / 32)
+    assert histogram.count == 20000
+    assert histogram.max == values[-1]
+
+
+def test_histogram_handles_zero_and_empty():
+    histogram = Histogram()
+    assert histogram.percentile(99) == 0.0
+
+    histogram.record(0.0)
+    histogram.record(0.0)
+    histogram.record(250.0)
+    assert histogram.percentile(50) == 0.0
+    assert histogram.percentile(100) == 250.0
+
+
+def make_metrics():
+    metrics = ProducerMetrics()
+    metrics.inc("events_sent", 10)
+    metrics.inc("throttled_records", 2)
+    metrics.observe("send_latency_ms", 12.5)
+    return metrics
+
+
+def test_prometheus_text_format():
+    text = to_prometheus(make_metrics().snapshot())
+
+    assert "dataflowsim_events_sent 10\n" in text
+    assert "dataflowsim_throttled_records 2\n" in text
+    assert 'dataflowsim_send_latency_ms{quantile="0.99"} 12.5\n' in text
+    assert "dataflowsim_send_latency_ms_count 1\n" in text
+
+
+def test_emf_exporter_declares_every_metric():
+    stream = io.StringIO()
+    EmfExporter("Test", {"StreamName": "s"}, stream=stream).export(
+        make_metrics().snapshot()
+    )
+
+    event = json.loads(stream.getvalue())
+    directive = event["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == "Test"
+    assert directive["Dimensions"] == [["StreamName"]]
+    assert event["StreamName"] == "s"
+    assert all(metric["Name"] in event for metric in directive["Metrics"])
+    assert event["events_sent"] == 10
+    assert event["send_latency_ms_p99"] == 12.5
+
+
+def test_reporter_exports_final_snapshot_on_close(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    metrics = make_metrics()
+    reporter = MetricsReporter(
+        metrics, [JsonLinesExporter(str(path))], interval_s=60
+    ).start()
+    metrics.inc("events_sent", 5)
+    reporter.close()
+
+    snapshots = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(snapshots) == 1
+    assert snapshots[0]["counters"]["events_sent"] == 15
+
+
+def test_prometheus_exporter_serves_latest_snapshot():
+    exporter = PrometheusExporter(port=0, host="127.0.0.1")
+    try:
+        exporter.export(make_metrics().snapshot())
+        url = f"http://127.0.0.1:{exporter.port}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            body = response.read().decode()
+    finally:
+        exporter.close()
+
+    assert "dataflowsim_events_sent 10" in body
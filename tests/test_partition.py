@@ -0,0 +1,91 @@
+import time
+
+import pandas as pd
+import pytest
+
+from aws_dataflow_simulator.dataflow.partition import (
+    fold_delays,
+    parse_start_at,
+    select_frame,
+    select_rows,
+    shared_clock_offset_ms,
+    slice_bounds,
+    worker_of,
+)
+from aws_dataflow_simulator.dataflow.serialization import DELAY_COLUMN
+from aws_dataflow_simulator.dataflow.stream import run_workers
+
+
+def test_worker_of_is_stable_and_in_range():
+    assert worker_of("card-42", 4) == worker_of("card-42", 4)
+    assert {worker_of(f"card-{i}", 4) for i in range(100)} == {0, 1, 2, 3}
+
+
+def test_fold_delays_keeps_timeline_offsets():
+    # offsets 0, 100, 150, 400, total 410
+    lead_ms, delays_ms = fold_delays([100, 50, 250, 10], [False, True, False, True])
+
+    assert lead_ms == 100
+    assert delays_ms.tolist() == [300, 10]
+
+
+def test_fold_delays_without_kept_rows_skips_the_batch():
+    lead_ms, delays_ms = fold_delays([100, 50], [False, False])
+
+    assert lead_ms == 150
+    assert len(delays_ms) == 0
+
+
+def test_select_rows_and_frame_agree():
+    rows = [{"id": str(i), DELAY_COLUMN: str(i * 10)} for i in range(20)]
+    df = pd.DataFrame(rows).astype({DELAY_COLUMN: float})
+
+    kept_rows, rows_lead_ms = select_rows([dict(row) for row in rows], 1, 3)
+    kept_df, frame_lead_ms = select_frame(df, 1, 3)
+
+    assert [row["id"] for row in kept_rows] == kept_df["id"].tolist()
+    assert [row[DELAY_COLUMN] for row in kept_rows] == kept_df[DELAY_COLUMN].tolist()
+    assert rows_lead_ms == frame_lead_ms
+    assert all(worker_of(row["id"], 3) == 1 for row in kept_rows)
+
+
+def test_slice_bounds_cover_the_dataset():
+    bounds = [slice_bounds(10, i, 3) for i in range(3)]
+
+    assert bounds == [(0, 3), (3, 6), (6, 10)]
+
+
+def test_parse_start_at():
+    assert parse_start_at(None) is None
+    assert parse_start_at("1700000000") == 1700000000.0
+    assert parse_start_at("2023-11-14T22:13:20") == 1700000000.0
+    assert parse_start_at("2023-11-14T23:13:20+01:00") == 1700000000.0
+
+
+def test_shared_clock_offset_is_negative_before_the_start():
+    assert shared_clock_offset_ms(time.time() + 10, speed=2) == pytest.approx(
+        -20000, abs=100
+    )
+
+
+def record_worker(path, worker_index, workers, start_at, **kwargs):
+    with open(path, "a") as file:
+        file.write(f"{worker_index},{workers},{start_at},{kwargs['speed']}\n")
+
+
+def fail_worker(**kwargs):
+    raise RuntimeError("worker failed")
+
+
+def test_run_workers_starts_one_process_per_worker(tmp_path):
+    path = tmp_path / "workers.csv"
+
+    run_workers(3, start_at=1700000000, target=record_worker, path=str(path), speed=2)
+
+    lines = sorted(path.read_text().splitlines())
+    assert lines == [f"{i},3,1700000000.0,2" for i in range(3)]
+
+
+def test_run_workers_raises_when_a_worker_fails():
+    with pytest.raises(RuntimeError, match="replay-worker-0"):
+        run_workers(1, target=fail_worker)
@@ -0,0 +1,151 @@
+import os
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from aws_dataflow_simulator.cli import cli
+from aws_dataflow_simulator.dataflow.prepare_cache import (
+    APPEND,
+    FRESH,
+    STALE,
+    PrepareCache,
+    hash_file,
+)
+from aws_dataflow_simulator.utils_dataset import (
+    preprocess_dataset,
+    save_processed_dataset,
+)
+
+HEADER = "ID,Tx_Datetime,Amount\n"
+ROWS = (
+    "a,2024-01-01 00:00:02,1.5\n"
+    "b,2024-01-01 00:00:00,2.5\n"
+    "c,2024-01-01 00:00:01,3.5\n"
+)
+NEW_ROWS = "d,2024-01-01 00:00:05,4.5\n" "e,2024-01-01 00:00:03,5.5\n"
+SETTINGS = {
+    "apply_delay": True,
+    "delay_ms": None,
+    "colname_dt": "tx_datetime",
+    "first_event_dt": "2024-08-19 15:00:00",
+}
+
+
+def prepare(input_path, output_path, settings=SETTINGS):
+    df = preprocess_dataset(
+        dataset_path=str(input_path),
+        start_datetime=settings["first_event_dt"],
+        apply_delay=settings["apply_delay"],
+        delay_ms=settings["delay_ms"],
+        timestamp_column_name=settings["colname_dt"],
+    )
+    save_processed_dataset(df, str(output_path))
+    PrepareCache(str(input_path), str(output_path), settings).save(len(df))
+
+
+@pytest.fixture
+def prepared(tmp_path):
+    input_path = tmp_path / "dataset.csv"
+    input_path.write_text(HEADER + ROWS)
+    output_path = tmp_path / "dataset_processed.csv"
+    prepare(input_path, output_path)
+    return input_path, output_path
+
+
+def test_hash_file_hashes_a_prefix_in_the_same_read(tmp_path):
+    path = tmp_path / "data"
+    path.write_bytes(b"abcdef")
+    (tmp_path / "prefix").write_bytes(b"abc")
+
+    digest, prefix_digest = hash_file(str(path), prefix_size=3)
+
+    assert prefix_digest == hash_file(str(tmp_path / "prefix"))[0]
+    assert hash_file(str(path), prefix_size=10)[1] is None
+
+
+def test_unchanged_input_is_fresh(prepared):
+    input_path, output_path = prepared
+    # rewritten with the same content, the hash decides
+    input_path.write_text(HEADER + ROWS)
+    os.utime(input_path, ns=(1, 1))
+
+    assert PrepareCache(str(input_path), str(output_path), SETTINGS).status() == FRESH
+
+
+def test_changed_settings_input_or_output_are_stale(prepared):
+    input_path, output_path = prepared
+
+    settings = dict(SETTINGS, delay_ms=10)
+    assert PrepareCache(str(input_path), str(output_path), settings).status() == STALE
+
+    input_path.write_text(HEADER + ROWS.replace("1.5", "9.5"))
+    assert PrepareCache(str(input_path), str(output_path), SETTINGS).status() == STALE
+
+    input_path.write_text(HEADER + ROWS)
+    output_path.write_text("edited\n")
+    assert PrepareCache(str(input_path), str(output_path), SETTINGS).status() == STALE
+
+
+def test_appended_rows_match_a_full_prepare(prepared, tmp_path):
+    input_path, output_path = prepared
+    with open(input_path, "a") as file:
+        file.write(NEW_ROWS)
+    cache = PrepareCache(str(input_path), str(output_path), SETTINGS)
+
+    assert cache.status() == APPEND
+    assert cache.append() == 2
+    cache.save(cache.rows() + 2)
+
+    full_path = tmp_path / "full_processed.csv"
+    prepare(input_path, full_path)
+    pd.testing.assert_frame_equal(pd.read_csv(output_path), pd.read_csv(full_path))
+    assert PrepareCache(str(input_path), str(output_path), SETTINGS).status() == FRESH
+
+
+def test_rows_older_than_the_output_cannot_be_appended(prepared):
+    input_path, output_path = prepared
+    with open(input_path, "a") as file:
+        file.write("f,2024-01-01 00:00:01,6.5\n")
+    cache = PrepareCache(str(input_path), str(output_path), SETTINGS)
+
+    assert cache.status() == APPEND
+    assert cache.append() is None
+
+
+def test_static_delay_rows_are_appended(tmp_path):
+    settings = dict(SETTINGS, delay_ms=10)
+    input_path = tmp_path / "dataset.csv"
+    input_path.write_text(HEADER + ROWS)
+    output_path = tmp_path / "dataset_processed.csv"
+    prepare(input_path, output_path, settings)
+    with open(input_path, "a") as file:
+        file.write(NEW_ROWS)
+
+    assert PrepareCache(str(input_path), str(output_path), settings).append() == 2
+    assert pd.read_csv(output_path)["id"].tolist() == list("abcde")
+
+
+def test_prepare_command_skips_unchanged_datasets(tmp_path, monkeypatch):
+    input_path = tmp_path / "dataset.csv"
+    input_path.write_text(HEADER + ROWS)
+    for name, value in {
+        "get_dataset_filepath": lambda processed=True: str(input_path),
+        "get_apply_delay": lambda: True,
+        "get_delay_ms": lambda: None,
+        "get_colname_dt": lambda: "tx_datetime",
+        "get_first_event_dt": lambda: "2024-08-19 15:00:00",
+    }.items():
+        monkeypatch.setattr(f"aws_dataflow_simulator.config.{name}", value)
+    runner = CliRunner()
+
+    first = runner.invoke(cli, ["dataset", "prepare"])
+    second = runner.invoke(cli, ["dataset", "prepare"])
+    with open(input_path, "a") as file:
+        file.write(NEW_ROWS)
+    third = runner.invoke(cli, ["dataset", "prepare"])
+
+    assert "Wrote 3 rows" in first.output
+    assert "up to date, skipping" in second.output
+    assert "Appended 2 new rows" in third.output
+    assert len(pd.read_csv(tmp_path / "dataset_processed.csv")) == 5
@@ -0,0 +1,396 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from aws_dataflow_simulator.dataflow.aggregation import deaggregate
+from aws_dataflow_simulator.dataflow.producer import (
+    AdaptiveTokenBucket,
+    AggregatingSender,
+    KinesisBatchProducer,
+    KinesisRecordSender,
+    ShardMap,
+    ShardRateLimiter,
+    ShardedProducer,
+)
+from aws_dataflow_simulator.exceptions import CouldNotPutRecordsToKinesis
+
+
+def ok_response(records):
+    return {"FailedRecordCount": 0, "Records": [{"SequenceNumber": "1"}] * len(records)}
+
+
+@pytest.fixture
+def kinesis_client():
+    client = MagicMock()
+    client.put_records.side_effect = lambda StreamName, Records: ok_response(Records)
+    return client
+
+
+def test_record_sender_puts_each_record(kinesis_client):
+    sender = KinesisRecordSender(kinesis_client, "test-stream")
+    sender.put(b"data", "key")
+    kinesis_client.put_record.assert_called_once_with(
+        StreamName="test-stream", Data=b"data", PartitionKey="key"
+    )
+
+
+class ThrottledError(Exception):
+    response = {"Error": {"Code": "ProvisionedThroughputExceededException"}}
+
+
+@patch("aws_dataflow_simulator.dataflow.producer.time.sleep")
+def test_record_sender_retries_throttled_records(_, kinesis_client):
+    kinesis_client.put_record.side_effect = [ThrottledError(), {}]
+    rate_limiter = MagicMock()
+    sender = KinesisRecordSender(
+        kinesis_client, "test-stream", rate_limiter=rate_limiter
+    )
+    sender.put(b"data", "key")
+
+    assert kinesis_client.put_record.call_count == 2
+    assert rate_limiter.acquire.call_count == 2
+    rate_limiter.throttled.assert_called_once_with("key")
+    counters = sender.metrics.snapshot()["counters"]
+    assert counters["throttled_records"] == 1
+    assert counters["retried_records"] == 1
+    assert counters["failed_records"] == 0
+
+
+@patch("aws_dataflow_simulator.dataflow.producer.time.sleep")
+def test_record_sender_raises_after_max_retries(_, kinesis_client):
+    kinesis_client.put_record.side_effect = ThrottledError()
+    sender = KinesisRecordSender(kinesis_client, "test-stream", max_retries=2)
+    with pytest.raises(ThrottledError):
+        sender.put(b"data", "key")
+    assert kinesis_client.put_record.call_count == 3
+    assert sender.metrics.counters["failed_records"].value == 1
+
+
+def test_batch_producer_flushes_at_record_limit(kinesis_client):
+    producer = KinesisBatchProducer(kinesis_client, "test-stream", max_records=3)
+    for i in range(7):
+        producer.put(b"x", str(i))
+
+    assert kinesis_client.put_records.call_count == 2
+    assert producer.pending == 1
+
+    producer.close()
+    sizes = [
+        len(c.kwargs["Records"]) for c in kinesis_client.put_records.call_args_list
+    ]
+    assert sizes == [3, 3, 1]
+
+
+def test_batch_producer_flushes_at_byte_limit(kinesis_client):
+    producer = KinesisBatchProducer(kinesis_client, "test-stream", max_bytes=25)
+    for i in range(3):
+        producer.put(b"0123456789", str(i))
+
+    # 11 bytes per record, the third record would overflow the 25 byte limit
+    assert kinesis_client.put_records.call_count == 1
+    assert producer.pending == 1
+
+
+def test_batch_producer_rejects_oversized_record(kinesis_client):
+    producer = KinesisBatchProducer(kinesis_client, "test-stream")
+    with pytest.raises(ValueError):
+        producer.put(b"x" * (1024 * 1024), "key")
+
+
+@patch("aws_dataflow_simulator.dataflow.producer.time.sleep")
+def test_batch_producer_retries_only_failed_records(_, kinesis_client):
+    kinesis_client.put_records.side_effect = [
+        {
+            "FailedRecordCount": 1,
+            "Records": [
+                {"SequenceNumber": "1"},
+                {"ErrorCode": "ProvisionedThroughputExceededException"},
+                {"SequenceNumber": "3"},
+            ],
+        },
+        {"FailedRecordCount": 0, "Records": [{"SequenceNumber": "2"}]},
+    ]
+    producer = KinesisBatchProducer(kinesis_client, "test-stream")
+    for key in ("a", "b", "c"):
+        producer.put(b"x", key)
+    producer.flush()
+
+    retried = kinesis_client.put_records.call_args_list[1].kwargs["Records"]
+    assert retried == [{"Data": b"x", "PartitionKey": "b"}]
+
+    counters = producer.metrics.snapshot()["counters"]
+    assert counters["put_requests"] == 2
+    assert counters["throttled_records"] == 1
+    assert counters["retried_records"] == 1
+    assert producer.metrics.histograms["batch_size"].max == 3
+
+
+@patch("aws_dataflow_simulator.dataflow.producer.time.sleep")
+def test_batch_producer_raises_after_max_retries(_, kinesis_client):
+    kinesis_client.put_records.side_effect = lambda StreamName, Records: {
+        "FailedRecordCount": len(Records),
+        "Records": [{"ErrorCode": "InternalFailure"}] * len(Records),
+    }
+    producer = KinesisBatchProducer(kinesis_client, "test-stream", max_retries=2)
+    producer.put(b"x", "key")
+    with pytest.raises(CouldNotPutRecordsToKinesis):
+        producer.flush()
+    assert kinesis_client.put_records.call_count == 3
+    assert producer.metrics.counters["failed_records"].value == 1
+
+
+@patch("aws_dataflow_simulator.dataflow.producer.time.sleep")
+def test_batch_producer_slows_down_throttled_shards(_, kinesis_client):
+    kinesis_client.put_records.side_effect = [
+        {
+            "FailedRecordCount": 1,
+            "Records": [
+                {"SequenceNumber": "1"},
+                {"ErrorCode": "ProvisionedThroughputExceededException"},
+            ],
+        },
+        ok_response([None]),
+    ]
+    rate_limiter = MagicMock()
+    producer = KinesisBatchProducer(
+        kinesis_client, "test-stream", rate_limiter=rate_limiter
+    )
+    producer.put(b"x", "a")
+    producer.put(b"x", "b")
+    producer.flush()
+
+    rate_limiter.throttled.assert_called_once_with("b")
+    acquired = [c.args for c in rate_limiter.acquire.call_args_list]
+    assert acquired == [("a", 2), ("b", 2), ("b", 2)]
+
+
+def test_token_bucket_paces_records_to_the_shard_limit(clock):
+    bucket = AdaptiveTokenBucket(records_per_s=100, burst_s=0.1, clock=clock)
+
+    # the burst of 10 records goes through at once, then one every 10 ms
+    assert [bucket.take(10) for _ in range(10)] == [0.0] * 10
+    assert bucket.take(10) == pytest.approx(0.01)
+    clock.sleep(0.01)
+    assert bucket.take(10) == 0.0
+
+
+def test_token_bucket_paces_bytes_to_the_shard_limit(clock):
+    bucket = AdaptiveTokenBucket(bytes_per_s=1000, burst_s=0.1, clock=clock)
+
+    assert bucket.take(100) == 0.0
+    assert bucket.take(50) == pytest.approx(0.05)
+    # records larger than the bucket wait for a full bucket, then go through
+    clock.sleep(0.1)
+    assert bucket.take(500) == 0.0
+    assert bucket.take(1) == pytest.approx(0.401)
+
+
+def test_token_bucket_decreases_multiplicatively_and_recovers_additively(clock):
+    bucket = AdaptiveTokenBucket(
+        increase_per_s=0.1, decrease=0.5, decrease_interval_s=0.5, clock=clock
+    )
+
+    bucket.throttled()
+    bucket.throttled()
+    # several throttled records of the same overloaded second count once
+    assert bucket.rate == 0.5
+    clock.sleep(1.0)
+    bucket.throttled()
+    assert bucket.rate == pytest.approx(0.3)
+    clock.sleep(10.0)
+    bucket.take(1)
+    assert bucket.rate == 1.0
+
+
+def test_rate_limiter_keeps_each_shard_within_its_limit(clock):
+    shard_map = ShardMap.even(2)
+    rate_limiter = ShardRateLimiter(
+        shard_map, records_per_s=100, clock=clock, sleep=clock.sleep
+    )
+    keys = [str(i) for i in range(1000)]
+    shard_keys = [k for k in keys if shard_map.shard_index(k) == 0][:200]
+
+    for key in shard_keys:
+        rate_limiter.acquire(key, 10)
+
+    # 200 records at 100 records/s, less the initial burst of 10
+    assert clock.now == pytest.approx(1.9)
+    other_key = next(k for k in keys if shard_map.shard_index(k) == 1)
+    assert rate_limiter.acquire(other_key, 10) == 0.0
+
+
+def test_shard_map_even_split_matches_hash_ranges():
+    shard_map = ShardMap.even(4)
+    keys = [str(i) for i in range(1000)]
+    counts = [0] * 4
+    for key in keys:
+        index = shard_map.shard_index(key)
+        assert shard_map.starting_hash_keys[index] <= ShardMap.hash_key(key)
+        counts[index] += 1
+    assert min(counts) > 200
+
+
+def test_shard_map_from_stream_skips_closed_shards():
+    client = MagicMock()
+    client.list_shards.return_value = {
+        "Shards": [
+            {
+                "HashKeyRange": {"StartingHashKey": "0"},
+                "SequenceNumberRange": {"EndingSequenceNumber": "9"},
+            },
+            {
+                "HashKeyRange": {"StartingHashKey": "0"},
+                "SequenceNumberRange": {},
+            },
+            {
+                "HashKeyRange": {"StartingHashKey": str(2**127)},
+                "SequenceNumberRange": {},
+            },
+        ]
+    }
+    assert ShardMap.from_stream(client, "test-stream").starting_hash_keys == [
+        0,
+        2**127,
+    ]
+
+
+def test_sharded_producer_sends_each_shard_from_its_own_lane(kinesis_client):
+    lanes = set()
+
+    def put_records(StreamName, Records):
+        lanes.add(threading.current_thread().name)
+        return ok_response(Records)
+
+    kinesis_client.put_records.side_effect = put_records
+    shard_map = ShardMap.even(3)
+    producer = ShardedProducer(kinesis_client, "test-stream", shard_map=shard_map)
+    for i in range(300):
+        producer.put(b"x", str(i))
+    close_with_timeout(producer)
+
+    batches = [c.kwargs["Records"] for c in kinesis_client.put_records.call_args_list]
+    assert sum(len(batch) for batch in batches) == 300
+    for batch in batches:
+        shards = {shard_map.shard_index(r["PartitionKey"]) for r in batch}
+        assert len(shards) == 1
+    assert lanes == {"kinesis-lane-0", "kinesis-lane-1", "kinesis-lane-2"}
+
+
+def close_with_timeout(producer, timeout_s=5):
+    """Close the producer, failing instead of hanging if a lane never stops."""
+    errors = []
+
+    def close():
+        try:
+            producer.close()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=close, daemon=True)
+    thread.start()
+    thread.join(timeout=timeout_s)
+    assert not thread.is_alive(), "ShardedProducer.close() did not return"
+    if errors:
+        raise errors[0]
+
+
+@patch("aws_dataflow_simulator.dataflow.producer.time.sleep")
+def test_sharded_producer_raises_lane_errors(_, kinesis_client):
+    kinesis_client.put_records.side_effect = RuntimeError("boom")
+    producer = ShardedProducer(
+        kinesis_client, "test-stream", shard_map=ShardMap.even(2)
+    )
+    producer.put(b"x", "key")
+    with pytest.raises(RuntimeError, match="boom"):
+        close_with_timeout(producer)
+
+
+def test_sharded_producer_stops_when_final_flush_fails(kinesis_client):
+    kinesis_client.put_records.side_effect = RuntimeError("boom")
+    # a long linger means the only flush is the one triggered by close()
+    producer = ShardedProducer(
+        kinesis_client, "test-stream", shard_map=ShardMap.even(2), linger_ms=60_000
+    )
+    producer.put(b"x", "key")
+    with pytest.raises(RuntimeError, match="boom"):
+        close_with_timeout(producer)
+
+
+def test_sharded_producer_sends_single_records_without_batching(kinesis_client):
+    producer = ShardedProducer(
+        kinesis_client, "test-stream", shard_map=ShardMap.even(2), batch=False
+    )
+    for i in range(10):
+        producer.put(b"x", str(i))
+    close_with_timeout(producer)
+
+    assert kinesis_client.put_record.call_count == 10
+    kinesis_client.put_records.assert_not_called()
+
+
+def test_sharded_producer_drain_waits_until_records_are_sent(kinesis_client):
+    release = threading.Event()
+
+    def put_records(StreamName, Records):
+        release.wait(timeout=5)
+        return ok_response(Records)
+
+    kinesis_client.put_records.side_effect = put_records
+    producer = ShardedProducer(
+        kinesis_client, "test-stream", shard_map=ShardMap.even(2), linger_ms=60_000
+    )
+    for i in range(10):
+        producer.put(b"x", str(i))
+
+    drained = threading.Thread(target=producer.drain, daemon=True)
+    drained.start()
+    drained.join(timeout=0.2)
+    assert drained.is_alive()
+
+    release.set()
+    drained.join(timeout=5)
+    assert not drained.is_alive()
+    sent = sum(
+        len(c.kwargs["Records"]) for c in kinesis_client.put_records.call_args_list
+    )
+    assert sent == 10
+    close_with_timeout(producer)
+
+
+def test_aggregating_sender_packs_the_events_of_each_shard(kinesis_client):
+    shard_map = ShardMap.even(2)
+    producer = KinesisBatchProducer(kinesis_client, "test-stream")
+    sender = AggregatingSender(producer, shard_map, max_bytes=1000)
+    events = [(f"event-{i}".encode() * 10, str(i)) for i in range(50)]
+    for data, partition_key in events:
+        sender.put(data, partition_key)
+    sender.close()
+
+    records = [
+        record
+        for c in kinesis_client.put_records.call_args_list
+        for record in c.kwargs["Records"]
+    ]
+    assert all(len(record["Data"]) <= 1000 for record in records)
+    assert len(records) < len(events) / 5
+    user_records = []
+    for record in records:
+        unpacked = deaggregate(record["Data"])
+        # the aggregate is sent to the shard of all its events
+        shards = {shard_map.shard_index(key) for key, _, _ in unpacked}
+        assert shards == {shard_map.shard_index(record["PartitionKey"])}
+        user_records.extend((data, key) for key, _, data in unpacked)
+    assert sorted(user_records) == sorted(events)
+
+
+def test_aggregating_sender_sends_large_events_as_plain_records(kinesis_client):
+    producer = KinesisBatchProducer(kinesis_client, "test-stream")
+    sender = AggregatingSender(producer, ShardMap.even(1), max_bytes=100)
+    sender.put(b"small", "a")
+    sender.put(b"x" * 200, "b")
+    sender.flush()
+
+    records = kinesis_client.put_records.call_args.kwargs["Records"]
+    assert deaggregate(records[0]["Data"]) == [("a", None, b"small")]
+    assert records[1] == {"Data": b"x" * 200, "PartitionKey": "b"}
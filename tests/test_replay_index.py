@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aws_dataflow_simulator.dataflow.checkpoint import ReplayPosition
+from aws_dataflow_simulator.dataflow.partition import worker_of
+from aws_dataflow_simulator.dataflow.replay_index import (
+    ReplayIndex,
+    build_replay_index,
+    dataset_etag,
+    index_path,
+    write_replay_index,
+)
+
+CSV_BODY = (
+    b"id,value,time_till_next_event_ms\n"
+    b"a,1,100\n"
+    b"b,2,0.5\n"
+    b"c,3,250\n"
+    b"d,4,0\n"
+)
+
+
+@pytest.fixture
+def csv_dataset(tmp_path):
+    path = tmp_path / "dataset_processed.csv"
+    path.write_bytes(CSV_BODY)
+    return str(path)
+
+
+def test_build_csv_index(csv_dataset):
+    index = build_replay_index(csv_dataset, chunksize=3)
+
+    assert len(index) == 4
+    assert index.size == len(CSV_BODY)
+    assert index.entries["byte_offset"].tolist() == [
+        CSV_BODY.index(row) for row in (b"a,1", b"b,2", b"c,3", b"d,4")
+    ] + [len(CSV_BODY)]
+    assert index.entries["offset_ms"].tolist() == [0, 100, 100.5, 350.5, 350.5]
+    assert [int(key_hash) % 3 for key_hash in index.entries["key_hash"][:-1]] == [
+        worker_of(key, 3) for key in "abcd"
+    ]
+
+
+def test_build_index_without_trailing_newline(tmp_path):
+    path = tmp_path / "dataset_processed.csv"
+    path.write_bytes(CSV_BODY.rstrip(b"\n"))
+
+    index = build_replay_index(str(path))
+
+    assert len(index) == 4
+    assert index.position(3).byte_offset == CSV_BODY.index(b"d,4")
+
+
+def test_build_index_rejects_multiline_values(tmp_path):
+    path = tmp_path / "dataset_processed.csv"
+    path.write_bytes(b'id,value\na,"two\nlines"\n')
+
+    with pytest.raises(ValueError):
+        build_replay_index(str(path))
+
+
+def test_build_parquet_index(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "dataset_processed.parquet"
+    pd.DataFrame(
+        {"id": [1, 2, 3], "time_till_next_event_ms": [10.0, 20.0, 0.0]}
+    ).to_parquet(path, index=False)
+
+    index = build_replay_index(str(path))
+
+    assert index.size == 0
+    assert index.entries["offset_ms"].tolist() == [0, 10, 30, 30]
+    assert index.worker_rows(worker_of("2", 2), 2).tolist() == [
+        row for row, key in enumerate("123") if worker_of(key, 2) == worker_of("2", 2)
+    ]
+
+
+def test_seek_binary_searches_the_timeline(csv_dataset):
+    index = build_replay_index(csv_dataset)
+
+    assert index.seek(0) == ReplayPosition(0, CSV_BODY.index(b"a,1"), 0)
+    assert index.seek(100.2) == ReplayPosition(2, CSV_BODY.index(b"c,3"), 100.5)
+    assert index.seek(1e9) == ReplayPosition(4, len(CSV_BODY), 350.5)
+
+
+def test_saved_index_is_memory_mapped(csv_dataset):
+    path = write_replay_index(csv_dataset)
+
+    index = ReplayIndex.load(path)
+
+    assert path == index_path(csv_dataset)
+    assert isinstance(index.entries, np.memmap)
+    assert index.seek(100.2).row == 2
+
+
+def test_load_rejects_other_arrays(tmp_path):
+    path = tmp_path / "other.npy"
+    np.save(path, np.arange(3))
+
+    with pytest.raises(ValueError):
+        ReplayIndex.load(str(path))
+
+
+def test_index_matches_only_its_dataset_version(csv_dataset, tmp_path):
+    index = build_replay_index(csv_dataset)
+    # prepared again with other delays of the same width
+    other = tmp_path / "other.csv"
+    other.write_bytes(CSV_BODY.replace(b"250", b"750"))
+
+    assert index.matches(dataset_etag(csv_dataset))
+    assert index.matches(f'"{dataset_etag(csv_dataset)}"')
+    assert not index.matches(dataset_etag(str(other)))
+
+
+def test_dataset_etag_of_a_multipart_upload(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.dataflow.replay_index.DEFAULT_PART_SIZE", 8
+    )
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.dataflow.replay_index.get_part_size",
+        lambda size: 8,
+    )
+    path = tmp_path / "dataset_processed.csv"
+    path.write_bytes(CSV_BODY)
+
+    assert dataset_etag(str(path)).endswith(f"-{-(-len(CSV_BODY) // 8)}")
@@ -0,0 +1,68 @@
+import pytest
+
+from aws_dataflow_simulator.dataflow.scheduler import EventScheduler
+
+
+@pytest.fixture
+def clock(make_clock):
+    return make_clock(now=100.0)
+
+
+def test_sleeps_until_absolute_target(clock):
+    scheduler = EventScheduler(clock=clock, sleep=clock.sleep)
+    scheduler.start()
+
+    # time spent sending is absorbed by the next sleep instead of adding up
+    for offset_ms in (0, 250, 500.5):
+        assert scheduler.admit(offset_ms)
+        clock.now += 0.05
+
+    assert clock.now == pytest.approx(100.5505)
+    assert scheduler.late_events == 0
+
+
+def test_speed_compresses_timeline(clock):
+    scheduler = EventScheduler(speed=10, clock=clock, sleep=clock.sleep)
+    scheduler.start()
+    scheduler.admit(10_000)
+    assert clock.now == pytest.approx(101.0)
+
+
+def test_catchup_sends_late_events(clock):
+    scheduler = EventScheduler(clock=clock, sleep=clock.sleep)
+    scheduler.start()
+    clock.now += 5
+
+    assert scheduler.admit(1000)
+    assert scheduler.lag_ms == pytest.approx(4000)
+    assert scheduler.late_events == 1
+    assert scheduler.shed_events == 0
+
+
+def test_shed_drops_events_beyond_max_lag(clock):
+    scheduler = EventScheduler(
+        lag_policy="shed", max_lag_ms=500, clock=clock, sleep=clock.sleep
+    )
+    scheduler.start()
+    clock.now += 1
+
+    assert not scheduler.admit(0)
+    assert scheduler.admit(600)
+    assert scheduler.shed_events == 1
+
+
+def test_rejects_invalid_arguments():
+    with pytest.raises(ValueError):
+        EventScheduler(speed=0)
+    with pytest.raises(ValueError):
+        EventScheduler(lag_policy="skip")
+
+
+def test_start_from_offset_resumes_the_timeline(clock):
+    scheduler = EventScheduler(speed=2, clock=clock, sleep=clock.sleep)
+    scheduler.start(offset_ms=10_000)
+
+    # the resumed offset is due now, later offsets keep their spacing
+    assert scheduler.time_until_ms(10_000) == pytest.approx(0.0)
+    scheduler.admit(12_000)
+    assert clock.now == pytest.approx(101.0)
@@ -0,0 +1,97 @@
+import json
+
+import pandas as pd
+import pytest
+
+from aws_dataflow_simulator.dataflow import serialization
+from aws_dataflow_simulator.dataflow.serialization import (
+    get_json_encoder,
+    iter_row_batches,
+    serialize_frame,
+    serialize_rows,
+)
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(serialization, "orjson", None)
+    return get_json_encoder()
+
+
+def test_serialize_rows_precomputes_keys_and_delays(encoder):
+    rows = [
+        {"id": "a", "value": "1", "time_till_next_event_ms": "100.5"},
+        {"id": "b", "value": "2", "time_till_next_event_ms": ""},
+        {"id": "c", "value": "3"},
+    ]
+    batch = serialize_rows(rows, encoder)
+
+    assert batch.partition_keys == ["a", "b", "c"]
+    assert batch.delays_ms == [100.5, 0.0, 0.0]
+    assert all(isinstance(payload, bytes) for payload in batch.payloads)
+    assert json.loads(batch.payloads[0]) == {"id": "a", "value": "1"}
+    assert len(batch) == 3
+
+
+def test_encoder_falls_back_to_str(encoder):
+    timestamp = pd.Timestamp("2024-01-01 12:00:00")
+    assert json.loads(encoder({"ts": timestamp})) == {"ts": "2024-01-01 12:00:00"}
+
+
+def test_serialize_frame_matches_serialize_rows():
+    df = pd.DataFrame(
+        {
+            "id": [1, 2],
+            "name": ["a\nb", "ü"],
+            "tx_datetime": pd.to_datetime(
+                ["2024-01-01 00:00:00", "2024-01-01 00:00:01"]
+            ),
+            "time_till_next_event_ms": [1000.0, 0.0],
+        }
+    )
+    batch = serialize_frame(df)
+
+    assert batch.partition_keys == ["1", "2"]
+    assert batch.delays_ms == [1000.0, 0.0]
+    assert [json.loads(payload) for payload in batch.payloads] == [
+        {"id": 1, "name": "a\nb", "tx_datetime": "2024-01-01 00:00:00"},
+        {"id": 2, "name": "ü", "tx_datetime": "2024-01-01 00:00:01"},
+    ]
+    assert list(batch)[1][1:] == ("2", 0.0)
+
+
+@pytest.mark.parametrize("value", ["0.123456789012345", "1234.5678901234567"])
+def test_serialize_frame_keeps_float_precision(encoder, value):
+    row = serialize_rows([{"id": "a", "amount": value}], encoder).payloads[0]
+    frame = serialize_frame(pd.DataFrame({"id": ["a"], "amount": [float(value)]}))
+
+    assert json.loads(frame.payloads[0])["amount"] == float(json.loads(row)["amount"])
+
+
+def test_serialize_frame_keeps_midnight_times():
+    df = pd.DataFrame({"id": [1], "tx_datetime": pd.to_datetime(["2024-01-01"])})
+    assert json.loads(serialize_frame(df).payloads[0])["tx_datetime"] == (
+        "2024-01-01 00:00:00"
+    )
+
+
+def test_iter_row_batches():
+    assert [len(batch) for batch in iter_row_batches(iter(range(7)), 3)] == [3, 3, 1]
+
+
+def test_serialize_with_a_key_column():
+    rows = [{"id": "a", "user": "u1"}, {"id": "b", "user": "u2"}]
+
+    assert serialize_rows(
+        [dict(row) for row in rows], key_column="user"
+    ).partition_keys == [
+        "u1",
+        "u2",
+    ]
+    assert serialize_frame(pd.DataFrame(rows), key_column="user").partition_keys == [
+        "u1",
+        "u2",
+    ]
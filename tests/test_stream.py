@@ -0,0 +1,547 @@
+import json
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from aws_dataflow_simulator.dataflow.checkpoint import ReplayCheckpoint, ReplayPosition
+from aws_dataflow_simulator.dataflow.partition import worker_of
+from aws_dataflow_simulator.dataflow.replay_index import index_path, write_replay_index
+from aws_dataflow_simulator.dataflow.producer import AggregatingSender, ShardMap
+from aws_dataflow_simulator.dataflow.scheduler import EventScheduler
+from aws_dataflow_simulator.dataflow.stream import CSVtoStream
+
+BUCKET = "test-bucket"
+DATASET = "data/test_processed.csv"
+CSV_BODY = (
+    b"id,value,time_till_next_event_ms\n"
+    b"a,1,100\n"
+    b"b,2,0.5\n"
+    b"c,3,250\n"
+    b"d,4,0\n"
+)
+
+
+@pytest.fixture
+def csv_to_stream(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("KINESIS_STREAM_NAME", "test-stream")
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.config.get_metrics_prometheus_port", lambda: None
+    )
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.config.get_s3_bucket_name", lambda: BUCKET
+    )
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.config.get_dataset_filepath",
+        lambda processed=True: DATASET,
+    )
+    with mock_aws():
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(Bucket=BUCKET)
+        s3_client.put_object(Bucket=BUCKET, Key=DATASET, Body=CSV_BODY)
+        yield CSVtoStream()
+
+
+def test_load_dataset_streams_all_lines(csv_to_stream):
+    assert "".join(csv_to_stream.load_dataset()) == CSV_BODY.decode()
+
+
+def test_load_dataset_from_byte_offset_keeps_header(csv_to_stream):
+    offset = CSV_BODY.index(b"c,3")
+    assert list(csv_to_stream.load_dataset(start_byte=offset)) == [
+        "id,value,time_till_next_event_ms\n",
+        "c,3,250\n",
+        "d,4,0\n",
+    ]
+
+
+@pytest.fixture
+def run_stream(monkeypatch, make_clock, make_sender):
+    """Replay a stream on a fresh fake clock into a RecordingSender."""
+
+    def run(csv_to_stream, put_duration_s=0.0, **scheduler_kwargs):
+        clock = make_clock()
+        sender = make_sender(clock, put_duration_s)
+        monkeypatch.setattr(csv_to_stream, "get_sender", lambda: sender)
+        monkeypatch.setattr(
+            csv_to_stream,
+            "get_scheduler",
+            lambda: EventScheduler(
+                speed=csv_to_stream.speed,
+                clock=clock,
+                sleep=clock.sleep,
+                **scheduler_kwargs,
+            ),
+        )
+        csv_to_stream.start_stream()
+        assert sender.closed
+        return sender
+
+    return run
+
+
+def test_start_stream_sends_events_at_cumulative_offsets(csv_to_stream, run_stream):
+    csv_to_stream.batch_mode = False
+    sender = run_stream(csv_to_stream)
+
+    assert sender.events == [
+        (0.0, {"id": "a", "value": "1"}),
+        (100.0, {"id": "b", "value": "2"}),
+        (100.5, {"id": "c", "value": "3"}),
+        (350.5, {"id": "d", "value": "4"}),
+    ]
+    assert sender.flushes == []
+    counters = csv_to_stream.metrics.snapshot()["counters"]
+    assert counters["events_sent"] == 4
+    assert counters["bytes_sent"] == sum(
+        len(json.dumps(event, separators=(",", ":"))) for _, event in sender.events
+    )
+
+
+def test_start_stream_speed_compresses_offsets(csv_to_stream, run_stream):
+    csv_to_stream.batch_mode = False
+    csv_to_stream.speed = 10
+    sender = run_stream(csv_to_stream)
+
+    assert [t for t, _ in sender.events] == [0.0, 10.0, 10.05, 35.05]
+
+
+def test_start_stream_flushes_batches_after_linger(csv_to_stream, run_stream):
+    csv_to_stream.batch_mode = True
+    csv_to_stream.batch_linger_ms = 100
+    sender = run_stream(csv_to_stream)
+
+    assert [t for t, _ in sender.events] == [0.0, 100.0, 100.5, 350.5]
+    # each flush happens batch_linger_ms after the oldest pending event
+    assert sender.flushes == [100.0, 200.0]
+
+
+def test_start_stream_flushes_aggregated_records_after_linger(
+    csv_to_stream, run_stream
+):
+    csv_to_stream.batch_mode = False
+    csv_to_stream.aggregate = True
+    csv_to_stream.batch_linger_ms = 100
+    sender = run_stream(csv_to_stream)
+
+    assert sender.flushes == [100.0, 200.0]
+
+
+def test_get_sender_aggregates_in_front_of_the_kinesis_sender(
+    csv_to_stream, monkeypatch
+):
+    monkeypatch.setattr(csv_to_stream, "get_shard_map", lambda: ShardMap.even(1))
+    csv_to_stream.aggregate = True
+
+    sender = csv_to_stream.get_sender()
+
+    assert isinstance(sender, AggregatingSender)
+    assert sender.rate_limiter is not None
+
+
+def test_start_stream_linger_scales_with_speed(csv_to_stream, run_stream):
+    csv_to_stream.batch_mode = True
+    csv_to_stream.batch_linger_ms = 100
+    csv_to_stream.speed = 2
+    sender = run_stream(csv_to_stream)
+
+    # 100 ms of wall-clock linger covers 200 ms of dataset timeline at 2x
+    assert [t for t, _ in sender.events] == [0.0, 50.0, 50.25, 175.25]
+    assert sender.flushes == [100.0]
+
+
+def test_start_stream_sheds_late_events(csv_to_stream, run_stream):
+    csv_to_stream.batch_mode = False
+    sender = run_stream(
+        csv_to_stream,
+        put_duration_s=0.3,
+        lag_policy="shed",
+        max_lag_ms=50,
+    )
+
+    assert [event["id"] for _, event in sender.events] == ["a", "d"]
+    assert csv_to_stream.metrics.counters["events_shed"].value == 2
+
+
+def test_start_stream_reads_parquet_dataset(csv_to_stream, tmp_path, run_stream):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "test_processed.parquet"
+    pd.DataFrame(
+        {
+            "id": [1, 2],
+            "tx_datetime": pd.to_datetime(
+                ["2024-01-01 00:00:00", "2024-01-01 00:00:01"]
+            ),
+            "time_till_next_event_ms": [1000.0, 0.0],
+        }
+    ).to_parquet(path, index=False)
+    boto3.client("s3").upload_file(str(path), BUCKET, "data/test_processed.parquet")
+    csv_to_stream.dataset_filepath = "data/test_processed.parquet"
+    csv_to_stream.batch_mode = False
+
+    sender = run_stream(csv_to_stream)
+
+    assert sender.events == [
+        (0.0, {"id": 1, "tx_datetime": "2024-01-01 00:00:00"}),
+        (1000.0, {"id": 2, "tx_datetime": "2024-01-01 00:00:01"}),
+    ]
+
+
+def test_get_sender_shares_a_rate_limiter_sized_from_the_stream(
+    csv_to_stream, monkeypatch
+):
+    kinesis_client = MagicMock()
+    kinesis_client.list_shards.side_effect = RuntimeError("AccessDenied")
+    kinesis_client.describe_stream_summary.return_value = {
+        "StreamDescriptionSummary": {"OpenShardCount": 3}
+    }
+    monkeypatch.setattr(csv_to_stream, "_kinesis_client", kinesis_client)
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.dataflow.stream.get_client",
+        lambda service_name, **kwargs: kinesis_client,
+    )
+
+    sender = csv_to_stream.get_sender()
+    try:
+        rate_limiters = {id(producer.rate_limiter) for producer in sender._producers}
+        assert len(rate_limiters) == 1
+        assert len(sender._producers[0].rate_limiter.buckets) == 3
+    finally:
+        sender.close()
+
+
+def test_get_sender_without_rate_limit(csv_to_stream, monkeypatch):
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.config.get_stream_rate_limit", lambda: False
+    )
+    monkeypatch.setattr(csv_to_stream, "get_shard_map", lambda: ShardMap.even(1))
+    assert csv_to_stream.get_sender().rate_limiter is None
+
+
+def test_iter_event_batches_tracks_the_position_after_each_batch(csv_to_stream):
+    csv_to_stream.serialize_batch_size = 3
+
+    positions = [position for _, position in csv_to_stream.iter_event_batches()]
+
+    assert positions == [
+        ReplayPosition(row=3, byte_offset=CSV_BODY.index(b"d,4")),
+        ReplayPosition(row=4, byte_offset=len(CSV_BODY)),
+    ]
+
+
+def test_iter_event_batches_resumes_parquet_from_a_row(csv_to_stream, tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "test_processed.parquet"
+    pd.DataFrame({"id": range(10)}).to_parquet(path, index=False, row_group_size=4)
+    boto3.client("s3").upload_file(str(path), BUCKET, "data/test_processed.parquet")
+    csv_to_stream.dataset_filepath = "data/test_processed.parquet"
+
+    batches = list(csv_to_stream.iter_event_batches(ReplayPosition(row=5)))
+
+    assert [json.loads(p)["id"] for b, _ in batches for p in b.payloads] == [
+        5,
+        6,
+        7,
+        8,
+        9,
+    ]
+    assert batches[-1][1] == ReplayPosition(row=10)
+
+
+def test_start_stream_checkpoints_after_draining_the_sender(
+    csv_to_stream, monkeypatch, tmp_path, run_stream
+):
+    checkpoint_path = tmp_path / "replay.json"
+    csv_to_stream.batch_mode = False
+    csv_to_stream.serialize_batch_size = 2
+    csv_to_stream.checkpoint_path = str(checkpoint_path)
+    csv_to_stream.checkpoint_interval_s = 0
+    saved = []
+    monkeypatch.setattr(
+        ReplayCheckpoint, "save", lambda self, position: saved.append(position)
+    )
+
+    sender = run_stream(csv_to_stream)
+
+    assert sender.drains == [2, 4]
+    assert saved == [
+        ReplayPosition(2, CSV_BODY.index(b"c,3"), 100.5),
+        ReplayPosition(4, len(CSV_BODY), 350.5),
+        ReplayPosition(4, len(CSV_BODY), 350.5, finished=True),
+    ]
+
+
+def test_start_stream_resumes_from_checkpoint(
+    csv_to_stream, monkeypatch, tmp_path, run_stream
+):
+    checkpoint_path = tmp_path / "replay.json"
+    csv_to_stream.batch_mode = False
+    csv_to_stream.checkpoint_path = str(checkpoint_path)
+    csv_to_stream.get_checkpoint().save(
+        ReplayPosition(row=2, byte_offset=CSV_BODY.index(b"c,3"), offset_ms=100.5)
+    )
+
+    sender = run_stream(csv_to_stream)
+
+    # the timeline continues at the saved offset instead of starting over
+    assert sender.events == [
+        (0.0, {"id": "c", "value": "3"}),
+        (250.0, {"id": "d", "value": "4"}),
+    ]
+    assert json.loads(checkpoint_path.read_text())["position"]["finished"]
+
+    # a finished replay is not sent again, unless resuming is turned off
+    monkeypatch.setattr(
+        csv_to_stream, "get_sender", lambda: pytest.fail("replayed a finished run")
+    )
+    csv_to_stream.start_stream()
+    csv_to_stream.resume = False
+    assert len(run_stream(csv_to_stream).events) == 4
+
+
+def test_start_stream_resumes_from_a_checkpoint_at_the_dataset_end(
+    csv_to_stream, tmp_path, run_stream
+):
+    checkpoint_path = tmp_path / "replay.json"
+    csv_to_stream.checkpoint_path = str(checkpoint_path)
+    # saved after the last row, before the replay was marked finished
+    csv_to_stream.get_checkpoint().save(
+        ReplayPosition(row=4, byte_offset=len(CSV_BODY), offset_ms=350.5)
+    )
+
+    assert run_stream(csv_to_stream).events == []
+    assert json.loads(checkpoint_path.read_text())["position"]["finished"]
+
+
+TIMESTAMPED_BODY = (
+    b"id,tx_datetime,time_till_next_event_ms\n"
+    b"a,2024-01-01 00:00:00,1000\n"
+    b"b,2024-01-01 00:00:01,500\n"
+    b"c,2024-01-01 00:00:01.500,2000\n"
+    b"d,2024-01-01 00:00:03.500,0\n"
+)
+
+
+def make_worker(monkeypatch, worker_index, workers=2, **kwargs):
+    # every worker starts at the beginning of the shared timeline
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.dataflow.stream.shared_clock_offset_ms",
+        lambda start_at, speed: 0.0,
+    )
+    csv_to_stream = CSVtoStream(
+        workers=workers, worker_index=worker_index, start_at=0, **kwargs
+    )
+    csv_to_stream.batch_mode = False
+    return csv_to_stream
+
+
+def test_partition_by_key_splits_events_on_one_timeline(
+    csv_to_stream, monkeypatch, run_stream
+):
+    csv_to_stream.batch_mode = False
+    single = run_stream(csv_to_stream).events
+
+    events = [
+        run_stream(make_worker(monkeypatch, i, partition_by="key")).events
+        for i in range(2)
+    ]
+
+    for worker_index, worker_events in enumerate(events):
+        assert all(worker_of(e["id"], 2) == worker_index for _, e in worker_events)
+    # disjoint, complete and every event at its single replay offset
+    assert sorted(events[0] + events[1], key=lambda e: e[0]) == single
+
+
+def test_partition_by_range_replays_contiguous_slices(
+    csv_to_stream, monkeypatch, run_stream
+):
+    boto3.client("s3").put_object(Bucket=BUCKET, Key=DATASET, Body=TIMESTAMPED_BODY)
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.config.get_colname_dt", lambda: "tx_datetime"
+    )
+
+    workers = [make_worker(monkeypatch, i, partition_by="range") for i in range(2)]
+    slices = [worker.get_slice() for worker in workers]
+    events = [run_stream(worker).events for worker in workers]
+
+    # the byte ranges are split at the first line boundary after the midpoint
+    assert slices == [
+        (
+            ReplayPosition(byte_offset=TIMESTAMPED_BODY.index(b"a,")),
+            len(TIMESTAMPED_BODY) // 2,
+        ),
+        (
+            ReplayPosition(byte_offset=TIMESTAMPED_BODY.index(b"c,"), offset_ms=1500),
+            len(TIMESTAMPED_BODY),
+        ),
+    ]
+    assert [[(t, e["id"]) for t, e in w] for w in events] == [
+        [(0.0, "a"), (1000.0, "b")],
+        [(1500.0, "c"), (3500.0, "d")],
+    ]
+
+
+def test_partition_by_range_with_more_workers_than_lines(
+    csv_to_stream, monkeypatch, run_stream
+):
+    boto3.client("s3").put_object(Bucket=BUCKET, Key=DATASET, Body=TIMESTAMPED_BODY)
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.config.get_colname_dt", lambda: "tx_datetime"
+    )
+    workers = [
+        make_worker(monkeypatch, i, workers=10, partition_by="range") for i in range(10)
+    ]
+
+    slices = [worker.get_slice() for worker in workers]
+    events = [run_stream(worker).events for worker in workers]
+
+    # the last slice starts at the end of the dataset and reads nothing
+    assert slices[-1] == (
+        ReplayPosition(byte_offset=len(TIMESTAMPED_BODY)),
+        len(TIMESTAMPED_BODY),
+    )
+    assert [e["id"] for worker_events in events for _, e in worker_events] == list(
+        "abcd"
+    )
+
+
+def test_partitioned_workers_need_a_shared_start(csv_to_stream):
+    with pytest.raises(ValueError):
+        CSVtoStream(workers=2, worker_index=0)
+    with pytest.raises(ValueError):
+        CSVtoStream(workers=2, worker_index=2, start_at=0)
+
+
+def test_partitioned_workers_checkpoint_separately(csv_to_stream):
+    csv_to_stream = CSVtoStream(
+        workers=3, worker_index=1, start_at=0, checkpoint_path="s3://b/replay.json"
+    )
+    assert csv_to_stream.checkpoint_path == "s3://b/replay.worker-1-of-3.json"
+
+
+def upload_indexed_dataset(monkeypatch, tmp_path, body):
+    path = tmp_path / "test_processed.csv"
+    path.write_bytes(body)
+    s3_client = boto3.client("s3")
+    s3_client.put_object(Bucket=BUCKET, Key=DATASET, Body=body)
+    s3_client.upload_file(write_replay_index(str(path)), BUCKET, index_path(DATASET))
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.config.get_colname_dt", lambda: "tx_datetime"
+    )
+
+
+def test_start_from_seeks_with_the_replay_index(
+    csv_to_stream, monkeypatch, tmp_path, run_stream
+):
+    upload_indexed_dataset(monkeypatch, tmp_path, TIMESTAMPED_BODY)
+    csv_to_stream.batch_mode = False
+    csv_to_stream.start_from = "2024-01-01 00:00:01.200"
+
+    assert csv_to_stream.get_slice() == (
+        ReplayPosition(2, TIMESTAMPED_BODY.index(b"c,"), 1500),
+        None,
+    )
+    sender = run_stream(csv_to_stream)
+
+    assert [(t, e["id"]) for t, e in sender.events] == [(0.0, "c"), (2000.0, "d")]
+
+
+def test_start_from_past_the_last_event(
+    csv_to_stream, monkeypatch, tmp_path, run_stream
+):
+    upload_indexed_dataset(monkeypatch, tmp_path, TIMESTAMPED_BODY)
+    csv_to_stream.start_from = "2024-01-02 00:00:00"
+
+    assert csv_to_stream.get_slice() == (
+        ReplayPosition(4, len(TIMESTAMPED_BODY), 3500),
+        len(TIMESTAMPED_BODY),
+    )
+    assert run_stream(csv_to_stream).events == []
+
+
+def test_replay_index_of_another_dataset_version_is_ignored(
+    csv_to_stream, monkeypatch, tmp_path
+):
+    upload_indexed_dataset(monkeypatch, tmp_path, TIMESTAMPED_BODY)
+    assert csv_to_stream.get_replay_index() is not None
+
+    # prepared again with delays of the same width, so the size is unchanged
+    boto3.client("s3").put_object(
+        Bucket=BUCKET, Key=DATASET, Body=TIMESTAMPED_BODY.replace(b",500", b",900")
+    )
+
+    assert csv_to_stream.get_replay_index() is None
+
+
+def test_start_from_without_replay_index_is_rejected(csv_to_stream):
+    csv_to_stream.start_from = "2024-01-01 00:00:01"
+
+    with pytest.raises(ValueError):
+        csv_to_stream.get_slice()
+
+
+def test_partition_by_range_splits_rows_with_the_replay_index(
+    csv_to_stream, monkeypatch, tmp_path
+):
+    upload_indexed_dataset(monkeypatch, tmp_path, TIMESTAMPED_BODY)
+    workers = [make_worker(monkeypatch, i, partition_by="range") for i in range(2)]
+
+    assert [worker.get_slice() for worker in workers] == [
+        (
+            ReplayPosition(0, TIMESTAMPED_BODY.index(b"a,")),
+            TIMESTAMPED_BODY.index(b"c,"),
+        ),
+        (ReplayPosition(2, TIMESTAMPED_BODY.index(b"c,"), 1500), None),
+    ]
+
+
+def test_local_source_memory_maps_the_dataset(csv_to_stream, tmp_path, run_stream):
+    path = tmp_path / "test_processed.csv"
+    path.write_bytes(CSV_BODY)
+    csv_to_stream.source = "local"
+    csv_to_stream.dataset_filepath = str(path)
+    csv_to_stream.batch_mode = False
+    csv_to_stream.checkpoint_path = str(tmp_path / "replay.json")
+    # the bucket is not read
+    boto3.client("s3").delete_object(Bucket=BUCKET, Key=DATASET)
+
+    sender = run_stream(csv_to_stream)
+
+    assert [(t, e["id"]) for t, e in sender.events] == [
+        (0.0, "a"),
+        (100.0, "b"),
+        (100.5, "c"),
+        (350.5, "d"),
+    ]
+    assert list(csv_to_stream.load_dataset(start_byte=CSV_BODY.index(b"d,4"))) == [
+        "id,value,time_till_next_event_ms\n",
+        "d,4,0\n",
+    ]
+    assert csv_to_stream.get_checkpoint().load().finished
+
+
+def test_amplify_sends_every_row_as_several_events(csv_to_stream, run_stream):
+    csv_to_stream.batch_mode = False
+    csv_to_stream.amplify = 3
+    csv_to_stream.serialize_batch_size = 2
+
+    sender = run_stream(csv_to_stream)
+
+    assert [event["id"] for _, event in sender.events] == [
+        f"{key}#{i}" if i else key for key in "abcd" for i in range(3)
+    ]
+    times = [t for t, _ in sender.events]
+    assert times == sorted(times)
+    # the original events keep their offsets
+    assert times[::3] == [0.0, 100.0, 100.5, 350.5]
+
+
+def test_amplify_is_validated(csv_to_stream):
+    with pytest.raises(ValueError):
+        CSVtoStream(amplify=0)
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aws_dataflow_simulator.dataflow.serialization import DELAY_COLUMN
+from aws_dataflow_simulator.dataflow.synthesize import (
+    iter_shard_chunks,
+    learn_schema,
+    load_schema,
+    save_schema,
+    synthesize_dataset,
+    validate_schema,
+)
+
+
+@pytest.fixture
+def source_csv(tmp_path):
+    rng = np.random.default_rng(1)
+    rows = 2000
+    df = pd.DataFrame(
+        {
+            "ID": np.char.add("cust_", rng.integers(0, 5000, rows).astype(str)),
+            "Tx_Datetime": pd.Timestamp("2024-08-19 15:00:00")
+            + pd.to_timedelta(rng.exponential(20, rows).cumsum(), unit="ms"),
+            "Category": rng.choice(["a", "b", "c"], rows, p=[0.6, 0.3, 0.1]),
+            "Amount": rng.lognormal(3, 1, rows).round(2),
+            "Items": rng.integers(1, 100, rows),
+            "Is_Fraud": rng.choice([0, 1], rows, p=[0.95, 0.05]),
+            "Note": np.where(rng.random(rows) < 0.25, None, "x"),
+        }
+    )
+    path = tmp_path / "dataset.csv"
+    df.to_csv(path, index=False)
+    return path
+
+
+def column(schema, name):
+    return next(col for col in schema["columns"] if col["name"] == name)
+
+
+def test_learn_schema(source_csv):
+    schema = learn_schema(str(source_csv), timestamp_column_name="tx_datetime")
+
+    assert [col["kind"] for col in schema["columns"]] == [
+        "key",
+        "timestamp",
+        "category",
+        "float",
+        "int",
+        "category",
+        "category",
+    ]
+    assert column(schema, "id")["prefix"] == "cust_"
+    assert column(schema, "tx_datetime")["mean_gap_ms"] == pytest.approx(20, rel=0.1)
+    assert column(schema, "category")["values"] == ["a", "b", "c"]
+    assert column(schema, "amount")["decimals"] == 2
+    assert column(schema, "note")["null_fraction"] == pytest.approx(0.25, abs=0.05)
+
+
+def test_learn_schema_requires_the_timestamp_column(source_csv):
+    with pytest.raises(ValueError):
+        learn_schema(str(source_csv), timestamp_column_name="missing")
+
+
+def test_generated_rows_follow_the_schema(source_csv):
+    schema = learn_schema(str(source_csv), timestamp_column_name="tx_datetime")
+
+    df = pd.concat(
+        iter_shard_chunks(
+            schema,
+            rows=20000,
+            shard_offset_ms=0,
+            total_rows=20000,
+            seed=0,
+            shard_index=0,
+            chunksize=3000,
+        ),
+        ignore_index=True,
+    )
+
+    assert len(df) == 20000
+    assert df["id"].str.startswith("cust_").all()
+    assert df["tx_datetime"].is_monotonic_increasing
+    assert df[DELAY_COLUMN].sum() == pytest.approx(20000 * 20, rel=0.1)
+    assert df["category"].value_counts(normalize=True)["a"] == pytest.approx(
+        0.6, abs=0.02
+    )
+    assert df["items"].between(1, 99).all()
+    assert set(df["is_fraud"].unique()) <= {0, 1}
+    assert df["note"].isna().mean() == pytest.approx(0.25, abs=0.02)
+
+
+def test_synthesize_shards_form_one_timeline(source_csv, tmp_path):
+    schema = learn_schema(str(source_csv), timestamp_column_name="tx_datetime")
+    output_dir = tmp_path / "synthetic"
+
+    paths = synthesize_dataset(
+        schema, rows=2500, output_dir=str(output_dir), shard_rows=1000, processes=2
+    )
+
+    assert [path.rsplit("/", 1)[1] for path in paths] == [
+        "part-00000.csv",
+        "part-00001.csv",
+        "part-00002.csv",
+    ]
+    df = pd.concat([pd.read_csv(path) for path in paths], ignore_index=True)
+    assert len(df) == 2500
+    timestamps = pd.to_datetime(df["tx_datetime"])
+    assert timestamps.is_monotonic_increasing
+    # the delays continue across shards
+    offsets_ms = (timestamps - timestamps.iloc[0]).dt.total_seconds() * 1000
+    assert np.allclose(
+        offsets_ms.iloc[1:], df[DELAY_COLUMN].cumsum().iloc[:-1], atol=0.01
+    )
+
+
+def test_synthesize_is_reproducible(source_csv, tmp_path):
+    pytest.importorskip("pyarrow")
+    schema = learn_schema(str(source_csv), timestamp_column_name="tx_datetime")
+
+    frames = [
+        pd.concat(
+            pd.read_parquet(path)
+            for path in synthesize_dataset(
+                schema,
+                rows=300,
+                output_dir=str(tmp_path / str(processes)),
+                output_format="parquet",
+                shard_rows=100,
+                processes=processes,
+                seed=3,
+            )
+        )
+        for processes in (1, 3)
+    ]
+
+    pd.testing.assert_frame_equal(frames[0], frames[1])
+
+
+def test_schema_round_trip(source_csv, tmp_path):
+    schema = learn_schema(str(source_csv), timestamp_column_name="tx_datetime")
+    path = tmp_path / "schema.json"
+
+    save_schema(schema, str(path))
+
+    assert load_schema(str(path)) == schema
+
+
+@pytest.mark.parametrize(
+    "schema",
+    [
+        {},
+        {"columns": [{"name": "x", "kind": "uuid"}]},
+        {"columns": [{"name": "x", "kind": "float"}]},
+        {"columns": [{"name": "x", "kind": "category", "values": [1], "weights": []}]},
+    ],
+)
+def test_validate_schema_rejects_invalid_schemas(schema):
+    with pytest.raises(ValueError):
+        validate_schema(schema)
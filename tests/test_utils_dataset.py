@@ -0,0 +1,328 @@
+import pandas as pd
+import pytest
+
+from aws_dataflow_simulator.utils_dataset import (
+    infer_epoch_unit,
+    infer_timestamp_format,
+    iter_file_lines_mmap,
+    iter_parquet_batches,
+    parse_timestamps,
+    preprocess_dataset,
+    preprocess_dataset_chunked,
+    save_processed_dataset,
+)
+
+START = "2024-08-19 15:00:00"
+
+
+@pytest.fixture
+def unsorted_csv(tmp_path):
+    timestamps = pd.date_range("2024-01-01", periods=50, freq="1500ms")
+    df = pd.DataFrame(
+        {
+            "ID": range(50),
+            "Tx_Datetime": timestamps,
+            "Amount": [i * 1.5 for i in range(50)],
+        }
+    ).sample(frac=1, random_state=7)
+    path = tmp_path / "dataset.csv"
+    df.to_csv(path, index=False)
+    return path
+
+
+def run_chunked(path, tmp_path, **kwargs):
+    output = tmp_path / "processed.csv"
+    rows = preprocess_dataset_chunked(
+        dataset_path=str(path),
+        output_path=str(output),
+        start_datetime=START,
+        tmp_dir=str(tmp_path),
+        **kwargs,
+    )
+    return rows, pd.read_csv(output)
+
+
+def in_memory(path, **kwargs):
+    df = preprocess_dataset(dataset_path=str(path), start_datetime=START, **kwargs)
+    return df.reset_index(drop=True)
+
+
+@pytest.mark.parametrize("chunksize", [1, 7, 50, 1000])
+def test_chunked_matches_in_memory_for_unsorted_input(
+    unsorted_csv, tmp_path, chunksize
+):
+    kwargs = dict(apply_delay=True, delay_ms=None, timestamp_column_name="tx_datetime")
+    rows, chunked = run_chunked(unsorted_csv, tmp_path, chunksize=chunksize, **kwargs)
+
+    assert rows == 50
+    chunked["tx_datetime"] = pd.to_datetime(chunked["tx_datetime"])
+    pd.testing.assert_frame_equal(chunked, in_memory(unsorted_csv, **kwargs))
+    assert chunked["time_till_next_event_ms"].tolist() == [1500.0] * 49 + [0.0]
+
+
+def test_chunked_sorted_input_skips_external_sort(unsorted_csv, tmp_path, monkeypatch):
+    sorted_csv = tmp_path / "sorted.csv"
+    pd.read_csv(unsorted_csv).sort_values("Tx_Datetime").to_csv(sorted_csv, index=False)
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.utils_dataset._write_sorted_runs",
+        lambda *args: pytest.fail("sorted input should not be sorted again"),
+    )
+
+    rows, chunked = run_chunked(
+        sorted_csv,
+        tmp_path,
+        chunksize=6,
+        apply_delay=True,
+        delay_ms=None,
+        timestamp_column_name="tx_datetime",
+    )
+
+    assert rows == 50
+    assert chunked["id"].tolist() == list(range(50))
+
+
+def test_chunked_and_in_memory_write_the_same_csv(unsorted_csv, tmp_path):
+    kwargs = dict(apply_delay=True, delay_ms=None, timestamp_column_name="tx_datetime")
+    run_chunked(unsorted_csv, tmp_path, chunksize=7, **kwargs)
+    in_memory_path = tmp_path / "in_memory.csv"
+    save_processed_dataset(in_memory(unsorted_csv, **kwargs), str(in_memory_path))
+
+    assert (tmp_path / "processed.csv").read_bytes() == in_memory_path.read_bytes()
+
+
+def test_chunked_static_delay(unsorted_csv, tmp_path):
+    rows, chunked = run_chunked(
+        unsorted_csv,
+        tmp_path,
+        chunksize=8,
+        apply_delay=True,
+        delay_ms=250,
+        timestamp_column_name=None,
+    )
+    assert rows == 50
+    assert (chunked["time_till_next_event_ms"] == 250).all()
+    assert list(chunked.columns) == [
+        "id",
+        "tx_datetime",
+        "amount",
+        "time_till_next_event_ms",
+    ]
+
+
+def test_chunked_missing_timestamp_column(unsorted_csv, tmp_path):
+    with pytest.raises(ValueError, match="was not found"):
+        run_chunked(
+            unsorted_csv,
+            tmp_path,
+            apply_delay=True,
+            delay_ms=None,
+            timestamp_column_name="created_at",
+        )
+
+
+def test_save_processed_dataset_as_parquet_keeps_types(unsorted_csv, tmp_path):
+    pytest.importorskip("pyarrow")
+    df = in_memory(
+        unsorted_csv,
+        apply_delay=True,
+        delay_ms=None,
+        timestamp_column_name="tx_datetime",
+    )
+    output = tmp_path / "processed.parquet"
+    save_processed_dataset(df, str(output))
+
+    parquet = pd.read_parquet(output)
+    pd.testing.assert_frame_equal(parquet, df)
+    assert parquet["tx_datetime"].dtype.kind == "M"
+
+
+def test_chunked_writes_parquet_row_groups(unsorted_csv, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    output = tmp_path / "processed.parquet"
+    rows = preprocess_dataset_chunked(
+        dataset_path=str(unsorted_csv),
+        output_path=str(output),
+        start_datetime=START,
+        apply_delay=True,
+        delay_ms=None,
+        timestamp_column_name="tx_datetime",
+        chunksize=20,
+        tmp_dir=str(tmp_path),
+    )
+
+    assert rows == 50
+    assert pq.ParquetFile(output).num_row_groups > 1
+    df = pd.read_parquet(output)
+    assert df["id"].tolist() == list(range(50))
+    assert df["time_till_next_event_ms"].tolist() == [1500.0] * 49 + [0.0]
+
+
+def test_iter_file_lines_mmap(tmp_path):
+    path = tmp_path / "dataset.csv"
+    path.write_bytes(b"id,value\na,1\nb,2")
+
+    lines = [bytes(line) for line in iter_file_lines_mmap(str(path))]
+    assert lines == [b"id,value\n", b"a,1\n", b"b,2"]
+    assert [bytes(line) for line in iter_file_lines_mmap(str(path), 13)] == [b"b,2"]
+
+
+def test_iter_file_lines_mmap_empty_file(tmp_path):
+    path = tmp_path / "dataset.csv"
+    path.write_bytes(b"")
+
+    assert list(iter_file_lines_mmap(str(path))) == []
+
+
+def test_iter_file_lines_mmap_closed_early_with_a_line_held(tmp_path):
+    path = tmp_path / "dataset.csv"
+    path.write_bytes(b"id\na\nb\n")
+
+    lines = iter_file_lines_mmap(str(path))
+    header = next(lines)
+    lines.close()
+
+    assert bytes(header) == b"id\n"
+
+
+def test_iter_parquet_batches_reads_a_row_range(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "dataset.parquet"
+    pd.DataFrame({"id": range(10)}).to_parquet(path, index=False, row_group_size=3)
+
+    batches = iter_parquet_batches(str(path), batch_size=2, start_row=4, end_row=8)
+
+    assert [i for batch in batches for i in batch.column("id").to_pylist()] == [
+        4,
+        5,
+        6,
+        7,
+    ]
+
+
+@pytest.mark.parametrize(
+    "values, expected_unit",
+    [
+        ([1700000000, 1700000001], "s"),
+        ([1700000000000, 1700000001500], "ms"),
+        ([1700000000000000, 1700000001500000], "us"),
+        ([1700000000000000000], "ns"),
+    ],
+)
+def test_parse_timestamps_infers_epoch_units(values, expected_unit):
+    parsed = parse_timestamps(pd.Series(values))
+
+    assert infer_epoch_unit(pd.Series(values)) == expected_unit
+    assert parsed.iloc[0] == pd.Timestamp("2023-11-14 22:13:20")
+
+
+def test_parse_timestamps_with_an_epoch_format():
+    parsed = parse_timestamps(pd.Series(["1700000000500"]), "epoch_ms")
+
+    assert parsed.iloc[0] == pd.Timestamp("2023-11-14 22:13:20.500")
+
+
+def test_parse_timestamps_infers_the_format_and_parses_each_value_once():
+    values = pd.Series(
+        ["19/08/2024 15:00:01", None, "19/08/2024 15:00:01", "13/08/2024 09:30:00"],
+        index=[5, 6, 7, 8],
+    )
+
+    parsed = parse_timestamps(values)
+
+    assert infer_timestamp_format(values) == "%d/%m/%Y %H:%M:%S"
+    assert parsed.index.tolist() == [5, 6, 7, 8]
+    assert parsed.tolist()[:1] + parsed.tolist()[2:] == [
+        pd.Timestamp("2024-08-19 15:00:01"),
+        pd.Timestamp("2024-08-19 15:00:01"),
+        pd.Timestamp("2024-08-13 09:30:00"),
+    ]
+    assert pd.isna(parsed.iloc[1])
+
+
+def test_parse_timestamps_falls_back_past_the_sample():
+    values = pd.Series(
+        [f"19/08/2024 15:{i // 60:02d}:{i % 60:02d}" for i in range(1000)]
+        + ["2024-08-20 09:30:00"]
+    )
+
+    parsed = parse_timestamps(values)
+
+    assert parsed.iloc[0] == pd.Timestamp("2024-08-19 15:00:00")
+    assert parsed.iloc[-1] == pd.Timestamp("2024-08-20 09:30:00")
+
+
+def test_preprocess_dataset_with_epoch_timestamps(tmp_path):
+    path = tmp_path / "dataset.csv"
+    pd.DataFrame({"id": [1, 2], "ts": [1700000001000, 1700000000000]}).to_csv(
+        path, index=False
+    )
+
+    df = preprocess_dataset(str(path), START, True, None, "ts", "epoch_ms")
+
+    assert df["id"].tolist() == [2, 1]
+    assert df["time_till_next_event_ms"].tolist() == [1000, 0]
+
+
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_chunked_parquet_with_dtypes_changing_between_chunks(tmp_path, shuffle):
+    pytest.importorskip("pyarrow")
+    df = pd.DataFrame(
+        {
+            "ID": range(6),
+            "Tx_Datetime": pd.date_range(START, periods=6, freq="1s"),
+            "Code": ["1", "2", "3", "X4", "5", "6"],
+            "Amount": [1, 2, 3, 4.5, None, 6],
+        }
+    )
+    path = tmp_path / "dataset.csv"
+    (df.iloc[::-1] if shuffle else df).to_csv(path, index=False)
+    output = tmp_path / "processed.parquet"
+
+    rows = preprocess_dataset_chunked(
+        dataset_path=str(path),
+        output_path=str(output),
+        start_datetime=START,
+        apply_delay=True,
+        delay_ms=None,
+        timestamp_column_name="tx_datetime",
+        chunksize=3,
+        tmp_dir=str(tmp_path),
+    )
+
+    assert rows == 6
+    parquet = pd.read_parquet(output)
+    assert parquet["code"].tolist() == ["1", "2", "3", "X4", "5", "6"]
+    assert parquet["amount"].tolist()[:4] == [1.0, 2.0, 3.0, 4.5]
+
+
+def test_chunked_infers_the_timestamp_format_once(tmp_path, monkeypatch):
+    path = tmp_path / "dataset.csv"
+    # only the first chunk tells that the dates are day first
+    path.write_text(
+        "id,tx_datetime\n"
+        "1,13/01/2024 00:00:00\n"
+        "2,14/01/2024 00:00:00\n"
+        "3,01/02/2024 00:00:00\n"
+        "4,02/02/2024 00:00:00\n"
+    )
+    parsed = []
+    monkeypatch.setattr(
+        "aws_dataflow_simulator.utils_dataset.parse_timestamps",
+        lambda values, timestamp_format: parsed.append(timestamp_format)
+        or parse_timestamps(values, timestamp_format),
+    )
+
+    rows, chunked = run_chunked(
+        path,
+        tmp_path,
+        chunksize=2,
+        apply_delay=True,
+        delay_ms=None,
+        timestamp_column_name="tx_datetime",
+    )
+
+    assert rows == 4
+    # sorted input is parsed once, every chunk with the same format
+    assert parsed == ["%d/%m/%Y %H:%M:%S"] * 2
+    assert chunked["id"].tolist() == [1, 2, 3, 4]
+    assert pd.to_datetime(chunked["tx_datetime"]).dt.month.tolist() == [1, 1, 2, 2]
@@ -0,0 +1,132 @@
+import json
+import threading
+
+import boto3
+import pytest
+from moto import mock_aws
+
+STREAM = "test-stream"
+
+
+@pytest.fixture
+def utils_kinesis(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        from aws_dataflow_simulator import utils_kinesis
+
+        client = boto3.client("kinesis")
+        client.create_stream(StreamName=STREAM, ShardCount=3)
+        monkeypatch.setattr(utils_kinesis, "MIN_GET_INTERVAL_S", 0)
+        yield utils_kinesis
+
+
+def put_events(ids):
+    client = boto3.client("kinesis")
+    for i in ids:
+        client.put_record(
+            StreamName=STREAM, Data=json.dumps({"id": i}), PartitionKey=str(i)
+        )
+
+
+def consume(utils_kinesis, checkpoint_path=None, **kwargs):
+    received = []
+    lock = threading.Lock()
+
+    def process_records(shard_id, records):
+        with lock:
+            received.extend(json.loads(r["Data"])["id"] for r in records)
+
+    utils_kinesis.KinesisConsumer(
+        stream_name=STREAM,
+        process_records=process_records,
+        checkpoint_path=checkpoint_path,
+        stop_at_latest=True,
+        idle_sleep_s=0,
+        **kwargs,
+    ).run()
+    return received
+
+
+def test_consumer_reads_every_record_from_all_shards(utils_kinesis):
+    put_events(range(60))
+    assert sorted(consume(utils_kinesis)) == list(range(60))
+
+
+def test_consumer_resumes_from_checkpoint(utils_kinesis, tmp_path):
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    put_events(range(20))
+    assert sorted(consume(utils_kinesis, checkpoint_path)) == list(range(20))
+
+    with open(checkpoint_path) as file:
+        assert len(json.load(file)) == 3
+
+    put_events(range(20, 30))
+    assert sorted(consume(utils_kinesis, checkpoint_path)) == list(range(20, 30))
+
+
+def test_consumer_backs_off_when_throttled(utils_kinesis, monkeypatch):
+    put_events(range(5))
+    get_records = utils_kinesis.get_records
+    throttled = []
+
+    def flaky_get_records(shard_iterator, limit):
+        if not throttled:
+            throttled.append(True)
+            raise utils_kinesis.get_kinesis_client().exceptions.ProvisionedThroughputExceededException(
+                {"Error": {"Code": "ProvisionedThroughputExceededException"}},
+                "GetRecords",
+            )
+        return get_records(shard_iterator, limit)
+
+    monkeypatch.setattr(utils_kinesis, "get_records", flaky_get_records)
+    sleeps = []
+    monkeypatch.setattr(utils_kinesis.time, "sleep", sleeps.append)
+
+    assert sorted(consume(utils_kinesis)) == list(range(5))
+    assert throttled and sleeps
+
+
+def test_consumer_deaggregates_kpl_records(utils_kinesis):
+    from aws_dataflow_simulator.dataflow.aggregation import RecordAggregator
+
+    put_events(range(3))
+    aggregator = RecordAggregator()
+    for i in range(3, 10):
+        aggregator.add(json.dumps({"id": i}).encode(), str(i))
+    data, partition_key = aggregator.serialize()
+    boto3.client("kinesis").put_record(
+        StreamName=STREAM, Data=data, PartitionKey=partition_key
+    )
+
+    assert sorted(consume(utils_kinesis)) == list(range(10))
+
+
+def test_deaggregate_records_keeps_the_kinesis_fields(utils_kinesis):
+    from aws_dataflow_simulator.dataflow.aggregation import RecordAggregator
+
+    aggregator = RecordAggregator()
+    aggregator.add(b"1", "a")
+    aggregator.add(b"2", "b")
+    data, _ = aggregator.serialize()
+    records = [
+        {"SequenceNumber": "1", "Data": b"plain", "PartitionKey": "p"},
+        {"SequenceNumber": "2", "Data": data, "PartitionKey": "a"},
+    ]
+
+    assert utils_kinesis.deaggregate_records(records) == [
+        records[0],
+        {
+            "SequenceNumber": "2",
+            "Data": b"1",
+            "PartitionKey": "a",
+            "SubSequenceNumber": 0,
+        },
+        {
+            "SequenceNumber": "2",
+            "Data": b"2",
+            "PartitionKey": "b",
+            "SubSequenceNumber": 1,
+        },
+    ]
@@ -0,0 +1,101 @@
+import io
+import os
+
+import boto3
+import psycopg2
+import pytest
+from moto import mock_aws
+
+from aws_dataflow_simulator import utils_rds
+from aws_dataflow_simulator.utils_rds import (
+    _LinesReader,
+    parse_header,
+    upload_csv_to_rds,
+)
+
+BUCKET = "test-bucket"
+CSV = (
+    b"Id,Name,Event_DT\n"
+    b'1,"Smith, Anna",2024-01-01 00:00:00\n'
+    b'2,"multi\nline",2024-01-01 00:00:01\n'
+    b"3,,2024-01-01 00:00:02\n"
+)
+
+# integration tests need a PostgreSQL server, e.g. from `make postgres-start`
+POSTGRES_DSN = os.getenv("TEST_POSTGRES_DSN")
+requires_postgres = pytest.mark.skipif(
+    not POSTGRES_DSN, reason="TEST_POSTGRES_DSN is not set"
+)
+
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(Bucket=BUCKET)
+        s3_client.put_object(Bucket=BUCKET, Key="data.csv", Body=CSV)
+        yield s3_client
+
+
+@pytest.fixture
+def conn():
+    conn = psycopg2.connect(POSTGRES_DSN)
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS historic_table")
+    conn.commit()
+    yield conn
+    conn.rollback()
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS historic_table")
+    conn.commit()
+    conn.close()
+
+
+def fetch_rows(conn):
+    with conn.cursor() as cur:
+        cur.execute('SELECT id, name, event_dt FROM historic_table ORDER BY "id"')
+        return cur.fetchall()
+
+
+def test_lines_reader_reads_across_line_boundaries():
+    reader = io.BufferedReader(_LinesReader([b"ab\n", b"", b"cde\n"]), buffer_size=2)
+
+    assert reader.read(4) == b"ab\nc"
+    assert reader.read() == b"de\n"
+    assert reader.read() == b""
+
+
+def test_parse_header_lowercases_and_unquotes_columns():
+    assert parse_header(b'Id, "Event DT",Name\r\n') == ["id", "event dt", "name"]
+
+
+def test_upload_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        upload_csv_to_rds(BUCKET, "data.csv", method="bulk", conn=object())
+
+
+@requires_postgres
+@pytest.mark.parametrize("method", ["copy", "insert"])
+def test_upload_creates_table_from_header(s3_bucket, conn, method):
+    rows = upload_csv_to_rds(BUCKET, "data.csv", method=method, conn=conn)
+
+    assert rows == 3
+    assert fetch_rows(conn) == [
+        ("1", "Smith, Anna", "2024-01-01 00:00:00"),
+        ("2", "multi\nline", "2024-01-01 00:00:01"),
+        ("3", None, "2024-01-01 00:00:02"),
+    ]
+
+
+@requires_postgres
+def test_upload_falls_back_to_inserts_when_copy_fails(s3_bucket, conn, monkeypatch):
+    def failing_copy(cur, *args):
+        cur.execute("SELECT 1/0")
+
+    monkeypatch.setattr(utils_rds, "copy_lines", failing_copy)
+
+    assert upload_csv_to_rds(BUCKET, "data.csv", conn=conn) == 3
+    assert len(fetch_rows(conn)) == 3
@@ -0,0 +1,187 @@
+import io
+import os
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from aws_dataflow_simulator.utils_s3 import (
+    MANIFEST_SUFFIX,
+    MIN_PART_SIZE,
+    S3ObjectReader,
+    S3Transfer,
+    TransferProgress,
+    compute_etag,
+    get_part_size,
+    iter_file_lines_from_s3,
+    iter_lines,
+    iter_parquet_batches_from_s3,
+)
+
+BUCKET = "test-bucket"
+
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(Bucket=BUCKET)
+        yield s3_client
+
+
+def test_iter_lines_joins_lines_split_across_chunks():
+    chunks = [b"a,b\n1,", b"2\n3,4", b"\n", b"5,6"]
+    assert list(iter_lines(chunks)) == [b"a,b\n", b"1,2\n", b"3,4\n", b"5,6"]
+
+
+def test_iter_lines_keeps_crlf_endings():
+    assert list(iter_lines([b"a\r\nb\r", b"\n"])) == [b"a\r\n", b"b\r\n"]
+
+
+def test_iter_file_lines_from_s3_streams_in_chunks(s3_bucket):
+    body = b"".join(f"{i},value_{i}\n".encode() for i in range(1000))
+    s3_bucket.put_object(Bucket=BUCKET, Key="data.csv", Body=body)
+
+    lines = list(iter_file_lines_from_s3(BUCKET, "data.csv", chunk_size=7))
+
+    assert len(lines) == 1000
+    assert b"".join(lines) == body
+
+
+def test_iter_file_lines_from_s3_starts_at_byte_offset(s3_bucket):
+    s3_bucket.put_object(Bucket=BUCKET, Key="data.csv", Body=b"a,b\n1,2\n3,4\n")
+
+    lines = list(iter_file_lines_from_s3(BUCKET, "data.csv", start_byte=4))
+
+    assert lines == [b"1,2\n", b"3,4\n"]
+
+
+def test_s3_object_reader_seeks_with_ranged_reads(s3_bucket):
+    s3_bucket.put_object(Bucket=BUCKET, Key="data.bin", Body=b"0123456789")
+    reader = S3ObjectReader(BUCKET, "data.bin")
+
+    assert reader.read(3) == b"012"
+    reader.seek(-2, io.SEEK_END)
+    assert reader.read() == b"89"
+    reader.seek(4)
+    assert reader.read(100) == b"456789"
+    assert reader.read(1) == b""
+
+
+def test_iter_parquet_batches_from_s3(s3_bucket, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "data.parquet"
+    table = pa.table({"id": list(range(25)), "value": [i / 2 for i in range(25)]})
+    pq.write_table(table, path, row_group_size=10)
+    s3_bucket.upload_file(str(path), BUCKET, "data.parquet")
+
+    batches = [
+        batch.to_pylist()
+        for batch in iter_parquet_batches_from_s3(BUCKET, "data.parquet", batch_size=10)
+    ]
+
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert batches[2][-1] == {"id": 24, "value": 12.0}
+
+
+MiB = 1024 * 1024
+
+
+@pytest.fixture
+def large_file(tmp_path):
+    path = tmp_path / "large.bin"
+    path.write_bytes(os.urandom(11 * MiB))
+    return str(path)
+
+
+def test_get_part_size_stays_within_part_limit():
+    assert get_part_size(100 * MiB, part_size=MiB) == MIN_PART_SIZE
+    assert get_part_size(100_000 * MiB, part_size=MIN_PART_SIZE) == 10 * MiB
+
+
+def test_compute_etag_matches_s3(s3_bucket, large_file):
+    S3Transfer(part_size=5 * MiB).upload(large_file, BUCKET, "large.bin")
+    etag = s3_bucket.head_object(Bucket=BUCKET, Key="large.bin")["ETag"]
+
+    assert etag.strip('"') == compute_etag(large_file, part_size=5 * MiB)
+    assert etag.strip('"').endswith("-3")
+
+
+def test_upload_skips_unchanged_files(s3_bucket, large_file, tmp_path):
+    small_file = tmp_path / "small.csv"
+    small_file.write_bytes(b"a,b\n1,2\n")
+    transfer = S3Transfer(part_size=5 * MiB)
+
+    assert transfer.upload(str(small_file), BUCKET, "small.csv")
+    assert transfer.upload(large_file, BUCKET, "large.bin")
+    assert not transfer.upload(str(small_file), BUCKET, "small.csv")
+    # the part size of the existing upload is inferred from its ETag
+    assert not S3Transfer(part_size=8 * MiB).upload(large_file, BUCKET, "large.bin")
+    assert transfer.upload(large_file, BUCKET, "large.bin", force=True)
+
+    small_file.write_bytes(b"a,b\n1,3\n")
+    assert transfer.upload(str(small_file), BUCKET, "small.csv")
+
+
+def test_download_skips_unchanged_files(s3_bucket, tmp_path):
+    s3_bucket.put_object(Bucket=BUCKET, Key="data.csv", Body=b"a,b\n1,2\n")
+    path = str(tmp_path / "data.csv")
+    transfer = S3Transfer()
+
+    assert transfer.download(BUCKET, "data.csv", path)
+    assert open(path, "rb").read() == b"a,b\n1,2\n"
+    assert not transfer.download(BUCKET, "data.csv", path)
+
+
+def test_interrupted_upload_resumes_missing_parts(s3_bucket, large_file):
+    transfer = S3Transfer(part_size=5 * MiB, concurrency=1, s3_client=s3_bucket)
+    upload_part = s3_bucket.upload_part
+    sent_parts = []
+
+    def failing_upload_part(**kwargs):
+        if kwargs["PartNumber"] == 3:
+            raise ConnectionError("connection dropped")
+        sent_parts.append(kwargs["PartNumber"])
+        return upload_part(**kwargs)
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(s3_bucket, "upload_part", failing_upload_part)
+        with pytest.raises(ConnectionError):
+            transfer.upload(large_file, BUCKET, "large.bin")
+    assert os.path.isfile(large_file + MANIFEST_SUFFIX)
+
+    sent_parts.clear()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(
+            s3_bucket,
+            "upload_part",
+            lambda **kwargs: sent_parts.append(kwargs["PartNumber"])
+            or upload_part(**kwargs),
+        )
+        progress = TransferProgress(11 * MiB, "large.bin", stream=io.StringIO())
+        assert transfer.upload(large_file, BUCKET, "large.bin", progress=progress)
+
+    assert sent_parts == [3]
+    assert progress.skipped_bytes == 10 * MiB
+    assert progress.transferred_bytes == MiB
+    assert not os.path.exists(large_file + MANIFEST_SUFFIX)
+    body = s3_bucket.get_object(Bucket=BUCKET, Key="large.bin")["Body"].read()
+    assert body == open(large_file, "rb").read()
+
+
+def test_transfer_progress_reports_throughput():
+    now = [0.0]
+    stream = io.StringIO()
+    progress = TransferProgress(
+        10_000_000, "data.csv", stream=stream, clock=lambda: now[0]
+    )
+    progress.skip(4_000_000)
+    now[0] = 2.0
+    progress(2_000_000)
+    progress.close()
+
+    assert stream.getvalue().endswith("data.csv: 6.0/10.0 MB (60%) 1.0 MB/s\n")